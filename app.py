@@ -15,14 +15,19 @@
 
 import streamlit as st
 import datetime
-import pandas as pd
 import os
-import math
 import json
 
 import logic
 import data
-import pdf_gen
+import pdf_jobs
+import result_cache
+import quote_engine
+import quote_graph
+import scenario_sweep
+import parts_catalog
+import geo
+import telemetry
 
 st.set_page_config(page_title="AFP Field Service Estimator v2.9.3", layout="wide", page_icon="🛠️")
 
@@ -36,10 +41,23 @@ defaults = {
     'proj_name': "New Project", 'days': 5, 'tfas': 1, 'hrs': 10, 'flight_cost': 650.0, 
     'miles': 0.0, 't_hrs': 6.0, 'misc_exp': 0.0, 'cont_pct': 5.0, 'sow': "", 'assume': "", 
     'man_sub_days': 0, 'override_sub': False, 'sat': False, 'sun': False, 'status': "Draft",
-    'payment_terms': 30, 'validity': 30, 'disable_mbv': False
+    'payment_terms': 30, 'validity': 30, 'disable_mbv': False, 'diagnostics': telemetry.ENABLED,
+    'exp_markup_pct': 15.0, 'man_labor': 2.0
 }
 for k, v in defaults.items():
     if k not in st.session_state: st.session_state[k] = v
+TRAVEL_MODES = ["FLY", "DRIVE", "FLY then DRIVE"]
+PRICING_TIERS = ["Standard", "Preferred"]
+QUOTE_STATUSES = ["Draft", "Submitted", "Customer Approved", "Booked", "Lost"]
+REPO_PAGE_SIZE = 25
+CATALOG_RESULTS = 50
+PHASE_COLUMNS = {
+    "name": st.column_config.TextColumn("Crew / Phase"), "tfas": st.column_config.NumberColumn("TFAs", min_value=1, step=1),
+    "days": st.column_config.NumberColumn("Work Days", min_value=1, step=1), "hrs": st.column_config.NumberColumn("Hrs/Day", min_value=1, max_value=24),
+    "sat": st.column_config.CheckboxColumn("Sat?"), "sun": st.column_config.CheckboxColumn("Sun?"),
+    "mob_date": st.column_config.DateColumn("Mobilization"), "start_date": st.column_config.DateColumn("Onsite Start"), "return_date": st.column_config.DateColumn("Return (blank = auto)"),
+}
+telemetry.begin("rerun", st.session_state.diagnostics)  # Closed by the Diagnostics section at the end of the script
 
 def update_rates():
     if st.session_state.region_select == "INTERNATIONAL":
@@ -55,50 +73,138 @@ def recalc_dates():
             st.session_state.start_date, 
             st.session_state.days, 
             st.session_state.sat, 
-            st.session_state.sun
+            st.session_state.sun,
+            data.get_holidays()
         )
         st.session_state.return_date = st.session_state.start_date + datetime.timedelta(days=duration)
 
-DF_COMP, DF_LOC = data.load_client_db()
+def add_catalog_parts(skus, qty):
+    """Parts Catalog 'Add' callback: appends the selected SKUs to the editor rows (keeping edits, dropping the blank starter row)."""
+    rows = [p for p in st.session_state.get('parts_edited', st.session_state.parts_list) if str(p.get('Part #') or '').strip() or p.get('Description') or (p.get('Cost') or 0) > 0]
+    st.session_state.parts_list = rows + [parts_catalog.editor_row(sku, qty) for sku in skus]
+    st.session_state.catalog_adds = st.session_state.get('catalog_adds', 0) + 1   # New results widget: clears the selection
+
+def phase_frame(phases):
+    """Saved phases (ISO date strings) -> typed editor frame."""
+    df = pd.DataFrame(phases, columns=list(quote_engine.QuoteInputs.PHASE_FIELDS)).astype({"name": object, "tfas": float, "days": float, "hrs": float})
+    for k in ("sat", "sun"): df[k] = df[k].fillna(False).astype(bool)
+    for k in quote_engine.QuoteInputs.DATE_FIELDS: df[k] = pd.to_datetime(df[k], errors='coerce').dt.date
+    return df
+
+def apply_scenario(cfg):
+    """Copies a What-If row into the Schedule inputs (runs as a callback, before widgets are drawn)."""
+    st.session_state.tfas, st.session_state.hrs, st.session_state.days = cfg['tfas'], cfg['hrs'], cfg['days']
+    st.session_state.sat, st.session_state.sun = scenario_sweep.WEEKEND_OPTIONS[cfg['weekend']]
+    recalc_dates()
+
+def apply_saved_quote(saved):
+    """Copies a saved quote (JSON file or repository record) into session state / the widgets' keys."""
+    for key, value in saved.items():
+        if key in quote_engine.QuoteInputs.DATE_FIELDS:
+            if value and value != "None": st.session_state[key] = datetime.datetime.strptime(value, "%Y-%m-%d").date()
+        elif key == 'result': continue  # Quoted figures, kept for re-quote reports (requote.py)
+        elif key == 'region': st.session_state['region_select'] = value
+        elif key == 'mode':
+            if value in TRAVEL_MODES: st.session_state['mode_select'] = value
+        elif key == 'is_parts_only': st.session_state['quote_type'] = "Parts Only" if value else "Service & Parts"
+        elif key == 'tier':
+            if value in PRICING_TIERS: st.session_state['tier_select'] = value
+        elif key == 'client':   # Customer / Location pickers (kept only if the directory still lists them)
+            st.session_state['client_search'] = ""
+            st.session_state['sel_client'] = (value or {}).get('Company') or "Select Client..."; st.session_state['sel_site'] = (value or {}).get('Site') or "Select Site..."
+        elif key == 'site': st.session_state['site_manual'] = value if value != (saved.get('client') or {}).get('Site') else ""
+        elif key == 'city':
+            country = (saved.get('loc_rates') or {}).get('country')
+            st.session_state['intl_city'] = f"{value} ({country})" if value and country else None
+        else: st.session_state[key] = value
+    st.session_state['rt_cap_default'] = 45 if saved.get('is_key_account') else 40   # Loaded OT threshold is not reset by the key-account default
+
+def load_stored_quote(quote_id):
+    """Repository 'Load' callback: restores the quote and makes later saves update it."""
+    saved = STORE.get(quote_id)
+    if saved is None: return
+    apply_saved_quote(saved); st.session_state.store_id = quote_id
+
+def request_pdf():
+    """Preview 'Prepare PDF' callback: queues the last calculated quote on the background PDF pool (memoized)."""
+    last = st.session_state.get('last_quote')
+    if last: pdf_jobs.submit(*last['pdf_args'])
+
+def pdf_panel(last_quote, pending=False):
+    """Preview PDF controls. While a render is pending this runs as a fragment re-checked every second, so no rerun waits on the render."""
+    RESULTS = data.get_result_cache()
+    pdf_bytes = (RESULTS.get(last_quote['result_key']) or {}).get('pdf')
+    pdf_job = pdf_jobs.job(last_quote['pdf_key']) if pdf_bytes is None else None
+    if pending and (pdf_job is None or pdf_job.done()): st.rerun()   # Finished: one full rerun redraws the page without polling
+    if pdf_bytes is None and pdf_job is None: st.button("📄 Prepare PDF", on_click=request_pdf)
+    elif pdf_bytes is None and not pdf_job.done(): st.info("⏳ Rendering PDF... the rest of the page stays usable.")
+    elif pdf_bytes is None:
+        try:
+            pdf_bytes = pdf_job.result(); RESULTS.attach_pdf(last_quote['result_key'], pdf_bytes)
+        except Exception as e:
+            st.error(f"PDF Error: {e}"); st.button("🔁 Retry PDF", on_click=request_pdf)
+    if pdf_bytes is not None: st.download_button("💾 Download PDF", data=pdf_bytes, file_name=f"{last_quote['proj_name']}_v2.9.3.pdf", mime="application/pdf")
+
+def apply_travel_plan(plan):
+    """Switches Travel to the suggested mode; DRIVE also takes the billable miles."""
+    st.session_state.mode_select = plan['suggest']
+    if plan['suggest'] == "DRIVE": st.session_state.miles = plan['miles']
 
 # --- SIDEBAR ---
-st.sidebar.header("⚙️ Estimator v2.9.3")
+st.sidebar.header("⚙️ Estimator v2.9.3")  # Drawn before any data loads (first paint)
+CLIENTS = data.get_client_directory()
+GEO = data.get_geo_index()
+STORE = data.get_quote_store()
 uploaded_file = st.sidebar.file_uploader("📂 Load Saved Quote (JSON)", type=["json"])
 if uploaded_file is not None:
     try:
-        data_json = json.load(uploaded_file)
-        for key, value in data_json.items():
-            if key in ['mob_date', 'start_date', 'return_date']: st.session_state[key] = datetime.datetime.strptime(value, "%Y-%m-%d").date()
-            else: st.session_state[key] = value
+        apply_saved_quote(json.load(uploaded_file))
         st.sidebar.success("✅ Quote Loaded!")
     except Exception as e: st.sidebar.error(f"Error loading file: {e}")
 
+if STORE is not None:
+    with st.sidebar.expander("🗄️ Quote Repository"):
+        repo_text = st.text_input("Search", placeholder="Project, client or site", key='repo_text')
+        repo_status = st.multiselect("Status", QUOTE_STATUSES, key='repo_status')
+        repo_filter = {'text': repo_text.strip() or None, 'status': repo_status or None}
+        repo_total = STORE.count(**repo_filter)
+        repo_pages = max(1, -(-repo_total // REPO_PAGE_SIZE))
+        repo_page = st.number_input(f"Page (of {repo_pages})", min_value=1, max_value=repo_pages, value=1) if repo_pages > 1 else 1
+        repo_rows = STORE.search(limit=REPO_PAGE_SIZE, offset=(repo_page - 1) * REPO_PAGE_SIZE, **repo_filter)
+        st.caption(f"{repo_total:,} saved quote{'s' if repo_total != 1 else ''}")
+        if repo_rows:
+            r = st.selectbox("Quote", repo_rows, format_func=lambda r: f"#{r['id']} {r['proj_name']} | {r['company'] or '-'} | {r['status']} | ${r['grand_total']:,.0f}")
+            st.caption(f"{r['site'] or '-'} · {r['region']} · Mob {r['mob_date'] or 'N/A'} · Saved {r['updated_at'].replace('T', ' ')}")
+            st.button("📂 Load Quote", on_click=load_stored_quote, args=(r['id'],), use_container_width=True)
+
 st.sidebar.markdown("---")
-sel_status = st.sidebar.selectbox("Quote Status", ["Draft", "Submitted", "Customer Approved", "Booked", "Lost"], key="status")
+sel_status = st.sidebar.selectbox("Quote Status", QUOTE_STATUSES, key="status")
 
 st.sidebar.subheader("Client")
 sel_site_data = {"Company": "", "Site": "", "Street": "", "City": "", "State": "", "Zip": ""}
 is_key_account = False
 tier_selection = "Standard"
 
-if not DF_COMP.empty:
-    client_list = ["Select Client..."] + sorted(DF_COMP['company_name'].unique().tolist())
-    sel_client = st.sidebar.selectbox("Customer", client_list)
+if len(CLIENTS):
+    client_query = st.sidebar.text_input("🔎 Find Client / Site", placeholder="Type a name...", key='client_search')
+    client_list = ["Select Client..."] + (CLIENTS.search_companies(client_query) if client_query else CLIENTS.companies)
+    if st.session_state.get('sel_client') not in client_list: st.session_state.pop('sel_client', None)
+    sel_client = st.sidebar.selectbox("Customer", client_list, key='sel_client')
     if sel_client != "Select Client...":
         sel_site_data['Company'] = sel_client
         if "Mitsubishi Power Aero" in sel_client or "Mitsubishi Power Americas" in sel_client:
             is_key_account = True; tier_selection = "Key Account (AERO/MPWA)"; st.sidebar.success("🔑 Key Account Detected")
-        locs = DF_LOC[DF_LOC['company_name'] == sel_client]
-        site_list = ["Select Site..."] + sorted(locs['site_name'].unique().tolist())
-        sel_site = st.sidebar.selectbox("Location", site_list)
+        site_list = ["Select Site..."] + CLIENTS.sites(sel_client)
+        if st.session_state.get('sel_site') not in site_list: st.session_state.pop('sel_site', None)
+        sel_site = st.sidebar.selectbox("Location", site_list, key='sel_site')
         if sel_site != "Select Site...":
-            r = locs[locs['site_name'] == sel_site].iloc[0]
-            sel_site_data.update({"Site": sel_site, "Street": r['street'], "City": r['city'], "State": r['state'], "Zip": str(r['zip']).replace('.0','')})
+            r = CLIENTS.site_record(sel_client, sel_site)
+            sel_site_data.update({"Site": sel_site, "Street": r['Street'], "City": r['City'], "State": r['State'], "Zip": r['Zip']})
 
 st.sidebar.markdown("---")
-quote_type = st.sidebar.radio("Quote Type", ["Service & Parts", "Parts Only"])
+quote_type = st.sidebar.radio("Quote Type", ["Service & Parts", "Parts Only"], key='quote_type')
 is_parts_only = (quote_type == "Parts Only")
-if not is_key_account: tier_selection = st.sidebar.select_slider("Pricing Tier", options=["Standard", "Preferred"], value="Standard")
+if not is_key_account: tier_selection = st.sidebar.select_slider("Pricing Tier", options=PRICING_TIERS, key='tier_select')
 
 if not is_parts_only:
     st.sidebar.markdown("---"); st.sidebar.subheader("Labor & Markup")
@@ -107,9 +213,11 @@ if not is_parts_only:
     rate_ot = c2.number_input("OT ($/hr)", key='rate_ot')
     rate_dt = c1.number_input("DT ($/hr)", key='rate_dt')
     rate_tr = c2.number_input("Trv ($/hr)", key='rate_tr')
-    rt_cap = st.sidebar.number_input("OT Threshold", value=45 if is_key_account else 40)
-    exp_markup_pct = st.sidebar.number_input("Exp Markup %", value=15.0, step=0.5)
-    EXP_MARKUP = (exp_markup_pct / 100.0) + 1.0
+    rt_cap_default = 45 if is_key_account else 40
+    if st.session_state.get('rt_cap_default') != rt_cap_default or 'rt_cap' not in st.session_state:   # Key-account switch resets the threshold
+        st.session_state.rt_cap = rt_cap_default; st.session_state.rt_cap_default = rt_cap_default
+    rt_cap = st.sidebar.number_input("OT Threshold", key='rt_cap')
+    exp_markup_pct = st.sidebar.number_input("Exp Markup %", step=0.5, key='exp_markup_pct')
 
 # --- COMMERCIAL TERMS & MBV ---
 st.sidebar.markdown("---")
@@ -118,63 +226,87 @@ c_term1, c_term2 = st.sidebar.columns(2)
 payment_terms = c_term1.number_input("Net Terms (Days)", value=30, key='payment_terms')
 validity_days = c_term2.number_input("Validity (Days)", value=30, key='validity')
 disable_mbv = st.sidebar.checkbox("Disable Min Billing Guardrail?", value=False, key='disable_mbv')
+st.sidebar.markdown("---")
+st.sidebar.checkbox("🩺 Diagnostics", key='diagnostics', help="Time each stage of this page and Calculate Quote (also logged to logs/telemetry.jsonl).")
 
 # --- TABS ---
+import pandas as pd  # Deferred so the sidebar draws before pandas loads (cold start)
 if is_parts_only:
     tabs = st.tabs(["📍 Project", "📦 Parts Engine", "📝 Notes", "🔍 Preview", "💾 Text/JSON"])
     t_proj, t_parts, t_notes, t_prev, t_text = tabs[0], tabs[1], tabs[2], tabs[3], tabs[4]
 else:
-    tabs = st.tabs(["📍 Project", "✈️ Travel", "👷 Schedule", "📦 Parts", "📝 Notes", "🔍 Preview", "💾 Text/JSON"])
-    t_proj, t_travel, t_sched, t_parts, t_notes, t_prev, t_text = tabs[0], tabs[1], tabs[2], tabs[3], tabs[4], tabs[5], tabs[6]
+    tabs = st.tabs(["📍 Project", "✈️ Travel", "👷 Schedule", "🧮 What-If", "📦 Parts", "📝 Notes", "🔍 Preview", "💾 Text/JSON"])
+    t_proj, t_travel, t_sched, t_sweep, t_parts, t_notes, t_prev, t_text = tabs[0], tabs[1], tabs[2], tabs[3], tabs[4], tabs[5], tabs[6], tabs[7]
 
 # --- VARIABLES ---
-mob_date = None; return_date = None; flight_cost = 0.0; miles = 0.0; t_hrs = 0.0; man_labor = 0.0; is_commuter = False
+mob_date = None; return_date = None; trip_rates = None; phases = []; phase_notes = None; flight_cost = 0.0; miles = 0.0; t_hrs = 0.0; man_labor = 0.0; is_commuter = False
+zip_code = ""; country = ""; intl_city = ""
 
 # --- TAB LOGIC ---
 with t_proj:
     c1, c2 = st.columns(2)
     proj_name = c1.text_input("Project Name", key='proj_name')
     region = c1.radio("Region", ["DOMESTIC", "INTERNATIONAL"], horizontal=True, key='region_select', on_change=update_rates)
-    site_manual = c2.text_input("Manual Site Name", value=sel_site_data['Site'])
+    site_manual = c2.text_input("Manual Site Name", placeholder=sel_site_data['Site'] or None, key='site_manual')
     final_site = site_manual if site_manual else sel_site_data['Site']
     
     if not is_parts_only:
+        travel_date = st.session_state.get('mob_date') or st.session_state.get('start_date', datetime.date.today())
+        trip_end = st.session_state.get('return_date')  # Rates are averaged day by day over Mobilization..Return (seasons included)
+        trip_rates = None  # (calendar, key) while the looked-up rate is in use: What-If reprices each trip's own dates
+        rate_note = lambda r: f" · avg over {(trip_end - travel_date).days + 1}-day trip" if r.get('seasonal') else ""
         if region == "DOMESTIC":
-            zip_code = c1.text_input("Zip Code", value=sel_site_data['Zip'])
+            zip_code = c1.text_input("Zip Code", placeholder=sel_site_data['Zip'] or None, key='zip_code') or sel_site_data['Zip']
             if zip_code:
-                res = data.get_domestic_rate(zip_code, datetime.date.today())
-                if res: st.success(f"✅ GSA: {res['city']} (${res['lodging']})"); st.session_state.loc_rates = res
+                res = data.get_domestic_rate(zip_code, travel_date, trip_end)
+                if res: st.success(f"✅ GSA: {res['city']} (${res['lodging']}{rate_note(res)})"); st.session_state.loc_rates = res; trip_rates = data.trip_rate_calendar(zip_code=zip_code)
         else:
-            country = c1.text_input("Country")
+            country = c1.text_input("Country", key='country')
             if country:
                 opts = data.get_international_options(country)
                 if opts:
-                    c_str = st.selectbox("City", [f"{x['Location']} ({x['Country']})" for x in opts])
+                    cities = [f"{x['Location']} ({x['Country']})" for x in opts]
+                    if st.session_state.get('intl_city') not in cities: st.session_state.pop('intl_city', None)
+                    c_str = st.selectbox("City", cities, key='intl_city')
                     if c_str:
-                        res = data.get_international_rate(c_str.split(" (")[1][:-1], c_str.split(" (")[0])
-                        if res: st.success(f"✅ State: {res['city']} (${res['lodging']})"); st.session_state.loc_rates = res
+                        intl_city = c_str.split(" (")[0]
+                        res = data.get_international_rate(c_str.split(" (")[1][:-1], intl_city, travel_date, trip_end)
+                        if res: st.success(f"✅ State: {res['city']} (${res['lodging']}{rate_note(res)})"); st.session_state.loc_rates = res; trip_rates = data.trip_rate_calendar(country=res.get('country'), city=intl_city)
         
         with st.expander("Override Rates"):
             c1, c2 = st.columns(2)
             st.session_state.loc_rates['lodging'] = c1.number_input("Lodging", value=float(st.session_state.loc_rates.get('lodging', 150.0)))
             st.session_state.loc_rates['mie'] = c2.number_input("M&I", value=float(st.session_state.loc_rates.get('mie', 64.0)))
+        if trip_rates and (st.session_state.loc_rates['lodging'], st.session_state.loc_rates['mie']) != (res['lodging'], res['mie']): trip_rates = None  # Overridden
 
 if not is_parts_only:
     with t_travel:
-        mode = st.radio("Mode", ["FLY", "DRIVE", "FLY then DRIVE"], horizontal=True, key='mode_select')
+        site_plan = GEO.plan(zip_code) if region == "DOMESTIC" and zip_code else None
+        if site_plan:
+            c1, c2 = st.columns([3, 1])
+            c1.info(f"📍 Nearest office: **{site_plan['office']}** · {site_plan['miles']:,.0f} billable mi ({site_plan['drive_hours']:.1f} hrs drive) → Suggest **{site_plan['suggest']}**")
+            c2.button(f"Use {site_plan['suggest']}", on_click=apply_travel_plan, args=(site_plan,))
+        mode = st.radio("Mode", TRAVEL_MODES, horizontal=True, key='mode_select')
         if mode == "FLY": 
             flight_cost = st.number_input("Flight Cost", key='flight_cost'); t_hrs = st.number_input("One-Way Hours", key='t_hrs'); miles = 0.0
         elif mode == "FLY then DRIVE":
             c1, c2 = st.columns(2); flight_cost = c1.number_input("Flight Cost", key='flight_cost'); t_hrs = c2.number_input("Total One-Way Hours (Flight+Drive)", key='t_hrs'); miles = st.number_input("Rental Drive Miles (Round Trip)", key='miles') 
         else:
-            c1, c2 = st.columns(2); gps = c1.text_input("GPS (Lat,Lon)", "41.25, -95.93")
+            c1, c2 = st.columns(2); gps = c1.text_input("GPS (Lat,Lon)", f"{site_plan['lat']:.4f}, {site_plan['lon']:.4f}" if site_plan else "41.25, -95.93")
             try: 
                 lat, lon = map(float, gps.split(","))
-                c2.info(f"Calc: {int(logic.haversine(41.209, -96.065, lat, lon)*1.3*1.15)} mi")
+                office, crow = GEO.nearest_office(lat, lon)
+                c2.info(f"Calc: {int(geo.billable_miles(crow))} mi from {office}")
             except: pass
             miles = st.number_input("Billable Miles", key='miles'); t_hrs = miles / 50.0; flight_cost = 0.0
         
-        if miles > 0 and miles < 50: is_commuter = True; st.warning("ℹ️ **Commuter Rule Active (<50mi):** Lodging=$0, M&I=50%"); man_labor = st.number_input("Actual Drive Time (Total)", 2.0)
+        if site_plan and len(GEO.site_tree):
+            with st.expander("🗺️ Nearby Client Sites (150 mi)"):
+                near = GEO.nearby_sites(site_plan['lat'], site_plan['lon'], 150.0)
+                if near: st.dataframe(pd.DataFrame(near, columns=["Company", "Site", "Miles"]).style.format({"Miles": "{:,.0f}"}), use_container_width=True)
+                else: st.caption("No other geocoded sites within 150 miles.")
+        
+        if miles > 0 and miles < 50: is_commuter = True; st.warning("ℹ️ **Commuter Rule Active (<50mi):** Lodging=$0, M&I=50%"); man_labor = st.number_input("Actual Drive Time (Total)", key='man_labor')
 
     with t_sched:
         c1, c2, c3 = st.columns(3)
@@ -185,8 +317,8 @@ if not is_parts_only:
         sun = st.checkbox("Sun?", key='sun', on_change=recalc_dates)
         
         st.markdown("---"); st.markdown("### 📅 Trip Schedule"); c_d1, c_d2, c_d3 = st.columns(3)
-        def_mob = st.session_state.get('mob_date', datetime.date.today())
-        mob_date = c_d1.date_input("Mobilization Date", def_mob)
+        if 'mob_date' not in st.session_state: st.session_state.mob_date = datetime.date.today()
+        mob_date = c_d1.date_input("Mobilization Date", key='mob_date')
         
         def_start = mob_date + datetime.timedelta(days=1)
         if 'start_date' in st.session_state: def_start = st.session_state.start_date
@@ -200,9 +332,28 @@ if not is_parts_only:
         st.info(f"🗓️ Total Trip Duration: **{trip_days} Days**"); override_sub = st.checkbox("Override Subsistence Count?", key='override_sub'); man_sub_days = 0
         if override_sub: man_sub_days = st.number_input("Manual Subsistence Days", key='man_sub_days')
 
+        st.markdown("### 👥 Additional Crews / Phases")
+        st.caption("Each row is another crew with its own size, hours, weekends and trip; all crews roll up into the same labor, travel, lodging and subsistence lines (and MBV). The crew above is the Main Crew.")
+        if 'phases' not in st.session_state: st.session_state.phases = []
+        phases = st.data_editor(phase_frame(st.session_state.phases), num_rows="dynamic", use_container_width=True, hide_index=True, column_config=PHASE_COLUMNS).to_dict('records')
+        phase_notes = st.container()
+
 with t_parts:
     if 'parts_list' not in st.session_state: st.session_state.parts_list = [{"Part #": "", "Description": "", "Qty": 1, "Cost": 0.0, "Lead Time": "2-4 Weeks"}]
-    edited_parts = st.data_editor(pd.DataFrame(st.session_state.parts_list), num_rows="dynamic", use_container_width=True, column_config={"Lead Time": st.column_config.SelectboxColumn(options=["Stock", "2-4 Weeks", "6-8 Weeks"])})
+    CATALOG = data.get_parts_catalog(); n_skus = CATALOG.count() if CATALOG is not None else 0
+    if n_skus:
+        with st.expander(f"🔎 Parts Catalog ({n_skus:,} SKUs)"):
+            c1, c2 = st.columns([4, 1])
+            cat_text = c1.text_input("Search", placeholder="Part # prefix, or words from the part # / description", key='catalog_text')
+            cat_qty = c2.number_input("Qty", min_value=1, value=1, key='catalog_qty')
+            hits = data.search_parts_catalog(cat_text.strip(), CATALOG_RESULTS) if cat_text.strip() else []
+            if hits:
+                picked = st.dataframe(pd.DataFrame(hits, columns=parts_catalog.RESULT_COLUMNS).rename(columns={"part_no": "Part #", "description": "Description", "cost": "Cost", "lead_time": "Lead Time", "vendor": "Vendor"}),
+                                      on_select="rerun", selection_mode="multi-row", hide_index=True, use_container_width=True, key=f"catalog_hits_{st.session_state.get('catalog_adds', 0)}").selection.rows
+                st.button(f"➕ Add {len(picked)} selected part{'s' if len(picked) != 1 else ''}", disabled=not picked, on_click=add_catalog_parts, args=([hits[i] for i in picked], int(cat_qty)))
+            elif cat_text.strip(): st.caption("No matching SKUs.")
+    edited_parts = st.data_editor(pd.DataFrame(st.session_state.parts_list), num_rows="dynamic", use_container_width=True, column_config={"Lead Time": st.column_config.SelectboxColumn(options=list(parts_catalog.LEAD_TIMES))})
+    st.session_state.parts_edited = edited_parts.to_dict('records')  # Current editor rows, for add_catalog_parts
     misc_exp = st.number_input("Misc Expenses", key='misc_exp') if not is_parts_only else 0.0
     val_cont = st.session_state.get('cont_pct', 5.0)
     cont_pct = st.number_input("Contingency %", min_value=0.0, max_value=100.0, step=0.5, key='cont_pct') / 100.0 if not is_parts_only else 0.0
@@ -210,36 +361,21 @@ with t_parts:
 with t_notes:
     st.markdown("### 📋 Load Terms & Conditions")
     c_t1, c_t2 = st.columns([3, 1])
-    term_dict = data.get_term_templates()
-    sel_term = c_t1.selectbox("Select Template", ["Choose..."] + list(term_dict.keys()), label_visibility="collapsed")
+    templates = data.get_template_registry()
+    if templates.error: c_t1.error(templates.error)
+    sel_term = c_t1.selectbox("Select Template", ["Choose..."] + templates.names(), label_visibility="collapsed")
+    tmpl = templates.get(sel_term)
+    if tmpl and tmpl.error: c_t1.error(f"Template Error: {tmpl.error}")
+    elif tmpl and tmpl.missing: c_t1.warning(f"Template Error: Unknown placeholder(s) {', '.join(tmpl.missing)}")
     
     if c_t2.button("📥 Apply"):
-        if sel_term != "Choose...":
-            raw_tmpl = term_dict[sel_term]
-            
+        if tmpl:
             # --- DYNAMIC INJECTION LOGIC ---
-            ctx = {
-                'rate_rt': st.session_state.rate_rt,
-                'rate_ot': st.session_state.rate_ot,
-                'rate_dt': st.session_state.rate_dt,
-                'rate_rt_night': st.session_state.rate_rt * 1.2,
-                
-                # Minimum Billing Values
-                'mbv_domestic': st.session_state.rate_rt * 50,   
-                'mbv_intl': 160.00 * 100,                        
-                
-                # International equivalents
-                'rate_rt_intl': 160.00,
-                'rate_ot_intl': 240.00,
-                'rate_dt_intl': 320.00,
-                'rate_nt_intl': 192.00,
-                
-                'payment_terms': st.session_state.payment_terms,
-                'validity': st.session_state.validity
-            }
+            ctx = logic.build_template_context(st.session_state.rate_rt, st.session_state.rate_ot, st.session_state.rate_dt,
+                                               st.session_state.payment_terms, st.session_state.validity)
             
             try:
-                final_text = raw_tmpl.format(**ctx)
+                final_text = tmpl.fill(ctx)
                 st.session_state.assume = final_text
                 st.success("Template Applied with Live Rates!")
                 st.rerun()
@@ -251,91 +387,115 @@ with t_notes:
     sow = st.text_area("Scope of Work", help="Supports **bold** and - bullets", key='sow')
     assume = st.text_area("Assumptions / T&Cs", key='assume', height=400)
 
-if st.button("🚀 Calculate Quote", type="primary"):
-    svc_lines = []; part_lines_pdf = []; calc_log = []
-    
-    user_inputs = {'status': sel_status, 'proj_name': proj_name, 'is_parts_only': is_parts_only, 'mode': mode if not is_parts_only else "N/A", 'tfas': tfas if not is_parts_only else 0, 'days': days if not is_parts_only else 0, 'hrs': hrs if not is_parts_only else 0, 'sat': sat if not is_parts_only else False, 'sun': sun if not is_parts_only else False, 'flight_cost': flight_cost, 'miles': miles, 't_hrs': t_hrs, 'override_sub': override_sub if not is_parts_only else False, 'man_sub_days': man_sub_days if not is_parts_only else 0, 'cont_pct': cont_pct * 100 if not is_parts_only else 0, 'misc_exp': misc_exp, 'sow': sow, 'assume': assume, 'mob_date': str(mob_date), 'start_date': str(start_date), 'return_date': str(return_date), 'payment_terms': payment_terms, 'validity': validity_days, 'disable_mbv': disable_mbv}
+svc = not is_parts_only
+inputs = quote_engine.QuoteInputs(
+    status=sel_status, proj_name=proj_name, is_parts_only=is_parts_only, region=region, site=final_site, client=dict(sel_site_data),
+    zip_code=zip_code, country=country, city=intl_city,
+    mode=mode if svc else "N/A", flight_cost=flight_cost, miles=miles, t_hrs=t_hrs, man_labor=man_labor,
+    tfas=tfas if svc else 0, days=days if svc else 0, hrs=hrs if svc else 0, sat=sat if svc else False, sun=sun if svc else False,
+    mob_date=mob_date, start_date=start_date if svc else None, return_date=return_date,
+    override_sub=override_sub if svc else False, man_sub_days=man_sub_days if svc else 0, phases=phases if svc else [],
+    cont_pct=cont_pct * 100 if svc else 0, misc_exp=misc_exp, payment_terms=payment_terms, validity=validity_days, disable_mbv=disable_mbv,
+    sow=sow, assume=assume,
+    rate_rt=st.session_state.rate_rt, rate_ot=st.session_state.rate_ot, rate_dt=st.session_state.rate_dt, rate_tr=st.session_state.rate_tr,
+    rt_cap=rt_cap if svc else 40, exp_markup_pct=exp_markup_pct if svc else 15.0, loc_rates=dict(st.session_state.loc_rates),
+    tier=tier_selection, is_key_account=is_key_account, parts_list=edited_parts.to_dict('records'))
 
-    rates_snap = {}
-    if not is_parts_only:
-        rates_snap = {'rt': st.session_state.rate_rt, 'ot': st.session_state.rate_ot, 'dt': st.session_state.rate_dt, 'tr': st.session_state.rate_tr, 'cap': rt_cap}
-        labor_bk, sub_days = logic.simulate_schedule(start_date, days, hrs, sat, sun, {'cap_rt_weekly': rt_cap}, is_key_account)
-        calc_log.append(f"Schedule Logic: {days} Work Days, {hrs} Hrs/Day (Sat={sat}, Sun={sun}) -> RT:{labor_bk['RT']}, OT:{labor_bk['OT']}, DT:{labor_bk['DT']}")
-        
-        if is_commuter: t_bill_leg = man_labor / 2.0; calc_log.append(f"Travel (Commuter): Manual Override {man_labor} hours total.")
-        else: t_bill_leg = logic.calculate_travel_billable(t_hrs); calc_log.append(f"Travel (Standard): {t_hrs} hrs one-way -> {t_bill_leg} hrs billable per leg (Min 8, Round up 2).")
-        t_bill_total = t_bill_leg * 2.0
-        
-        l_tr_tot = t_bill_total * tfas * rates_snap['tr']; svc_lines.append({"Description": "TFA Labor - Travel", "Qty": t_bill_total * tfas, "Rate": rates_snap['tr'], "Total": l_tr_tot}); calc_log.append(f"Labor Travel: {tfas} TFAs * {t_bill_total} hrs * ${rates_snap['tr']} = ${l_tr_tot}")
-        if labor_bk['RT']: l_rt_tot = labor_bk['RT']*tfas*rates_snap['rt']; svc_lines.append({"Description": "Labor - Onsite (RT)", "Qty": labor_bk['RT']*tfas, "Rate": rates_snap['rt'], "Total": l_rt_tot}); calc_log.append(f"Labor RT: {tfas} TFAs * {labor_bk['RT']} hrs * ${rates_snap['rt']} = ${l_rt_tot}")
-        if labor_bk['OT']: l_ot_tot = labor_bk['OT']*tfas*rates_snap['ot']; svc_lines.append({"Description": "Labor - Onsite (OT)", "Qty": labor_bk['OT']*tfas, "Rate": rates_snap['ot'], "Total": l_ot_tot}); calc_log.append(f"Labor OT: {tfas} TFAs * {labor_bk['OT']} hrs * ${rates_snap['ot']} = ${l_ot_tot}")
-        if labor_bk['DT']: l_dt_tot = labor_bk['DT']*tfas*rates_snap['dt']; svc_lines.append({"Description": "Labor - Onsite (DT)", "Qty": labor_bk['DT']*tfas, "Rate": rates_snap['dt'], "Total": l_dt_tot})
-        
-        # --- NEW: MINIMUM BILLING VALUE (MBV) GUARDRAIL ---
-        if not disable_mbv:
-            # 1. Define Target
-            if region == "INTERNATIONAL":
-                mbv_target = 160.00 * 100.0
-            else:
-                mbv_target = rates_snap['rt'] * 50.0
-            
-            # 2. Calculate Current Labor (Travel + RT/OT/DT)
-            current_labor_value = 0.0
-            for line in svc_lines:
-                if "Labor" in line['Description']:
-                    current_labor_value += line['Total']
-            
-            # 3. Check and Adjust
-            if current_labor_value < mbv_target:
-                shortfall = mbv_target - current_labor_value
-                svc_lines.append({
-                    "Description": f"Minimum Billing Adjustment (Target ${mbv_target:,.2f})", 
-                    "Qty": 1, 
-                    "Rate": shortfall, 
-                    "Total": shortfall
-                })
-                calc_log.append(f"MBV Guardrail: Labor ${current_labor_value:,.2f} < Target ${mbv_target:,.2f}. Added Adjustment: ${shortfall:,.2f}")
-            else:
-                calc_log.append(f"MBV Guardrail: Labor ${current_labor_value:,.2f} meets Target ${mbv_target:,.2f}. No adjustment.")
-        else:
-            calc_log.append("MBV Guardrail: Disabled by user.")
-        # --------------------------------------------------
+if phase_notes is not None:
+    for issue in inputs.phase_issues: phase_notes.warning(f"⚠️ Not priced - {issue}")
 
-        if flight_cost: f_rate = logic.smart_round(flight_cost * EXP_MARKUP); f_tot = f_rate * tfas; svc_lines.append({"Description": "Airfare", "Qty": tfas, "Rate": f_rate, "Total": f_tot}); calc_log.append(f"Airfare: {tfas} Tix * ${f_rate} (Cost ${flight_cost} + {int((EXP_MARKUP-1)*100)}%) = ${f_tot}")
-        if (mode == "DRIVE" or mode == "FLY then DRIVE") and miles > 0: m_tot = logic.smart_round(miles * 1.10); svc_lines.append({"Description": "Mileage / Rental Fuel", "Qty": miles, "Rate": 1.10, "Total": m_tot})
-        if misc_exp: m_rate = logic.smart_round(misc_exp * EXP_MARKUP); svc_lines.append({"Description": "Misc Expenses (Car Rental, Visa, Transport)", "Qty": 1, "Rate": m_rate, "Total": m_rate}); calc_log.append(f"Misc Exp: ${misc_exp} + Markup = ${m_rate}")
-            
-        final_days = man_sub_days if override_sub else trip_days; rooms = math.ceil(tfas / 2)
-        lodg_rate = 0.0 if is_commuter else logic.smart_round(st.session_state.loc_rates['lodging']*1.2*EXP_MARKUP)
-        mie_rate = logic.smart_round(st.session_state.loc_rates['mie']*(0.5 if is_commuter else 1.0)*EXP_MARKUP)
-        
-        if lodg_rate > 0: l_qty = final_days * rooms; l_tot = lodg_rate * l_qty; svc_lines.append({"Description": f"Lodging ({rooms} Room{'s' if rooms > 1 else ''})", "Qty": l_qty, "Rate": lodg_rate, "Total": l_tot}); calc_log.append(f"Lodging: {final_days} nights * {rooms} rooms * ${lodg_rate} = ${l_tot}")
-        mie_qty = final_days * tfas; mie_tot = mie_rate * mie_qty; svc_lines.append({"Description": f"Subsistence ({tfas} Tech{'s' if tfas > 1 else ''})", "Qty": mie_qty, "Rate": mie_rate, "Total": mie_tot}); calc_log.append(f"Subsistence: {final_days} days * {tfas} techs * ${mie_rate} = ${mie_tot}")
-
-    for i, row in edited_parts.iterrows():
-        qty = float(row['Qty']) if row['Qty'] else 0.0
-        cost = float(row['Cost']) if row['Cost'] else 0.0
-        if qty > 0:
-            sell, markup = logic.calculate_part_price(cost, tier_selection); sell = round(sell, 2); total = sell * qty
-            part_lines_pdf.append({"Line": f"Line {i+1:02d}", "Part": row['Part #'], "Desc": row['Description'], "Qty": qty, "Rate": sell, "Total": total, "Lead": row['Lead Time']})
-            calc_log.append(f"Part: {row['Part #']} Cost ${cost} -> Sell ${sell} (Markup {markup:.2f}x)")
-
-    svc_total = sum([x['Total'] for x in svc_lines]); parts_total = sum([x['Total'] for x in part_lines_pdf])
-    c_cost = 0.0
-    if not is_parts_only and cont_pct > 0: c_cost = logic.smart_round((svc_total + parts_total) * cont_pct); svc_lines.append({"Description": "Contingency", "Qty": 1, "Rate": c_cost, "Total": c_cost}); calc_log.append(f"Contingency: {cont_pct*100}% of (${svc_total} + ${parts_total}) = ${c_cost}"); svc_total += c_cost
-
-    grand_total = svc_total + parts_total
-    st.success(f"### Grand Total: ${grand_total:,.2f}")
-    proj_data = {"Project": proj_name, "Site": final_site, "Region": region, "Start": mob_date.strftime("%Y-%m-%d") if mob_date else "N/A", "Return": return_date.strftime("%Y-%m-%d") if return_date else "N/A", "SOW": sow, "Assumptions": assume, "ManualClient": sel_site_data['Company']}
-    totals = {"Service": svc_total, "Parts": parts_total, "Grand": grand_total}
-    all_lines = svc_lines + [{'Description': p['Desc'], 'Qty': p['Qty'], 'Rate': p['Rate'], 'Total': p['Total']} for p in part_lines_pdf]
-    audit_text = logic.generate_audit_text(proj_data, all_lines, totals, rates_snap, user_inputs, calc_log)
-    json_str = json.dumps(user_inputs, indent=4)
+# Live totals: the session's quote graph re-runs only the stages this rerun's edits reach
+holidays = data.get_holidays()
+graph = st.session_state.get('quote_graph')
+if graph is None or graph.holidays != holidays: graph = st.session_state.quote_graph = quote_graph.QuoteGraph(holidays)
+with telemetry.span("quote.live"): live = graph.compute(inputs)
 
-    try:
-        pdf_bytes = pdf_gen.generate_pdf(proj_data, svc_lines, part_lines_pdf, sel_site_data, totals, is_parts_only, rates_snap if not is_parts_only else None, EXP_MARKUP if not is_parts_only else None)
-        with t_prev: st.dataframe(pd.DataFrame(svc_lines if not is_parts_only else part_lines_pdf)); st.download_button("💾 Download PDF", data=pdf_bytes, file_name=f"{proj_name}_v2.9.3.pdf", mime="application/pdf")
-        with t_text:
-            st.subheader("💾 Save / Audit"); st.download_button("📥 Save Quote to JSON", data=json_str, file_name=f"{proj_name}_DATA.json", mime="application/json")
-            st.markdown("---"); st.text_area("Audit Record (Text)", value=audit_text, height=400); st.download_button("💾 Download Text Record", data=audit_text, file_name=f"{proj_name}_RECORD.txt", mime="text/plain")
-    except Exception as e: st.error(f"PDF Error: {e}")
\ No newline at end of file
+if STORE is not None:
+    with t_text:
+        store_id = st.session_state.get('store_id')
+        c1, c2 = st.columns(2)
+        save_new = c2.button("🗄️ Save as New Quote") if store_id else False
+        if c1.button(f"🗄️ Save to Repository (#{store_id})" if store_id else "🗄️ Save to Repository") or save_new:
+            with telemetry.span("quote.store_save"):
+                try:
+                    st.session_state.store_id = STORE.save(inputs, live, None if save_new else store_id, data.data_version())
+                    st.success(f"Saved as #{st.session_state.store_id} (${live.totals['Grand']:,.2f})")
+                except Exception as e: st.error(f"Repository Error: {e}")
+        st.markdown("---")
+
+if svc:
+    with t_sweep:
+        st.markdown("### 🧮 Crew / Schedule What-If")
+        c1, c2, c3 = st.columns(3)
+        sw_tfas = c1.slider("TFAs", 1, 12, (1, min(12, max(4, int(tfas)))))
+        sw_days = c2.slider("Work Days", 1, 180, (1, min(180, max(30, int(days) * 3))))
+        sw_effort = c3.number_input("Onsite Tech-Hours Required", min_value=0.0, value=float(tfas * days * hrs), help="Configurations with TFAs x Hrs/Day x Days below this are skipped.")
+        c1, c2 = st.columns(2)
+        sw_hrs = c1.multiselect("Hrs/Day", [8, 9, 10, 11, 12], default=[8, 10, 12])
+        sw_wknd = c2.multiselect("Weekends", list(scenario_sweep.WEEKEND_OPTIONS), default=list(scenario_sweep.WEEKEND_OPTIONS))
+        if sw_hrs and sw_wknd:
+            res = scenario_sweep.sweep(inputs, range(sw_tfas[0], sw_tfas[1] + 1), sw_hrs, range(sw_days[0], sw_days[1] + 1), sw_wknd, sw_effort, data.get_holidays(), trip_rates=trip_rates)
+            n = len(res['total'])
+            if n:
+                st.caption(f"{n:,} configurations priced" + (f" · {len(inputs.crews) - 1} additional crew(s) included as fixed" if len(inputs.crews) > 1 else ""))
+                df_sw = pd.DataFrame({"TFAs": res['tfas'].astype(int), "Hrs/Day": res['hrs'], "Work Days": res['days'], "Weekends": res['weekend'],
+                                      "Calendar Days": res['calendar_days'].astype(int), "RT/Tech": res['rt'], "OT/Tech": res['ot'], "DT/Tech": res['dt'],
+                                      "Labor": res['labor'], "MBV Adj": res['mbv'], "Lodging": res['lodging'], "Subsistence": res['subsistence'], "Total": res['total']}).head(50)
+                df_sw.index = range(1, len(df_sw) + 1)
+                st.dataframe(df_sw.style.format({c: "${:,.2f}" for c in ["Labor", "MBV Adj", "Lodging", "Subsistence", "Total"]}), use_container_width=True)
+                c1, c2 = st.columns([1, 3])
+                rank = c1.number_input("Rank", min_value=1, max_value=len(df_sw), value=1)
+                row = df_sw.loc[rank]
+                cfg = {'tfas': int(row['TFAs']), 'hrs': int(row['Hrs/Day']), 'days': int(row['Work Days']), 'weekend': row['Weekends']}
+                c2.button(f"Use Rank #{rank} in Schedule", on_click=apply_scenario, args=(cfg,))
+            else: st.info("No configuration meets the required tech-hours in these ranges.")
+
+repriced = sum(n.startswith("part:") for n in graph.recomputed); stages = [n for n in graph.recomputed if not n.startswith("part:")]
+st.caption(f"⚡ Live total: ${live.totals['Grand']:,.2f}" + (f" - updated {', '.join(stages)}" if stages else "") + (f" ({repriced} part row{'s' if repriced != 1 else ''} repriced)" if repriced else ""))
+if st.button("🚀 Calculate Quote", type="primary"):
+    with telemetry.span("quote.compute"): quote = graph.compute(inputs)
+    st.success(f"### Grand Total: ${quote.totals['Grand']:,.2f}")
+    # The PDF is not rendered here: Preview renders it on the background pool on request (pdf_jobs).
+    pdf_args = (quote.proj_data, quote.svc_lines, quote.part_lines, dict(sel_site_data), quote.totals, is_parts_only, quote.rates if svc else None, inputs.exp_markup if svc else None)
+    inputs_d = inputs.to_dict(); RESULTS = data.get_result_cache()
+    # Same inputs, rate files, holidays and day as an earlier Calculate (any session): reuse its audit, JSON and PDF
+    with telemetry.span("quote.result_cache"):
+        result_key = result_cache.quote_key(inputs_d, data.rate_data_version(region), graph.holidays); done = RESULTS.get(result_key)
+    if done is None:
+        with telemetry.span("quote.json"): json_str = json.dumps({**inputs_d, "result": quote.summary()}, indent=4)
+        done = {"totals": quote.totals, "lines": quote.svc_lines if not is_parts_only else quote.part_lines, "audit": quote.audit_text(inputs), "json": json_str, "pdf": None}
+        RESULTS.put(result_key, done)
+    st.session_state.last_quote = {
+        "proj_name": proj_name, "inputs": inputs_d, "lines": done['lines'], "audit": done['audit'], "json": done['json'],
+        "pdf_args": pdf_args, "pdf_key": pdf_jobs.pdf_key(*pdf_args), "result_key": result_key}
+
+last_quote = st.session_state.get('last_quote')
+if last_quote:
+    lq_name = last_quote['proj_name']
+    if last_quote['inputs'] != inputs.to_dict(): st.caption("ℹ️ Inputs changed since the last Calculate - Preview and downloads show the last calculated quote.")
+    with t_prev:
+        st.dataframe(pd.DataFrame(last_quote['lines']))
+        pdf_job = pdf_jobs.job(last_quote['pdf_key'])
+        if pdf_job is not None and not pdf_job.done(): st.fragment(pdf_panel, run_every=1.0)(last_quote, pending=True)
+        else: pdf_panel(last_quote)
+    with t_text:
+        st.subheader("💾 Save / Audit"); st.download_button("📥 Save Quote to JSON", data=last_quote['json'], file_name=f"{lq_name}_DATA.json", mime="application/json")
+        st.markdown("---"); st.text_area("Audit Record (Text)", value=last_quote['audit'], height=400); st.download_button("💾 Download Text Record", data=last_quote['audit'], file_name=f"{lq_name}_RECORD.txt", mime="text/plain")
+
+# --- DIAGNOSTICS ---
+diag = telemetry.finish(data_version=data.data_version(), rss_mb=round((data.process_rss() or 0) / 1e6, 1))
+data.start_warm_up()  # After the page is drawn: search / international indexes build while the user reads it
+if diag:
+    if any(x['name'] == "quote.compute" for x in diag['stages']): st.session_state.diag_calc = diag
+    with st.expander(f"🩺 Diagnostics - this run {diag['ms']:,.1f} ms", expanded=False):
+        if diag.get('log_error'): st.warning(f"Telemetry log not written: {diag['log_error']}")
+        df_st = pd.DataFrame([{"Stage": name, "Calls": s['calls'], "Total ms": s['ms'], "Cache Hits": s.get('hits'), "Cache Misses": s.get('misses')} for name, s in diag['stats'].items()])
+        if len(df_st): st.dataframe(df_st, use_container_width=True, hide_index=True)
+        st.markdown("**Memory**")
+        st.dataframe(pd.DataFrame(data.memory_report()), use_container_width=True, hide_index=True)
+        calc = st.session_state.get('diag_calc')
+        if calc:
+            st.markdown(f"**Last Calculate Quote** ({calc['ts']})")
+            t0 = min(x['start_ms'] for x in calc['stages'] if x['name'] == "quote.compute")
+            stages = sorted((x for x in calc['stages'] if x['start_ms'] >= t0 and x['name'].startswith(("quote.", "engine.", "graph."))), key=lambda x: x['start_ms'])
+            st.dataframe(pd.DataFrame([{"Stage": ("    " * x['depth']) + x['name'], "Start ms": x['start_ms'] - t0, "ms": x['ms']} for x in stages]), use_container_width=True, hide_index=True)
@@ -0,0 +1,268 @@
+# src/bench.py
+# ======================================================
+# AFP ESTIMATOR - BENCHMARK SUITE
+# Version: v3.0
+# Updated: 2026-10-17
+# Description: Offline micro/end-to-end benchmarks for the rerun path:
+#              schedule engine, part pricing, rate lookups, client DB load
+#              (cold/warm), markdown rendering and full PDF generation.
+#              Fixtures are pinned (fixed dates, seeds and queries) so runs
+#              are comparable. Results are JSON; --compare fails (exit 1)
+#              when a case is slower than its baseline by more than the
+#              threshold. --cold-start times the app's first paint and first
+#              run in fresh interpreters against COLD_START_BUDGET.
+#
+# Usage:       python bench.py [-k FILTER] [--out bench_results.json]
+#              python bench.py --save-baseline bench_baseline.json
+#              python bench.py --compare bench_baseline.json [--threshold 0.25]
+#              python bench.py -k none --cold-start
+# ======================================================
+
+import os
+import sys
+import json
+import time
+import random
+import platform
+import datetime
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+import numpy as np
+import streamlit.logger
+
+streamlit.logger.set_log_level("error")  # "No runtime found" warnings when caches run outside the app
+
+import logic
+import data
+import pdf_gen
+from quote_engine import QuoteInputs, QuoteEngine
+from quote_graph import QuoteGraph
+from parts_catalog import PartsCatalog
+
+# --- PINNED FIXTURES ---
+START = datetime.date(2026, 3, 2)
+HOLIDAYS = frozenset(datetime.date(y, m, d) for y in (2026, 2027, 2028) for m, d in ((1, 1), (5, 25), (7, 4), (9, 7), (11, 26), (12, 25)))
+ZIPS = ["68127", "10001", "94105", "60601", "33101", "98101", "02108", "75201", "80202", "30303",
+        "85001", "19103", "48226", "55401", "63101", "70112", "97201", "84101", "37203", "99999"]
+COUNTRY_QUERIES = ["germany", "united", "a", "japan", "king", "zz"]
+CATALOG_QUERIES = ["AFP-0421", "pendent", "valve 2in", "brass 155f", "98765", "zz"]
+
+def _parts(n, seed=7):
+    rng = random.Random(seed)
+    return [{"Part #": f"AFP-{i:05d}", "Description": "Sprinkler head, pendent 155F", "Qty": rng.randint(1, 40),
+             "Cost": round(rng.uniform(0.5, 9000.0), 2), "Lead Time": "2-4 Weeks"} for i in range(n)]
+
+PARTS_5K = _parts(5000)
+COSTS_5K = [p['Cost'] for p in PARTS_5K]; QTYS_5K = [p['Qty'] for p in PARTS_5K]
+
+def _templates_text():
+    reg = data.get_template_registry()
+    ctx = logic.build_template_context(140.0, 210.0, 280.0, 30, 30)
+    return "\n".join(reg.get(n).fill(ctx) for n in reg.names() if not reg.get(n).error)
+
+def _clear_streamlit_caches():
+    import streamlit as st
+    st.cache_data.clear(); st.cache_resource.clear()
+
+# --- CASES ---
+# name -> (setup() -> state, fn(state)). setup runs once per repeat, outside the timer.
+
+def _case_md_cold():
+    text = _templates_text()
+    def setup():
+        pdf_gen._MD_CACHE.clear(); pdf = pdf_gen.PDF(); pdf.add_page(); return pdf
+    return setup, lambda pdf: pdf.write_markdown(text)
+
+def _case_md_warm():
+    text = _templates_text(); pdf_gen.compile_markdown(text)
+    def setup():
+        pdf = pdf_gen.PDF(); pdf.add_page(); return pdf
+    return setup, lambda pdf: pdf.write_markdown(text)
+
+def _case_catalog_search():
+    """100k-SKU catalog in a temp folder (built once, ~10 s, removed after the case), searched like the Parts tab."""
+    rng = random.Random(11); kinds = ["Sprinkler head, pendent", "Gate valve", "Check valve", "Brass elbow", "Flow switch", "Tamper switch"]
+    rows = ((f"AFP-{i:06d}", f"{rng.choice(kinds)} {rng.choice(['1in', '2in', '4in', '155F', '200F'])}", round(rng.uniform(0.5, 9000.0), 2), "2-4 Weeks") for i in range(100000))
+    tmp = tempfile.TemporaryDirectory(prefix="afp-bench-"); catalog = PartsCatalog(os.path.join(tmp.name, "parts_catalog.db"))
+    catalog.import_rows("Bench", rows)
+    return None, lambda _: [catalog.search(q, 50) for q in CATALOG_QUERIES], lambda: (catalog.close(), tmp.cleanup())
+
+def _case_pdf():
+    args = pdf_gen.reference_quote()
+    return None, lambda _: pdf_gen.generate_pdf(*args)
+
+def _bench_inputs():
+    return QuoteInputs(proj_name="Bench", mob_date=START, start_date=START + datetime.timedelta(days=1), return_date=START + datetime.timedelta(days=15),
+                       tfas=3, days=10, hrs=10, flight_cost=600, t_hrs=6, parts_list=_parts(50))
+
+def _phases(n, seed=5):
+    rng = random.Random(seed)
+    return [{"name": f"Crew {i + 2}", "tfas": rng.randint(1, 6), "days": rng.randint(3, 60), "hrs": rng.choice([8, 10, 12]), "sat": rng.random() < 0.5, "sun": rng.random() < 0.3,
+             "mob_date": str(START + datetime.timedelta(days=rng.randrange(90))), "start_date": None, "return_date": None} for i in range(n)]
+
+def _case_quote_phases():
+    """36-crew outage quote: full compute, then one crew edited between live recomputes."""
+    q = QuoteInputs(**{**_bench_inputs().__dict__, 'phases': _phases(36)}); graph = QuoteGraph(HOLIDAYS); graph.compute(q); hrs = [10]
+    def setup():
+        hrs[0] = 22 - hrs[0]; phases = [dict(p) for p in q.phases]; phases[7]['hrs'] = hrs[0]
+        return QuoteInputs(**{**q.__dict__, 'phases': phases})
+    return setup, graph.compute
+
+def _case_quote():
+    q = _bench_inputs(); engine = QuoteEngine(HOLIDAYS)
+    return None, lambda _: engine.compute(q)
+
+def _case_graph_part_edit():
+    """One part quantity edited between live recomputes (the app's per-rerun path)."""
+    q = _bench_inputs(); graph = QuoteGraph(HOLIDAYS); graph.compute(q); qty = [1]
+    def setup():
+        qty[0] = 3 - qty[0]; rows = [dict(p) for p in q.parts_list]; rows[0]['Qty'] = qty[0]
+        return QuoteInputs(**{**q.__dict__, 'parts_list': rows})
+    return setup, graph.compute
+
+CASES = {
+    "schedule_short":        lambda: (None, lambda _: logic.simulate_schedule(START, 5, 10, False, False, {'cap_rt_weekly': 40}, False)),
+    "schedule_long_3yr":     lambda: (None, lambda _: logic.simulate_schedule(START, 750, 10, True, False, {'cap_rt_weekly': 40}, False, HOLIDAYS)),
+    "schedule_long_key_acct": lambda: (None, lambda _: logic.simulate_schedule(START, 750, 12, True, True, {'cap_rt_weekly': 45}, True, HOLIDAYS)),
+    "part_price_scalar_5k":  lambda: (None, lambda _: [logic.calculate_part_price(c, "Standard") for c in COSTS_5K]),
+    "part_price_batch_5k":   lambda: (None, lambda _: logic.price_parts_batch(COSTS_5K, QTYS_5K, "Standard")),
+    "domestic_rate_x20":     lambda: (None, lambda _: [data.get_domestic_rate(z, START) for z in ZIPS]),
+    "trip_rate_x20":         lambda: (None, lambda _: [data.get_domestic_rate(z, START, START + datetime.timedelta(days=90)) for z in ZIPS]),
+    "catalog_search_x6":     _case_catalog_search,
+    "intl_options_x6":       lambda: (None, lambda _: [data.get_international_options(q) for q in COUNTRY_QUERIES]),
+    "client_db_cold":        lambda: (_clear_streamlit_caches, lambda _: data.load_client_db()),
+    "client_db_warm":        lambda: (None, lambda _: data.load_client_db()),
+    "write_markdown_cold":   _case_md_cold,
+    "write_markdown_warm":   _case_md_warm,
+    "quote_compute":         _case_quote,
+    "quote_graph_part_edit": _case_graph_part_edit,
+    "quote_phases_36":       lambda: (None, lambda _, e=QuoteEngine(HOLIDAYS), q=QuoteInputs(**{**_bench_inputs().__dict__, 'phases': _phases(36)}): e.compute(q)),
+    "quote_graph_phase_edit": _case_quote_phases,
+    "generate_pdf":          _case_pdf,
+}
+
+def _timed(setup, fn, state, number):
+    total = 0.0
+    for _ in range(number):
+        if setup: state = setup()
+        t0 = time.perf_counter(); fn(state); total += time.perf_counter() - t0
+    return total
+
+def time_case(setup, fn, repeat=5, min_time=0.05):
+    """Per-call seconds as {'best', 'median', 'number', 'repeat'}. Calls per repeat are calibrated to ~min_time (setup excluded)."""
+    state = setup() if setup else None
+    fn(state)  # Warm-up (imports, lazy indexes)
+    number = 1
+    while _timed(setup, fn, state, number) < min_time and number < 100000: number *= 2
+    samples = [_timed(setup, fn, state, number) / number for _ in range(repeat)]
+    return {"best": min(samples), "median": statistics.median(samples), "number": number, "repeat": repeat}
+
+def run(names, repeat=5, log=print):
+    """Cases return (setup, fn) or (setup, fn, cleanup); cleanup runs once the case is timed."""
+    results = {}
+    for name in names:
+        case = CASES[name]()
+        try: results[name] = r = time_case(case[0], case[1], repeat)
+        finally:
+            if len(case) > 2: case[2]()
+        if log: log(f"  {name:<24} {r['best'] * 1e3:>10.3f} ms  (median {r['median'] * 1e3:.3f} ms, n={r['number']})")
+    return results
+
+# --- COLD START ---
+# Fresh interpreter per trial, Streamlit already imported and warmed (as in a running server);
+# the AppTest harness cost of an empty script is subtracted.
+# first_paint_s: app.py imports + script up to the sidebar header; first_run_s: the whole first run.
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+FIRST_PAINT_MARKER = "(first paint)"
+COLD_START_BUDGET = {"first_paint_s": 0.35, "first_run_s": 1.2}
+
+_COLD_PROBE = """
+import sys, json, time
+import streamlit.logger
+streamlit.logger.set_log_level("error")
+from streamlit.testing.v1 import AppTest
+app_path, mode = sys.argv[1], sys.argv[2]
+sys.path.insert(0, __import__("os").path.dirname(app_path))
+src = open(app_path, encoding="utf-8").read()
+if mode == "paint": src = src[:src.index("\\n", src.index(sys.argv[3])) + 1]
+empty = "import streamlit as st\\nst.sidebar.header('x')\\n"
+AppTest.from_string(empty).run(); t0 = time.perf_counter(); AppTest.from_string(empty).run(); harness = time.perf_counter() - t0
+t0 = time.perf_counter()
+at = (AppTest.from_string(src) if mode == "paint" else AppTest.from_file(app_path)).run(timeout=120)
+print(json.dumps({"s": max(0.0, time.perf_counter() - t0 - harness), "errors": [str(e.value) for e in at.exception],
+                  "pandas": "pandas" in sys.modules, "fpdf": "fpdf" in sys.modules}))
+"""
+
+def _probe(mode):
+    out = subprocess.run([sys.executable, "-c", _COLD_PROBE, APP_PATH, mode, FIRST_PAINT_MARKER], capture_output=True, text=True, timeout=300)
+    lines = [l for l in out.stdout.splitlines() if l.startswith("{")]
+    if not lines: raise RuntimeError(f"cold-start probe failed: {out.stderr.strip()[-500:]}")
+    return json.loads(lines[-1])
+
+def cold_start(trials=3, log=print):
+    """{'first_paint_s', 'first_run_s'} medians over fresh-interpreter trials, plus budget checks."""
+    paint = [_probe("paint") for _ in range(trials)]; full = [_probe("full") for _ in range(trials)]
+    res = {"first_paint_s": statistics.median(p['s'] for p in paint), "first_run_s": statistics.median(p['s'] for p in full), "trials": trials,
+           "budget": COLD_START_BUDGET, "errors": sorted({e for p in paint + full for e in p['errors']}),
+           "pandas_before_paint": any(p['pandas'] for p in paint), "fpdf_on_first_run": any(p['fpdf'] for p in full)}
+    res['over_budget'] = [k for k, limit in COLD_START_BUDGET.items() if res[k] > limit]
+    if log:
+        for k, limit in COLD_START_BUDGET.items(): log(f"  {k:<24} {res[k] * 1e3:>10.1f} ms  (budget {limit * 1e3:.0f} ms){'  OVER BUDGET' if k in res['over_budget'] else ''}")
+        if res['pandas_before_paint']: log("  pandas was imported before first paint")
+        if res['fpdf_on_first_run']: log("  fpdf was imported during the first run")
+        for e in res['errors']: log(f"  app error: {e}")
+    return res
+
+def meta():
+    import fpdf
+    return {"python": platform.python_version(), "numpy": np.__version__, "fpdf": getattr(fpdf, "__version__", "?"),
+            "platform": platform.platform(), "cpus": os.cpu_count(), "data_version": data.data_version(),
+            "run_at": datetime.datetime.now().isoformat(timespec="seconds")}
+
+def compare(results, baseline, threshold=0.25, noise_floor=5e-6):
+    """[(name, base, new, ratio, regressed)] on best-of times. Differences under noise_floor seconds never regress."""
+    rows = []
+    for name, r in results.items():
+        b = baseline.get("cases", {}).get(name)
+        if not b: rows.append((name, None, r['best'], None, False)); continue
+        ratio = r['best'] / b['best'] if b['best'] else float('inf')
+        rows.append((name, b['best'], r['best'], ratio, ratio > 1 + threshold and r['best'] - b['best'] > noise_floor))
+    return rows
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Run the estimator benchmark suite.")
+    ap.add_argument("-k", dest="filter", help="Only cases whose name contains this text")
+    ap.add_argument("--repeat", type=int, default=5, help="Timed repeats per case (default 5)")
+    ap.add_argument("--out", default="bench_results.json", help="Results file (default: bench_results.json)")
+    ap.add_argument("--save-baseline", metavar="PATH", help="Also write the results as a baseline")
+    ap.add_argument("--compare", metavar="PATH", help="Compare against a baseline; exit 1 on regression")
+    ap.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown vs baseline (default 0.25 = 25%%)")
+    ap.add_argument("--cold-start", action="store_true", help="Also time app first paint / first run in fresh interpreters (exit 1 over budget)")
+    args = ap.parse_args()
+
+    names = [n for n in CASES if not args.filter or args.filter in n]
+    print(f"Running {len(names)} benchmark(s)...")
+    doc = {"meta": meta(), "cases": run(names, args.repeat)}
+    if args.cold_start:
+        print("Cold start (fresh interpreters)...")
+        doc['cold_start'] = cold_start()
+    for path in filter(None, (args.out, args.save_baseline)):
+        with open(path, "w", encoding="utf-8") as f: json.dump(doc, f, indent=2)
+    if args.save_baseline: print(f"Baseline saved -> {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f: baseline = json.load(f)
+        rows = compare(doc["cases"], baseline, args.threshold); failed = [r for r in rows if r[4]]
+        print(f"\nvs {args.compare} (threshold +{args.threshold:.0%}):")
+        for name, b, n, ratio, bad in rows:
+            if b is None: print(f"  {name:<24} {'(new case)':>22}"); continue
+            print(f"  {name:<24} {b * 1e3:>10.3f} -> {n * 1e3:>10.3f} ms  x{ratio:.2f}{'  REGRESSION' if bad else ''}")
+        if failed:
+            print(f"{len(failed)} case(s) regressed."); sys.exit(1)
+        print("No regressions.")
+    cs = doc.get('cold_start')
+    if cs and (cs['over_budget'] or cs['errors'] or cs['pandas_before_paint'] or cs['fpdf_on_first_run']):
+        print("Cold-start budget failed."); sys.exit(1)
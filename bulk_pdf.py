@@ -0,0 +1,105 @@
+# src/bulk_pdf.py
+# ======================================================
+# AFP ESTIMATOR - BULK PDF EXPORT MODULE
+# Version: v3.0
+# Updated: 2026-10-17
+# Description: Renders many saved quotes to PDF across a process pool and
+#              streams each finished PDF straight into a ZIP on disk. Only
+#              a bounded number of quotes are in flight, so memory stays
+#              flat however large the batch. Progress and failures are
+#              reported per quote (failures also land in _errors.txt).
+#
+# Usage:       python bulk_pdf.py QUOTE_DIR OUT.zip [--company TEXT]
+#                  [--status Draft --status Submitted] [--workers N]
+# ======================================================
+
+import os
+import json
+import zipfile
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import ingest
+from quote_engine import QuoteInputs, QuoteEngine
+from requote import bounded_map, iter_quote_files
+
+_W = {}  # Per-worker state, filled once by _init_worker
+
+def _init_worker(source_dirs):
+    import pdf_gen  # fpdf, assets and the data module load once per worker
+    hol = ingest.find_source(source_dirs, ["holidays.csv"]) if source_dirs else None
+    _W['engine'] = QuoteEngine(ingest.load_holidays(hol) if hol else None)
+    _W['renderer'] = pdf_gen.QuoteRenderer()
+
+def _render(job):
+    """(name, saved dict) -> (name, pdf bytes or None, error text)."""
+    name, saved = job
+    try:
+        q = QuoteInputs.from_dict(saved); r = _W['engine'].compute(q); svc = not q.is_parts_only
+        pdf = _W['renderer'].render(r.proj_data, r.svc_lines, r.part_lines, q.client, r.totals, q.is_parts_only,
+                                    r.rates if svc else None, q.exp_markup if svc else None)
+        return name, pdf, ""
+    except Exception as e:
+        return name, None, f"{type(e).__name__}: {e}"
+
+def _jobs(quotes):
+    for q in quotes:
+        saved = q.to_dict() if isinstance(q, QuoteInputs) else q
+        name = str(saved.get('proj_name') or "Quote").replace("/", "_").replace("\\", "_")
+        yield name, saved
+
+def _unique(name, used):
+    arc = f"{name}.pdf"; k = 2
+    while arc in used: arc = f"{name} ({k}).pdf"; k += 1
+    used.add(arc)
+    return arc
+
+def export_zip(quotes, zip_path, workers=None, source_dirs=None, on_progress=None):
+    """
+    Renders every quote (QuoteInputs or saved-JSON dicts, any iterable) into
+    zip_path. on_progress(done, name, error) is called as each quote finishes
+    (error is "" on success). The archive is written to a .part file and
+    moved into place at the end. Returns {'written': n, 'failed': [(name, error)]}.
+    """
+    workers = workers or os.cpu_count() or 1
+    report = {"written": 0, "failed": []}; used = set(); done = 0
+    tmp_path = zip_path + ".part"
+    # Stored, not deflated: fpdf already compresses page streams and the logos are JPEG.
+    with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_STORED) as zf, \
+         ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(source_dirs,)) as pool:
+        for name, pdf, err in bounded_map(pool, _render, _jobs(quotes), workers * 2):
+            done += 1
+            if pdf is not None: zf.writestr(_unique(name, used), pdf); report['written'] += 1
+            else: report['failed'].append((name, err))
+            if on_progress: on_progress(done, name, err)
+        if report['failed']: zf.writestr("_errors.txt", "\n".join(f"{n}: {e}" for n, e in report['failed']))
+    os.replace(tmp_path, zip_path)
+    return report
+
+def iter_saved_quotes(folder, company=None, statuses=None, recursive=False):
+    """Saved quote dicts from a folder, filtered by client company (case-insensitive substring) and status."""
+    for path in iter_quote_files(folder, recursive=recursive):
+        try:
+            with open(path, "r", encoding="utf-8") as f: saved = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"  skip {os.path.basename(path)}: {e}"); continue
+        if company and company.lower() not in str((saved.get('client') or {}).get('Company', '')).lower(): continue
+        if statuses and saved.get('status') not in statuses: continue
+        yield saved
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Render saved quote JSON files to PDFs in one ZIP.")
+    ap.add_argument("quote_dir", help="Folder of saved quotes (*_DATA.json)")
+    ap.add_argument("out_zip", help="ZIP file to write")
+    ap.add_argument("--company", help="Only quotes whose client company contains this text")
+    ap.add_argument("--status", action="append", help="Only quotes with this status (repeatable)")
+    ap.add_argument("--recursive", action="store_true", help="Include sub-folders")
+    ap.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    args = ap.parse_args()
+
+    def progress(done, name, err):
+        print(f"  [{done}] {name}: {'ERROR ' + err if err else 'ok'}")
+
+    quotes = iter_saved_quotes(args.quote_dir, args.company, args.status, args.recursive)
+    rep = export_zip(quotes, args.out_zip, args.workers, ingest.default_source_dirs(), progress)
+    print(f"Wrote {rep['written']} PDFs ({len(rep['failed'])} failed) -> {args.out_zip}")
@@ -0,0 +1,130 @@
+# src/client_directory.py
+# ======================================================
+# AFP ESTIMATOR - CLIENT DIRECTORY MODULE
+# Version: v3.0
+# Updated: 2026-10-17
+# Description: Indexed client/site directory built once per data version.
+#              Replaces per-rerun sorting and boolean DataFrame filtering in
+#              the sidebar with dict lookups, and provides incremental
+#              prefix + trigram (fuzzy) search over company and site names.
+#              The search index is built on first search (or by warm() from
+#              a background thread), so the sidebar lists are ready first.
+#              Site records are tuples over the snapshot's shared (interned)
+#              strings rather than one dict per site.
+# ======================================================
+
+import sys
+import bisect
+import threading
+from collections import Counter
+
+def _trigrams(text, closed=True):
+    """Character trigrams; queries are left open-ended so a half-typed word still matches."""
+    padded = f"  {text} " if closed else f"  {text}"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+RECORD_FIELDS = ("Street", "City", "State", "Zip")
+
+class ClientDirectory:
+    """
+    companies:   sorted unique company names (companies.csv)
+    sites(c):    sorted unique site names for a company (locations.csv)
+    site_record: {'Street', 'City', 'State', 'Zip'} for (company, site); first row wins
+    search(q):   ranked (company, site_or_None) hits; prefix match first, then
+                 substring, then trigram similarity for typos/partial words
+    """
+
+    def __init__(self, company_names, locations):
+        self.companies = sorted({c for c in company_names if c})
+        self._company_set = set(self.companies)
+        self._sites = {}; self._records = {}
+        cols = [locations.get(k, ()) for k in ('company_name', 'site_name', 'street', 'city', 'state', 'zip')]
+        for company, site, street, city, state, zip_code in zip(*cols):
+            if not company or not site: continue
+            key = (company, site)
+            if key in self._records: continue
+            self._sites.setdefault(company, []).append(site)
+            self._records[key] = (street, city, state, zip_code)
+        for company in self._sites: self._sites[company].sort()
+        self._indexed = False; self._index_lock = threading.Lock(); self._size = (None, 0)
+
+    def warm(self):
+        """Builds the search index (idempotent, thread-safe)."""
+        if self._indexed: return self
+        with self._index_lock:
+            if self._indexed: return self
+            # Search entries: every company, then every (company, site) pair.
+            entries = [(c, None) for c in self.companies] + list(self._records.keys())
+            lower = [(site or company).lower() for company, site in entries]
+            grams = {}
+            for i, name in enumerate(lower):
+                for g in _trigrams(name): grams.setdefault(g, []).append(i)
+            self._entries, self._lower, self._grams = entries, lower, grams
+            self._prefix = sorted((name, i) for i, name in enumerate(lower))
+            self._indexed = True
+        return self
+
+    @classmethod
+    def from_snapshot(cls, snap):
+        comp, loc = snap.table("companies"), snap.table("locations")
+        return cls(comp['company_name'].tolist(), {k: v.tolist() for k, v in loc.items()})
+
+    def __len__(self):
+        return len(self.companies)
+
+    def sites(self, company):
+        return self._sites.get(company, [])
+
+    def site_record(self, company, site):
+        r = self._records.get((company, site))
+        return None if r is None else dict(zip(RECORD_FIELDS, r))
+
+    def memory_bytes(self):
+        """Approximate resident size: every distinct object reachable from the directory (shared strings counted once)."""
+        if self._size[0] == self._indexed: return self._size[1]
+        indexed = self._indexed
+        seen = set(); total = 0; stack = [self.companies, self._company_set, self._sites, self._records]
+        if indexed: stack += [self._entries, self._lower, self._grams, self._prefix]
+        while stack:
+            obj = stack.pop()
+            if id(obj) in seen: continue
+            seen.add(id(obj)); total += sys.getsizeof(obj)
+            if isinstance(obj, dict): stack += obj.keys(); stack += obj.values()
+            elif isinstance(obj, (list, tuple, set, frozenset)): stack += obj
+        self._size = (indexed, total)  # Contents only change when the index is built
+        return total
+
+    def _candidates(self, q):
+        if len(q) < 3:
+            lo = bisect.bisect_left(self._prefix, (q, -1))
+            hits = []
+            for name, i in self._prefix[lo:]:
+                if not name.startswith(q): break
+                hits.append(i)
+            return hits
+        grams = _trigrams(q, closed=False)
+        counts = Counter()
+        for g in grams: counts.update(self._grams.get(g, ()))
+        need = max(1, int(len(grams) * 0.6))
+        return [i for i, n in counts.items() if n >= need]
+
+    def search(self, query, limit=50):
+        q = str(query).strip().lower()
+        if not q: return []
+        self.warm()
+        grams = _trigrams(q, closed=False) if len(q) >= 3 else None
+        def rank(i):
+            name = self._lower[i]
+            tier = 0 if name.startswith(q) else 1 if q in name else 2
+            score = len(grams & _trigrams(name)) if grams and tier == 2 else 0
+            return (tier, -score, name)
+        return [self._entries[i] for i in sorted(self._candidates(q), key=rank)[:limit]]
+
+    def search_companies(self, query, limit=50):
+        """Companies matching by name or by one of their sites, best match first."""
+        out = []; seen = set()
+        for company, _ in self.search(query, limit=limit * 4):
+            if company in seen or company not in self._company_set: continue
+            seen.add(company); out.append(company)
+            if len(out) >= limit: break
+        return out
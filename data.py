@@ -1,23 +1,39 @@
 # src/data.py
 # ======================================================
 # AFP ESTIMATOR - DATA MODULE
-# Version: v2.9.2 (External Templates Fix)
-# Updated: 2026-01-23
+# Version: v3.0
+# Updated: 2026-10-17
 # Description: Handles CSV loading, Rate Lookups, and External Template Loading.
+#              Rate and client tables are served from the compiled snapshot
+#              (ingest.py) rather than parsed per call.
 # ======================================================
 
-import pandas as pd
+import numpy as np
 import os
+import time
+import threading
 import streamlit as st
-import glob
+
+import ingest
+import rate_index
+import client_directory
+import template_registry
+import geo
+import quote_store
+import parts_catalog
+import result_cache
+import logic
+import telemetry
+
+SOURCE_CANDIDATES = ["Shared_Data_WebApp Modular", "Shared_Data"]
 
 @st.cache_resource
 def get_data_dir():
-    """Smart Path Finder for Shared_Data sources."""
+    """Smart Path Finder for Shared_Data sources (AFP_DATA_DIR skips the search)."""
+    if os.environ.get("AFP_DATA_DIR"): return os.environ["AFP_DATA_DIR"]
     current_dir = os.path.dirname(os.path.abspath(__file__))
-    candidates = ["Shared_Data_WebApp Modular", "Shared_Data"]
     for _ in range(4):
-        for folder in candidates:
+        for folder in SOURCE_CANDIDATES:
             check_path = os.path.join(current_dir, folder)
             if os.path.exists(check_path):
                 return check_path
@@ -27,80 +43,334 @@ def get_data_dir():
     return "Shared_Data"
 
 DATA_DIR = get_data_dir()
+INDEX_DIR = os.path.join(DATA_DIR, ingest.SNAPSHOT_DIR_NAME)
 
-@st.cache_data
+def get_source_dirs():
+    """DATA_DIR first, then its sibling data folders (xlsx-only sources live in Shared_Data)."""
+    parent = os.path.dirname(os.path.abspath(DATA_DIR))
+    dirs = [DATA_DIR]
+    for folder in SOURCE_CANDIDATES:
+        path = os.path.join(parent, folder)
+        if os.path.isdir(path) and os.path.abspath(path) != os.path.abspath(DATA_DIR): dirs.append(path)
+    return dirs
+
+SNAPSHOT_RETRY_S = 10      # After a failed load, callers get None for this long before the next attempt
+_snapshot_failed_at = 0.0
+
+@st.cache_resource(ttl=300)
+def _load_snapshot():
+    telemetry.miss("data.get_snapshot")
+    return ingest.load_snapshot(get_source_dirs(), INDEX_DIR)
+
+@telemetry.timed("data.get_snapshot", cached=True)
+def get_snapshot():
+    """
+    Compiled rate/client snapshot (see ingest.py), shared by all sessions, or None if it cannot be loaded.
+    Re-checked every 5 minutes; only sources whose files changed are recompiled. Failures are not
+    cached: the load is retried after SNAPSHOT_RETRY_S (e.g. a refresh that raced another worker).
+    """
+    global _snapshot_failed_at
+    if time.monotonic() - _snapshot_failed_at < SNAPSHOT_RETRY_S: return None
+    try: return _load_snapshot()
+    except Exception:
+        _snapshot_failed_at = time.monotonic(); return None
+
+def data_version():
+    snap = get_snapshot()
+    return snap.version if snap else "none"
+
+# Rate sources a quote's lodging / M&IE comes from, by region
+RATE_SOURCES = {"DOMESTIC": ("gsa_zip", "gsa_master"), "INTERNATIONAL": ("state_dept",)}
+
+def rate_data_version(region):
+    """Version of the rate files behind a region's quotes (updating the other region's file leaves it unchanged)."""
+    snap = get_snapshot()
+    return snap.source_version(*RATE_SOURCES.get(region, ())) if snap else "none"
+
+def _frame_column(pd, col):
+    if isinstance(col, ingest.CategoricalColumn):
+        return pd.Categorical.from_codes(np.asarray(col.codes, dtype=np.int32), categories=pd.Index(col.values))
+    return np.asarray(col)
+
+# Per-snapshot views: one entry each, so a new snapshot version releases the old frames, indexes and mmaps
+@st.cache_resource(max_entries=1)
+def _client_frames(_snap, version):
+    telemetry.miss("data.load_client_db")
+    import pandas as pd  # Only the DataFrame view needs pandas; the app itself uses the client directory
+    comp, loc = _snap.table("companies"), _snap.table("locations")
+    df_comp = pd.DataFrame({'company_name': np.asarray(comp['company_name'])})
+    df_comp = df_comp[df_comp['company_name'] != ''].drop_duplicates()
+    df_loc = pd.DataFrame({col: _frame_column(pd, loc[col]) for col in ingest.LOCATION_COLUMNS.values()})
+    return df_comp, df_loc
+
+@telemetry.timed("data.load_client_db", cached=True)
 def load_client_db():
-    comp_path = os.path.join(DATA_DIR, "companies.csv")
-    loc_path = os.path.join(DATA_DIR, "locations.csv")
-    if not os.path.exists(comp_path) or not os.path.exists(loc_path): return pd.DataFrame(), pd.DataFrame()
-    try:
-        df_comp = pd.read_csv(comp_path); df_comp.columns = df_comp.columns.str.lower().str.strip()
-        if 'name' in df_comp.columns: df_comp = df_comp[['name']].rename(columns={'name': 'company_name'}).drop_duplicates()
-        else: return pd.DataFrame(), pd.DataFrame()
-        
-        df_loc = pd.read_csv(loc_path); df_loc.columns = df_loc.columns.str.lower().str.strip()
-        col_map = {'company': 'company_name', 'location_name': 'site_name', 'street': 'street', 'city': 'city', 'state': 'state', 'postalcode': 'zip'}
-        valid_cols = [c for c in col_map.keys() if c in df_loc.columns]
-        df_loc = df_loc[valid_cols].rename(columns=col_map); df_loc.fillna('', inplace=True)
-        return df_comp, df_loc
-    except: return pd.DataFrame(), pd.DataFrame()
-
-def get_domestic_rate(zip_code, travel_date):
-    path = os.path.join(DATA_DIR, "FY2026_GSA_ZipCodeFile.csv")
-    if not os.path.exists(path): return None
-    try:
-        df = pd.read_csv(path, dtype={'Zip': str})
-        row = df[df['Zip'] == str(zip_code).zfill(5)]
-        if not row.empty:
-            month_col = travel_date.strftime("%b")
-            try: lodging = float(row.iloc[0].get(month_col, 110.0))
-            except: lodging = 110.0
-            return {"lodging": lodging, "mie": float(row.iloc[0]['Meals']), "city": row.iloc[0]['Name']}
-    except: pass
-    return None
+    """
+    (companies, locations) DataFrames; location text columns are categorical.
+    One copy per snapshot is shared by every session: treat it as read-only
+    (.copy() before modifying).
+    """
+    import pandas as pd
+    snap = get_snapshot()
+    if snap is None or not snap.has("companies") or not snap.has("locations"): return pd.DataFrame(), pd.DataFrame()
+    try: return _client_frames(snap, snap.version)
+    except Exception: return pd.DataFrame(), pd.DataFrame()
 
+@st.cache_resource(max_entries=1)
+def _client_directory(_snap, version):
+    telemetry.miss("data.get_client_directory")
+    return client_directory.ClientDirectory.from_snapshot(_snap)
+
+@telemetry.timed("data.get_client_directory", cached=True)
+def get_client_directory():
+    """Indexed company/site directory for the current snapshot (shared by all sessions)."""
+    snap = get_snapshot()
+    if snap is None or not snap.has("companies") or not snap.has("locations"): return client_directory.ClientDirectory([], {})
+    return _client_directory(snap, snap.version)
+
+@st.cache_resource(max_entries=1)
+def _zip_index(_snap, version):
+    telemetry.miss("data.get_zip_index")
+    return rate_index.ZipIndex.from_table(_snap.table("gsa_zip"))
+
+@telemetry.timed("data.get_zip_index", cached=True)
+def get_zip_index():
+    """Memory-mapped GSA ZIP index for the current snapshot."""
+    snap = get_snapshot()
+    if snap is None or not snap.has("gsa_zip"): return None
+    return _zip_index(snap, snap.version)
+
+@st.cache_resource(max_entries=1)
+def _gsa_calendar(_snap, version):
+    telemetry.miss("data.get_gsa_calendar")
+    return rate_index.RateCalendar.from_gsa_master(_snap.table("gsa_master"))
+
+@telemetry.timed("data.get_gsa_calendar", cached=True)
+def get_gsa_calendar():
+    """Daily GSA rate calendar (by destination ID) for the current snapshot, or None without the master rate file."""
+    snap = get_snapshot()
+    if snap is None or not snap.has("gsa_master"): return None
+    return _gsa_calendar(snap, snap.version)
+
+def _trip_average(rate, calendar, key, travel_date, return_date):
+    """Replaces a single-day rate's lodging / M&IE with the per-day average over travel_date..return_date."""
+    if rate is None or calendar is None or not return_date or not travel_date or return_date <= travel_date: return rate
+    avg = calendar.average(key, travel_date, return_date)
+    if avg is not None: rate.update(avg)
+    return rate
+
+@telemetry.timed("data.get_domestic_rate")
+def get_domestic_rate(zip_code, travel_date, return_date=None):
+    """GSA rate for a ZIP on travel_date; with return_date, the average daily rate over the trip (seasons included)."""
+    idx = get_zip_index()
+    if idx is None: return None
+    rate = idx.lookup(zip_code, travel_date.month)
+    if rate is None or not return_date: return rate
+    return _trip_average(rate, get_gsa_calendar(), idx.destination(zip_code), travel_date, return_date)
+
+@st.cache_resource(max_entries=1)
+def _intl_index(_snap, version):
+    telemetry.miss("data.get_intl_index")
+    return rate_index.IntlIndex.from_table(_snap.table("state_dept"))
+
+@telemetry.timed("data.get_intl_index", cached=True)
+def get_intl_index():
+    """Shared State Dept index for the current snapshot."""
+    snap = get_snapshot()
+    if snap is None or not snap.has("state_dept"): return None
+    return _intl_index(snap, snap.version)
+
+@st.cache_resource(max_entries=1)
+def _intl_calendar(_snap, version):
+    telemetry.miss("data.get_intl_calendar")
+    return rate_index.RateCalendar.from_intl(_intl_index(_snap, version))
+
+@telemetry.timed("data.get_intl_calendar", cached=True)
+def get_intl_calendar():
+    """Daily State Dept rate calendar (by (country, location)) for the current snapshot."""
+    snap = get_snapshot()
+    if snap is None or not snap.has("state_dept"): return None
+    return _intl_calendar(snap, snap.version)
+
+def trip_rate_calendar(zip_code=None, country=None, city=None):
+    """(RateCalendar, key) for a ZIP or a State Dept (country, city), or None: per-trip rates for scenario_sweep."""
+    if zip_code:
+        idx, cal = get_zip_index(), get_gsa_calendar()
+        key = idx.destination(zip_code) if idx is not None else None
+    else: cal, key = get_intl_calendar(), (country, city)
+    return (cal, key) if cal is not None and key in cal else None
+
+@telemetry.timed("data.get_international_options")
 def get_international_options(country_search):
-    path = os.path.join(DATA_DIR, "2026-01_Dept-of-State_PerDiem_PD.csv")
-    if not os.path.exists(path): return []
+    idx = get_intl_index()
+    if idx is None or not country_search: return []
+    return idx.options(country_search)
+
+@telemetry.timed("data.get_international_rate")
+def get_international_rate(country, city, travel_date=None, return_date=None):
+    """State Dept rate on travel_date; with return_date, the average daily rate over the trip."""
+    idx = get_intl_index()
+    if idx is None: return None
+    rate = idx.rate(country, city, travel_date)
+    if rate is None or not return_date: return rate
+    return _trip_average(rate, get_intl_calendar(), (country, city), travel_date, return_date)
+
+@st.cache_resource(max_entries=1)
+def _geo_index(_snap, version):
+    telemetry.miss("data.get_geo_index")
+    return geo.GeoIndex.from_snapshot(_snap)
+
+@telemetry.timed("data.get_geo_index", cached=True)
+def get_geo_index():
+    """Site/office distance index for the current snapshot (ZIP gazetteer + offices.csv, both optional)."""
+    snap = get_snapshot()
+    if snap is None: return geo.GeoIndex()
+    return _geo_index(snap, snap.version)
+
+def process_rss():
+    """Resident set size of this process in bytes (None where /proc is unavailable)."""
     try:
-        df = pd.read_csv(path)
-        matches = df[df['Country'].str.contains(country_search, case=False, na=False)]
-        if not matches.empty: return matches[['Country', 'Location']].drop_duplicates().to_dict('records')
-    except: pass
-    return []
-
-def get_international_rate(country, city):
-    path = os.path.join(DATA_DIR, "2026-01_Dept-of-State_PerDiem_PD.csv")
-    if not os.path.exists(path): return None
+        with open("/proc/self/statm", "rb") as f: return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError, IndexError): return None
+
+def memory_report():
+    """[{'Item', 'MB', 'Shared'}] for the Diagnostics panel: snapshot maps, shared client structures and process RSS."""
+    mb = lambda n: None if n is None else round(n / 1e6, 2)
+    rows = []; snap = get_snapshot()
+    if snap is not None:
+        rows.append({"Item": "Snapshot files (memory-mapped)", "MB": mb(snap.mapped_bytes()), "Shared": "all workers (page cache)"})
+        if snap.has("locations"):
+            rows.append({"Item": "  locations table", "MB": mb(snap.mapped_bytes("locations")), "Shared": "all workers (page cache)"})
+    cals = [c for c in (get_gsa_calendar(), get_intl_calendar()) if c is not None]
+    if cals: rows.append({"Item": f"Rate calendars ({sum(len(c) for c in cals)} locations)", "MB": mb(sum(c.nbytes for c in cals)), "Shared": "all sessions"})
+    rows.append({"Item": "Client directory", "MB": mb(get_client_directory().memory_bytes()), "Shared": "all sessions"})
+    comp, loc = load_client_db()
+    if len(loc): rows.append({"Item": "Client DataFrames", "MB": mb(int(comp.memory_usage(deep=True).sum() + loc.memory_usage(deep=True).sum())), "Shared": "all sessions"})
+    results = get_result_cache()
+    rows.append({"Item": f"Result cache ({len(results)} quotes; {results.stats['hits']} hits, {results.stats['disk_hits']} from disk, {results.stats['misses']} misses)",
+                 "MB": mb(results.used_bytes), "Shared": "all sessions (+ disk)" if results.disk_dir else "all sessions"})
+    rows.append({"Item": "Process RSS", "MB": mb(process_rss()), "Shared": ""})
+    return rows
+
+_warm_lock = threading.Lock()
+_warmed = set()  # Snapshot versions already warmed in this process
+
+PRICE_LIST_CHECK_S = 5     # Price_Lists re-checked at most this often (sync() re-imports only files whose mtime/size changed)
+_price_lists_checked = 0.0
+_price_list_sync = None    # Running sync thread, if any
+
+def _start_thread(work, name):
+    th = threading.Thread(target=work, name=name, daemon=True)
     try:
-        df = pd.read_csv(path)
-        match = df[(df['Country'] == country) & (df['Location'] == city)]
-        if not match.empty:
-            rec = match.iloc[0]
-            l_rate = float(rec['Lodging']); 
-            if l_rate == 0: l_rate = 150.0
-            return {"lodging": l_rate, "mie": float(rec['Meals & Incidentals']), "city": rec['Location'], "country": rec['Country']}
-    except: pass
-    return None
+        from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+        ctx = get_script_run_ctx(suppress_warning=True)
+        if ctx is not None: add_script_run_ctx(th, ctx)
+    except Exception: pass  # Older/newer Streamlit: the thread still works, only logs a context warning
+    th.start()
+    return th
+
+def sync_price_lists():
+    """
+    Syncs new / changed / removed vendor price lists in Shared_Data/Price_Lists
+    into the parts catalog on a daemon thread. The folder is re-checked at most
+    every PRICE_LIST_CHECK_S seconds, independent of the snapshot version, and
+    never while a previous sync is still running.
+    """
+    global _price_lists_checked, _price_list_sync
+    catalog = get_parts_catalog()
+    if catalog is None: return
+    with _warm_lock:
+        now = time.monotonic()
+        if now - _price_lists_checked < PRICE_LIST_CHECK_S or (_price_list_sync is not None and _price_list_sync.is_alive()): return
+        _price_lists_checked = now
+        _price_list_sync = _start_thread(lambda: catalog.sync(os.path.join(DATA_DIR, parts_catalog.PRICE_LIST_DIR)), "afp-price-lists")
+
+def start_warm_up():
+    """
+    Builds the deferred indexes (client search, State Dept, rate calendars) on a
+    daemon thread. Called once the page is drawn, so the first run does not wait
+    for them and they are ready before the first search / international lookup.
+    Runs once per snapshot version; changed price lists are picked up on every
+    call (see sync_price_lists).
+    """
+    sync_price_lists()
+    snap = get_snapshot(); version = snap.version if snap else "none"
+    with _warm_lock:
+        if version in _warmed: return
+        _warmed.add(version)
+    clients = get_client_directory()
+    def work():
+        clients.warm(); get_intl_index(); get_gsa_calendar(); get_intl_calendar()
+    _start_thread(work, "afp-warm-up")
+
+@st.cache_data
+def _load_holidays(path, mtime):
+    telemetry.miss("data.get_holidays")
+    return ingest.load_holidays(path)
+
+@telemetry.timed("data.get_holidays", cached=True)
+def get_holidays():
+    """
+    Optional non-working days from 'holidays.csv' (column 'date', YYYY-MM-DD).
+    Returns an empty set when the file is absent, which leaves schedules unchanged.
+    """
+    path = ingest.find_source(get_source_dirs(), ["holidays.csv"])
+    if not path: return frozenset()
+    return _load_holidays(path, os.path.getmtime(path))
+
+@st.cache_resource
+def _template_registry(template_dir):
+    telemetry.miss("data.get_template_registry")
+    return template_registry.TemplateRegistry(template_dir, logic.TEMPLATE_FIELDS)
+
+@telemetry.timed("data.get_template_registry", cached=True)
+def get_template_registry():
+    """
+    Shared T&C template registry for 'Shared_Data/Templates'. Files are read
+    once and re-read only when their mtime/size changes (folder re-listed at
+    most every 2 seconds).
+    """
+    return _template_registry(os.path.join(DATA_DIR, "Templates")).refresh()
+
+@st.cache_resource
+def get_quote_store():
+    """
+    Shared quote repository (SQLite, WAL) at Shared_Data/quotes.db, or the
+    AFP_QUOTE_DB path. None when the database cannot be opened (e.g. read-only share).
+    """
+    try: return quote_store.QuoteStore(os.environ.get("AFP_QUOTE_DB") or os.path.join(DATA_DIR, quote_store.DB_NAME))
+    except Exception: return None
+
+@st.cache_resource
+def get_parts_catalog():
+    """
+    Shared parts catalog (SQLite, WAL) at Shared_Data/parts_catalog.db, or the
+    AFP_PARTS_DB path; price lists in Shared_Data/Price_Lists are synced in the
+    background (sync_price_lists). None when the database cannot be opened.
+    """
+    try: return parts_catalog.PartsCatalog(os.environ.get("AFP_PARTS_DB") or os.path.join(DATA_DIR, parts_catalog.DB_NAME))
+    except Exception: return None
+
+@telemetry.timed("data.search_parts_catalog")
+def search_parts_catalog(text, limit=50):
+    catalog = get_parts_catalog()
+    if catalog is None or not text: return []
+    return catalog.search(text, limit)
+
+@st.cache_resource
+def get_result_cache():
+    """
+    Shared finished-quote cache (result_cache.py). Memory LRU plus a disk tier
+    in Shared_Data/_results, or the AFP_RESULT_CACHE folder; AFP_RESULT_CACHE=off
+    keeps it in memory only.
+    """
+    where = os.environ.get("AFP_RESULT_CACHE", "")
+    if where.lower() in ("0", "off", "false", "no"): return result_cache.ResultCache()
+    return result_cache.ResultCache(where or os.path.join(DATA_DIR, result_cache.RESULTS_DIR_NAME))
 
 def get_term_templates():
     """
-    Scans 'Shared_Data/Templates' for .md files.
-    Returns dict: {Filename (no ext): Content}
-    """
-    template_dir = os.path.join(DATA_DIR, "Templates")
-    templates = {}
-    
-    if not os.path.exists(template_dir):
-        return {"Error": "Templates folder missing in Shared_Data"}
-        
-    # Look for .md files
-    for file_path in glob.glob(os.path.join(template_dir, "*.md")):
-        file_name = os.path.splitext(os.path.basename(file_path))[0]
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                templates[file_name] = f.read()
-        except Exception as e:
-            templates[f"Error loading {file_name}"] = str(e)
-            
-    return templates
+    {Filename (no ext): Content} for the .md files in 'Shared_Data/Templates',
+    read from the cached template registry (see get_template_registry).
+    """
+    return get_template_registry().as_dict()
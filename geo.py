@@ -0,0 +1,198 @@
+# src/geo.py
+# ======================================================
+# AFP ESTIMATOR - GEO / DISTANCE MODULE
+# Version: v3.0
+# Updated: 2026-10-17
+# Description: Batch distance tools for travel planning. NumPy haversine
+#              and distance matrices over coordinate arrays, a k-d tree over
+#              geocoded client sites (ZIP centroids from a local gazetteer
+#              file), nearest-office lookup across AFP origin offices, and
+#              a FLY vs DRIVE suggestion using the Travel tab's mileage rule.
+#              Sources are optional snapshot tables (ingest.py: 'gazetteer',
+#              'offices'); without a gazetteer no site can be located.
+# ======================================================
+
+import heapq
+import numpy as np
+
+import rate_index
+
+EARTH_RADIUS_MI = 3958.8
+ROAD_FACTOR = 1.3           # Straight-line -> road miles
+MILES_BUFFER = 1.15         # Billable padding (Travel tab "Calc" rule)
+DRIVE_MPH = 50.0            # Travel tab: one-way hours = miles / 50
+DRIVE_MAX_HOURS = 8.0       # Longer one-way drives are suggested as FLY
+HQ_OFFICE = ("Omaha HQ", 41.209, -96.065)
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great-circle miles; arguments broadcast like NumPy arrays."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=np.float64)) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MI * np.arcsin(np.sqrt(np.minimum(1.0, a)))
+
+def distance_matrix(lat_a, lon_a, lat_b, lon_b, block=1024):
+    """(len(a), len(b)) great-circle miles, computed in row blocks to bound temporary memory."""
+    lat_a, lon_a = np.asarray(lat_a, dtype=np.float64), np.asarray(lon_a, dtype=np.float64)
+    lat_b, lon_b = np.asarray(lat_b, dtype=np.float64)[None, :], np.asarray(lon_b, dtype=np.float64)[None, :]
+    out = np.empty((len(lat_a), lat_b.shape[1]))
+    for i in range(0, len(lat_a), block):
+        out[i:i + block] = haversine(lat_a[i:i + block, None], lon_a[i:i + block, None], lat_b, lon_b)
+    return out
+
+def billable_miles(crow_miles):
+    """Straight-line miles -> billable road miles (same rule as the Travel tab 'Calc')."""
+    return np.floor(np.asarray(crow_miles) * ROAD_FACTOR * MILES_BUFFER)
+
+def suggest_mode(miles):
+    """'DRIVE' when the one-way drive fits in DRIVE_MAX_HOURS, else 'FLY'."""
+    return np.where(np.asarray(miles) / DRIVE_MPH <= DRIVE_MAX_HOURS, "DRIVE", "FLY")
+
+def _to_xyz(lat, lon):
+    lat, lon = np.radians(np.asarray(lat, dtype=np.float64)), np.radians(np.asarray(lon, dtype=np.float64))
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+def _chord_to_miles(chord):
+    return 2 * EARTH_RADIUS_MI * np.arcsin(np.minimum(1.0, np.asarray(chord) / 2))
+
+class KDTree:
+    """
+    k-d tree over points on the unit sphere (x, y, z), so straight-line chord
+    distance orders points exactly like great-circle distance. Leaves hold up
+    to leaf_size points and are scanned with NumPy; each node keeps its
+    bounding box for pruning.
+    """
+
+    def __init__(self, lat, lon, leaf_size=32):
+        self.xyz = _to_xyz(lat, lon).reshape(-1, 3)
+        self.idx = np.arange(len(self.xyz))
+        self.nodes = []              # (start, end, lo, hi, left, right); left/right = -1 for leaves
+        if len(self.xyz): self._build(0, len(self.xyz), leaf_size)
+
+    def __len__(self):
+        return len(self.xyz)
+
+    def _build(self, start, end, leaf_size):
+        pts = self.xyz[self.idx[start:end]]
+        node_id = len(self.nodes); self.nodes.append(None)
+        lo, hi = pts.min(axis=0), pts.max(axis=0)
+        if end - start <= leaf_size:
+            self.nodes[node_id] = (start, end, lo, hi, -1, -1); return node_id
+        dim = int(np.argmax(hi - lo)); mid = (start + end) // 2
+        order = np.argpartition(pts[:, dim], mid - start)
+        self.idx[start:end] = self.idx[start:end][order]
+        left = self._build(start, mid, leaf_size); right = self._build(mid, end, leaf_size)
+        self.nodes[node_id] = (start, end, lo, hi, left, right)
+        return node_id
+
+    @staticmethod
+    def _box_dist2(q, lo, hi):
+        d = np.maximum(0.0, np.maximum(lo - q, q - hi))
+        return float(d @ d)
+
+    def query(self, lat, lon, k=1):
+        """k nearest points to one location: (miles, indices), nearest first."""
+        if not len(self): return np.zeros(0), np.zeros(0, dtype=int)
+        q = _to_xyz(lat, lon); best = []          # max-heap of (-dist2, index)
+        stack = [(0.0, 0)]
+        while stack:
+            bound, node_id = heapq.heappop(stack)
+            if len(best) == k and bound > -best[0][0]: break
+            start, end, lo, hi, left, right = self.nodes[node_id]
+            if left < 0:
+                ids = self.idx[start:end]; diff = self.xyz[ids] - q; d2 = np.einsum('ij,ij->i', diff, diff)
+                for dist2, i in zip(d2.tolist(), ids.tolist()):
+                    if len(best) < k: heapq.heappush(best, (-dist2, i))
+                    elif dist2 < -best[0][0]: heapq.heapreplace(best, (-dist2, i))
+                continue
+            for child in (left, right):
+                c = self.nodes[child]; heapq.heappush(stack, (self._box_dist2(q, c[2], c[3]), child))
+        best.sort(key=lambda x: -x[0])
+        return _chord_to_miles(np.sqrt([-d for d, _ in best])), np.array([i for _, i in best], dtype=int)
+
+    def query_radius(self, lat, lon, miles):
+        """All points within `miles` of one location: (miles, indices), nearest first."""
+        if not len(self): return np.zeros(0), np.zeros(0, dtype=int)
+        q = _to_xyz(lat, lon); r2 = (2 * np.sin(min(miles / EARTH_RADIUS_MI, np.pi) / 2)) ** 2
+        hits = []; stack = [0]
+        while stack:
+            start, end, lo, hi, left, right = self.nodes[stack.pop()]
+            if self._box_dist2(q, lo, hi) > r2: continue
+            if left < 0:
+                ids = self.idx[start:end]; diff = self.xyz[ids] - q; d2 = np.einsum('ij,ij->i', diff, diff)
+                hits.append((d2[d2 <= r2], ids[d2 <= r2]))
+            else: stack += [left, right]
+        if not hits: return np.zeros(0), np.zeros(0, dtype=int)
+        d2 = np.concatenate([h[0] for h in hits]); ids = np.concatenate([h[1] for h in hits]); order = np.argsort(d2)
+        return _chord_to_miles(np.sqrt(d2[order])), ids[order]
+
+class GeoIndex:
+    """
+    locate(zip):          (lat, lon) of a ZIP centroid, or None
+    nearest_office(...):  (office name, straight-line miles) for points (vectorized)
+    plan(zip):            nearest office, billable miles, drive hours and FLY/DRIVE suggestion
+    nearby_sites(...):    client sites within a radius (k-d tree over geocoded locations)
+    """
+
+    def __init__(self, lat_table=None, lon_table=None, offices=None, sites=None):
+        self.lat_table = lat_table; self.lon_table = lon_table
+        self.offices = []
+        for name, lat, lon, zip_code in (offices or []):
+            if np.isnan(lat) or np.isnan(lon):
+                loc = self.locate(zip_code)
+                if loc is None: continue
+                lat, lon = loc
+            self.offices.append((name, float(lat), float(lon)))
+        if not self.offices: self.offices = [HQ_OFFICE]
+        self._off_lat = np.array([o[1] for o in self.offices]); self._off_lon = np.array([o[2] for o in self.offices])
+
+        # Client sites: (company, site) records whose ZIP has a centroid
+        self.sites = []; lat, lon = [], []
+        for company, site, zip_code in (sites or []):
+            loc = self.locate(zip_code)
+            if loc is None: continue
+            self.sites.append((company, site)); lat.append(loc[0]); lon.append(loc[1])
+        self.site_tree = KDTree(lat, lon)
+
+    @classmethod
+    def from_snapshot(cls, snap):
+        lat = lon = None; offices = None; sites = None
+        if snap.has("gazetteer"):
+            g = snap.table("gazetteer"); lat, lon = g['lat'], g['lon']
+            if snap.has("locations"):
+                loc = snap.table("locations"); sites = zip(loc['company_name'].tolist(), loc['site_name'].tolist(), loc['zip'].tolist())
+        if snap.has("offices"):
+            o = snap.table("offices"); offices = zip(o['name'].tolist(), o['lat'].tolist(), o['lon'].tolist(), o['zip'].tolist())
+        return cls(lat, lon, offices, sites)
+
+    @property
+    def has_gazetteer(self):
+        return self.lat_table is not None
+
+    def locate(self, zip_code):
+        if self.lat_table is None: return None
+        slot = rate_index.normalize_zip(zip_code)
+        if slot is None: return None
+        lat, lon = float(self.lat_table[slot]), float(self.lon_table[slot])
+        if np.isnan(lat) or np.isnan(lon): return None
+        return lat, lon
+
+    def nearest_office(self, lat, lon):
+        """Nearest origin office for one point or arrays of points: (names, straight-line miles)."""
+        d = distance_matrix(np.atleast_1d(lat), np.atleast_1d(lon), self._off_lat, self._off_lon)
+        i = d.argmin(axis=1); miles = d[np.arange(len(i)), i]
+        names = np.array([o[0] for o in self.offices], dtype=object)[i]
+        if np.ndim(lat) == 0: return names[0], float(miles[0])
+        return names, miles
+
+    def plan(self, zip_code):
+        """{'lat', 'lon', 'office', 'miles', 'drive_hours', 'suggest'} for a site ZIP, or None if it cannot be located."""
+        loc = self.locate(zip_code)
+        if loc is None: return None
+        office, crow = self.nearest_office(*loc)
+        miles = float(billable_miles(crow))
+        return {"lat": loc[0], "lon": loc[1], "office": office, "miles": miles, "drive_hours": miles / DRIVE_MPH, "suggest": str(suggest_mode(miles))}
+
+    def nearby_sites(self, lat, lon, radius_miles=150.0, limit=25):
+        """[(company, site, miles)] within radius_miles, nearest first."""
+        miles, ids = self.site_tree.query_radius(lat, lon, radius_miles)
+        return [(*self.sites[i], float(m)) for m, i in zip(miles[:limit], ids[:limit])]
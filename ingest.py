@@ -0,0 +1,376 @@
+# src/ingest.py
+# ======================================================
+# AFP ESTIMATOR - DATA INGEST MODULE
+# Version: v3.0
+# Updated: 2026-10-17
+# Description: Compiles the Shared_Data rate and client sources (csv/xlsx)
+#              into a versioned, columnar snapshot of .npy arrays plus a
+#              manifest (sha256 + mtime per source). The app maps the
+#              snapshot at startup instead of parsing CSV/Excel, and only
+#              sources whose files changed are recompiled. Repetitive
+#              text columns (client locations) are stored dictionary-encoded:
+#              small integer codes plus one copy of each distinct string.
+#
+# Usage:       python ingest.py [--data-dir DIR ...] [--force]
+# ======================================================
+
+import os
+import sys
+import csv
+import json
+import shutil
+import hashlib
+import datetime
+import argparse
+import numpy as np
+
+import rate_index
+
+SNAPSHOT_SCHEMA = 2          # 2: dictionary-encoded location columns
+SNAPSHOT_DIR_NAME = "_index"
+MANIFEST_NAME = "manifest.json"
+CATEGORIES_SUFFIX = "__categories"   # '<col>__categories.npy' holds the distinct strings of a coded '<col>.npy'
+
+# --- SOURCE READERS ---
+
+def iter_rows(path, header_key=None, columns=None):
+    """
+    Yields dict rows from a .csv or .xlsx file without pandas.
+    header_key: first-cell value of the header row, for files with title rows above it.
+    columns:    lowercase header names to keep; rows then only carry those
+                (lowercased) keys, so wide files don't build a dict of every cell.
+    """
+    if path.lower().endswith(".csv"):
+        f = open(path, "r", encoding="utf-8-sig", errors="replace", newline="")
+        rows = csv.reader(f)
+    elif path.lower().endswith((".txt", ".tsv")):  # Tab-delimited (Census gazetteer files)
+        f = open(path, "r", encoding="utf-8-sig", errors="replace", newline="")
+        rows = csv.reader(f, delimiter="\t")
+    else:
+        import openpyxl
+        wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        f = wb; rows = wb.worksheets[0].iter_rows(values_only=True)
+    try:
+        header = None
+        for values in rows:
+            if header is None:
+                cells = ["" if v is None else str(v).strip() for v in values]
+                if header_key is None or (cells and cells[0] == header_key):
+                    header = cells
+                    if columns is not None: keep = [(i, h.lower()) for i, h in enumerate(header) if h.lower() in columns]
+                continue
+            if columns is None: yield dict(zip(header, values))
+            else: n = len(values); yield {k: values[i] for i, k in keep if i < n}
+    finally: f.close()
+
+def to_int(val, default=0):
+    """'$ 126' / 126.0 / '' -> int (or default)."""
+    try: return int(round(float(str(val).replace('$', '').replace(',', '').strip())))
+    except (TypeError, ValueError): return default
+
+def _text(val):
+    return "" if val is None else str(val).strip()
+
+def _str_array(values):
+    """Fixed-width unicode array (mmap-able); never zero-width."""
+    arr = np.asarray(values, dtype=str)
+    return arr if arr.dtype.itemsize else arr.astype('<U1')
+
+def _categorical(values):
+    """Dictionary encoding: (codes, sorted distinct strings) with the narrowest unsigned code type."""
+    categories, codes = np.unique(_str_array(values), return_inverse=True)
+    dtype = np.uint8 if len(categories) <= 1 << 8 else np.uint16 if len(categories) <= 1 << 16 else np.uint32
+    return codes.reshape(-1).astype(dtype), categories
+
+# --- COMPILERS (one per source; each returns {column: ndarray}) ---
+
+def compile_gsa_zip(path):
+    """Dense 100k-slot ZIP table + UTF-8 city-name blob (see rate_index.ZIP_DTYPE). First row wins per ZIP."""
+    table = np.zeros(rate_index.ZIP_SLOTS, dtype=rate_index.ZIP_DTYPE)
+    names = bytearray(); name_pos = {}
+    for row in iter_rows(path):
+        slot = rate_index.normalize_zip(row.get('Zip', ''))
+        if slot is None or table['valid'][slot]: continue
+        name = _text(row.get('Name'))
+        if name not in name_pos:
+            raw = name.encode('utf-8'); name_pos[name] = (len(names), len(raw)); names += raw
+        rec = table[slot]
+        rec['valid'] = 1
+        rec['dest_id'] = to_int(row.get('DestinationID'), 0)
+        rec['lodging'] = [to_int(row.get(m), 110) for m in rate_index.MONTHS]
+        rec['mie'] = to_int(row.get('Meals'), 68)
+        rec['name_off'], rec['name_len'] = name_pos[name]
+    return {"records": table, "names": np.frombuffer(bytes(names), dtype=np.uint8)}
+
+def compile_gsa_master(path):
+    """GSA master rates by destination and season (ID 0 = standard CONUS rate)."""
+    cols = {k: [] for k in ("id", "state", "destination", "county", "season_begin", "season_end", "lodging", "mie")}
+    for row in iter_rows(path, header_key="ID"):
+        keys = list(row.keys())
+        lodging_key = next((k for k in keys if 'Lodging' in k), None); mie_key = next((k for k in keys if 'M&IE' in k), None)
+        if not lodging_key or not _text(row.get(lodging_key)): continue
+        cols["id"].append(to_int(row.get('ID'), 0)); cols["state"].append(_text(row.get('STATE')))
+        cols["destination"].append(_text(row.get('DESTINATION'))); cols["county"].append(_text(row.get('COUNTY/LOCATION DEFINED')))
+        cols["season_begin"].append(_text(row.get('SEASON BEGIN'))); cols["season_end"].append(_text(row.get('SEASON END')))
+        cols["lodging"].append(to_int(row.get(lodging_key), 110)); cols["mie"].append(to_int(row.get(mie_key), 68))
+    out = {k: _str_array(v) for k, v in cols.items() if k not in ("id", "lodging", "mie")}
+    out.update({"id": np.asarray(cols["id"], dtype='<i4'), "lodging": np.asarray(cols["lodging"], dtype='<u2'), "mie": np.asarray(cols["mie"], dtype='<u2')})
+    return out
+
+STATE_COLUMNS = {'Country': 'country', 'Location': 'location', 'Season Start Date': 'season_start', 'Season End Date': 'season_end'}
+
+def compile_state_dept(path):
+    """State Dept per diem rows (one per location season)."""
+    cols = {v: [] for v in STATE_COLUMNS.values()}; lodging = []; mie = []
+    for row in iter_rows(path):
+        if not _text(row.get('Country')): continue
+        for src, dst in STATE_COLUMNS.items(): cols[dst].append(_text(row.get(src)))
+        lodging.append(to_int(row.get('Lodging'), 0)); mie.append(to_int(row.get('Meals & Incidentals'), 0))
+    out = {k: _str_array(v) for k, v in cols.items()}
+    out.update({"lodging": np.asarray(lodging, dtype='<u2'), "mie": np.asarray(mie, dtype='<u2')})
+    return out
+
+def compile_companies(path):
+    names = []
+    for row in iter_rows(path, columns={'name'}): names.append(_text(row.get('name')))
+    return {"company_name": _str_array(names)}
+
+LOCATION_COLUMNS = {'company': 'company_name', 'location_name': 'site_name', 'street': 'street', 'city': 'city', 'state': 'state', 'postalcode': 'zip'}
+
+def compile_locations(path):
+    """Location columns, dictionary-encoded (company, city, state and zip repeat across many rows)."""
+    cols = {v: [] for v in LOCATION_COLUMNS.values()}
+    for row in iter_rows(path, columns=set(LOCATION_COLUMNS)):
+        for src, dst in LOCATION_COLUMNS.items(): cols[dst].append(_text(row.get(src)))
+    out = {}
+    for k, v in cols.items(): out[k], out[k + CATEGORIES_SUFFIX] = _categorical(v)
+    return out
+
+def _to_float(val):
+    try: return float(str(val).strip())
+    except (TypeError, ValueError): return float('nan')
+
+def _first(row, keys):
+    for k in keys:
+        if row.get(k) not in (None, ""): return row[k]
+    return None
+
+def compile_gazetteer(path):
+    """ZIP centroids (Census ZCTA gazetteer or a zip,lat,lon CSV) as dense lat/lon arrays indexed by ZIP (NaN = unknown)."""
+    lat = np.full(rate_index.ZIP_SLOTS, np.nan, dtype=np.float32); lon = lat.copy()
+    for row in iter_rows(path):
+        row = {str(k).lower().strip(): v for k, v in row.items()}
+        slot = rate_index.normalize_zip(_first(row, ('geoid', 'zcta5', 'zip', 'zipcode', 'zip_code')) or "")
+        if slot is None: continue
+        lat[slot] = _to_float(_first(row, ('intptlat', 'lat', 'latitude')))
+        lon[slot] = _to_float(_first(row, ('intptlong', 'lon', 'lng', 'longitude')))
+    return {"lat": lat, "lon": lon}
+
+def compile_offices(path):
+    """AFP origin offices: name plus lat/lon (or a ZIP, resolved against the gazetteer at load time)."""
+    cols = {"name": [], "lat": [], "lon": [], "zip": []}
+    for row in iter_rows(path):
+        row = {str(k).lower().strip(): v for k, v in row.items()}
+        name = _text(_first(row, ('name', 'office')))
+        if not name: continue
+        cols["name"].append(name); cols["zip"].append(_text(_first(row, ('zip', 'postalcode'))))
+        cols["lat"].append(_to_float(_first(row, ('lat', 'latitude')))); cols["lon"].append(_to_float(_first(row, ('lon', 'lng', 'longitude'))))
+    return {"name": _str_array(cols["name"]), "zip": _str_array(cols["zip"]), "lat": np.array(cols["lat"], dtype=np.float64), "lon": np.array(cols["lon"], dtype=np.float64)}
+
+# Source name -> (candidate file names in preference order, compiler)
+SOURCES = {
+    "gsa_zip": (["FY2026_GSA_ZipCodeFile.csv", "FY2026_GSA_ZipCodeFile.xlsx"], compile_gsa_zip),
+    "gsa_master": (["FY2026_GSA_PerDiemMasterRatesFile.csv", "FY2026_GSA_PerDiemMasterRatesFile.xlsx"], compile_gsa_master),
+    "state_dept": (["2026-01_Dept-of-State_PerDiem_PD.csv"], compile_state_dept),
+    "companies": (["companies.csv"], compile_companies),
+    "locations": (["locations.csv"], compile_locations),
+    # Optional: enable site distances / nearest office (see geo.py)
+    "gazetteer": (["zip_gazetteer.csv", "2024_Gaz_zcta_national.txt", "2023_Gaz_zcta_national.txt"], compile_gazetteer),
+    "offices": (["offices.csv"], compile_offices),
+}
+
+# --- SNAPSHOT BUILD ---
+
+def find_source(search_dirs, file_names):
+    for folder in search_dirs:
+        for name in file_names:
+            path = os.path.join(folder, name)
+            if os.path.exists(path): return path
+    return None
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""): h.update(chunk)
+    return h.hexdigest()
+
+def read_manifest(index_dir):
+    try:
+        with open(os.path.join(index_dir, MANIFEST_NAME), "r", encoding="utf-8") as f: man = json.load(f)
+        if man.get("schema") == SNAPSHOT_SCHEMA: return man
+    except (OSError, ValueError): pass
+    return {"schema": SNAPSHOT_SCHEMA, "sources": {}}
+
+def _write_json_atomic(path, obj):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f: json.dump(obj, f, indent=2)
+    os.replace(tmp, path)
+
+def _write_columns(index_dir, name, sha, columns):
+    """Writes one .npy per column into '<name>-<sha12>-s<schema>/' (content-addressed, so readers of an older copy are unaffected)."""
+    final = os.path.join(index_dir, f"{name}-{sha[:12]}-s{SNAPSHOT_SCHEMA}")
+    if os.path.isdir(final): return os.path.basename(final)
+    tmp = f"{final}.{os.getpid()}.tmp"
+    os.makedirs(tmp, exist_ok=True)
+    for col, arr in columns.items(): np.save(os.path.join(tmp, f"{col}.npy"), arr, allow_pickle=False)
+    try: os.rename(tmp, final)
+    except OSError: shutil.rmtree(tmp, ignore_errors=True)  # Another process won the race with identical content
+    return os.path.basename(final)
+
+def refresh(search_dirs, index_dir, force=False, log=None):
+    """
+    Brings the snapshot up to date and returns the manifest.
+    A source is recompiled only when its size/mtime changed AND its sha256
+    differs from the manifest (a touched-but-identical file just updates the mtime).
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    man = read_manifest(index_dir); changed = False
+    for name, (file_names, compiler) in SOURCES.items():
+        path = find_source(search_dirs, file_names)
+        entry = man["sources"].get(name)
+        if path is None:
+            if entry: del man["sources"][name]; changed = True
+            continue
+        st_ = os.stat(path)
+        dir_ok = entry and os.path.isdir(os.path.join(index_dir, entry.get("dir", "")))
+        if not force and dir_ok and entry["path"] == os.path.abspath(path) and entry["mtime"] == st_.st_mtime and entry["size"] == st_.st_size: continue
+        sha = file_sha256(path)
+        if not force and dir_ok and entry["sha256"] == sha:
+            entry.update({"path": os.path.abspath(path), "mtime": st_.st_mtime, "size": st_.st_size}); changed = True
+            continue
+        if log: log(f"Compiling {name} from {os.path.basename(path)}")
+        columns = compiler(path)
+        rows = len(next(v for k, v in columns.items() if not k.endswith(CATEGORIES_SUFFIX))) if columns else 0
+        man["sources"][name] = {
+            "path": os.path.abspath(path), "sha256": sha, "mtime": st_.st_mtime, "size": st_.st_size,
+            "dir": _write_columns(index_dir, name, sha, columns), "columns": sorted(columns), "rows": rows,
+            "built": datetime.datetime.now().isoformat(timespec="seconds"),
+        }
+        changed = True
+    if changed:
+        man["version"] = hashlib.sha256("|".join(f"{k}:{v['sha256']}" for k, v in sorted(man["sources"].items())).encode()).hexdigest()[:16]
+        _write_json_atomic(os.path.join(index_dir, MANIFEST_NAME), man)
+        _prune(index_dir, man)
+    man.setdefault("version", "empty")
+    return man
+
+def _prune(index_dir, man):
+    """Removes column folders no longer referenced (best effort; mapped files may be locked on Windows)."""
+    live = {e["dir"] for e in man["sources"].values()}
+    for entry in os.listdir(index_dir):
+        full = os.path.join(index_dir, entry)
+        if os.path.isdir(full) and entry not in live and not entry.endswith(".tmp"):
+            shutil.rmtree(full, ignore_errors=True)
+
+# --- LOADER ---
+
+class CategoricalColumn:
+    """
+    Read-only dictionary-encoded string column (codes + categories, both
+    memory-mapped). tolist() hands out one interned str object per distinct
+    value, so every consumer of the column shares the same strings.
+    """
+
+    def __init__(self, codes, categories):
+        self.codes = codes; self.categories = categories; self._values = None
+
+    @property
+    def values(self):
+        """Distinct strings as a tuple of interned str (built once)."""
+        if self._values is None: self._values = tuple(sys.intern(v) for v in self.categories.tolist())
+        return self._values
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.categories.nbytes
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, i):
+        return self.values[self.codes[i]]
+
+    def tolist(self):
+        v = self.values
+        return [v[c] for c in self.codes.tolist()]
+
+    def __array__(self, dtype=None, copy=None):
+        return self.categories[self.codes] if dtype is None else self.categories[self.codes].astype(dtype)
+
+class Snapshot:
+    """Memory-mapped view of a compiled snapshot. `version` changes whenever any source content changes."""
+
+    def __init__(self, index_dir, manifest):
+        self.index_dir = index_dir
+        self.manifest = manifest
+        self.version = manifest.get("version", "empty")
+        self._tables = {}
+
+    def has(self, name):
+        return name in self.manifest["sources"]
+
+    def table(self, name):
+        """{column: read-only ndarray or CategoricalColumn} for a source, or None if it was not found at ingest time."""
+        if name in self._tables: return self._tables[name]
+        entry = self.manifest["sources"].get(name)
+        if entry is None: return None
+        folder = os.path.join(self.index_dir, entry["dir"])
+        cols = {c: np.load(os.path.join(folder, f"{c}.npy"), mmap_mode='r', allow_pickle=False) for c in entry["columns"]}
+        for c in [c for c in cols if c + CATEGORIES_SUFFIX in cols]: cols[c] = CategoricalColumn(cols[c], cols.pop(c + CATEGORIES_SUFFIX))
+        self._tables[name] = cols
+        return cols
+
+    def source_version(self, *names):
+        """Short hash of the named sources' content (changes only when one of those files changes)."""
+        src = self.manifest["sources"]
+        return hashlib.sha256("|".join(f"{n}:{src[n]['sha256'] if n in src else '-'}" for n in names).encode()).hexdigest()[:16]
+
+    def mapped_bytes(self, name=None):
+        """On-disk (page-cache, shared by every process mapping it) size of one table or the whole snapshot."""
+        total = 0
+        for src, entry in self.manifest["sources"].items():
+            if name is not None and src != name: continue
+            folder = os.path.join(self.index_dir, entry["dir"])
+            total += sum(os.path.getsize(os.path.join(folder, f"{c}.npy")) for c in entry["columns"] if os.path.exists(os.path.join(folder, f"{c}.npy")))
+        return total
+
+def load_snapshot(search_dirs, index_dir):
+    """Refreshes changed sources (if any) and maps the snapshot."""
+    return Snapshot(index_dir, refresh(search_dirs, index_dir))
+
+def default_source_dirs():
+    """The Shared_Data folders next to this script, for callers without Streamlit (CLI, batch jobs)."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    return [d for d in (os.path.join(here, "Shared_Data_WebApp Modular"), os.path.join(here, "Shared_Data")) if os.path.isdir(d)]
+
+def load_holidays(path):
+    """Non-working days from a CSV/XLSX with a 'date' column (YYYY-MM-DD); bad rows are skipped."""
+    days = set()
+    for row in iter_rows(path):
+        row = {str(k).lower().strip(): v for k, v in row.items()}
+        try: days.add(datetime.date.fromisoformat(str(row.get('date', '')).strip()[:10]))
+        except ValueError: pass
+    return frozenset(days)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Compile Shared_Data sources into the binary rate snapshot.")
+    ap.add_argument("--data-dir", action="append", help="Source folder (repeatable). Defaults to the Shared_Data folders next to this script.")
+    ap.add_argument("--index-dir", help="Snapshot folder (default: <first data dir>/_index)")
+    ap.add_argument("--force", action="store_true", help="Recompile every source")
+    args = ap.parse_args()
+    dirs = args.data_dir or default_source_dirs()
+    index_dir = args.index_dir or os.path.join(dirs[0], SNAPSHOT_DIR_NAME)
+    man = refresh(dirs, index_dir, force=args.force, log=print)
+    snap = Snapshot(index_dir, man)
+    print(f"Snapshot {man['version']} -> {index_dir}  ({snap.mapped_bytes() / 1e6:.2f} MB)")
+    for name, e in sorted(man["sources"].items()): print(f"  {name:<12} {e['rows']:>7} rows  {snap.mapped_bytes(name) / 1e6:>7.2f} MB  {e['sha256'][:12]}  {os.path.basename(e['path'])}")
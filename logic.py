@@ -8,6 +8,8 @@
 
 import math
 import datetime
+import functools
+import numpy as np
 
 def smart_round(val):
     """Rounds up to the nearest $10 increment."""
@@ -18,86 +20,160 @@ def calculate_travel_billable(one_way_hours):
     if one_way_hours <= 8.0: return 8.0
     else: return math.ceil(one_way_hours / 2.0) * 2.0
 
+# --- PARTS PRICING (Rational Decay Curve) ---
+FREIGHT_BURDEN = 1.035
+PRICING_BASE_YEAR = 2025
+ANNUAL_INFLATION = 1.05
+# Tier -> (pivot at base year, markup floor, markup ceiling)
+TIER_CURVES = {
+    "Key Account (AERO/MPWA)": (200.0, 1.539, 2.0),
+    "Preferred": (100.0, 1.60, 3.5),
+    "Standard": (70.0, 1.67, 4.0),
+}
+
+@functools.lru_cache(maxsize=32)
+def get_tier_curve(tier, year):
+    """(pivot, floor, ceiling) for a tier, with the pivot inflated to the given year."""
+    pivot, floor, ceiling = TIER_CURVES.get(tier, TIER_CURVES["Standard"])
+    inflation_factor = ANNUAL_INFLATION ** max(0, year - PRICING_BASE_YEAR)
+    return pivot * inflation_factor, floor, ceiling
+
 def calculate_part_price(vendor_cost, tier="Standard"):
     if vendor_cost <= 0: return 0.0, 0.0
-    landed_cost = vendor_cost * 1.035
-    base_year = 2025
-    current_year = datetime.date.today().year
-    years_passed = max(0, current_year - base_year)
-    inflation_factor = 1.05 ** years_passed
-    
-    if tier == "Key Account (AERO/MPWA)":
-        pivot = 200.0 * inflation_factor; floor, ceiling = 1.539, 2.0
-    elif tier == "Preferred":
-        pivot = 100.0 * inflation_factor; floor, ceiling = 1.60, 3.5
-    else:
-        pivot = 70.0 * inflation_factor; floor, ceiling = 1.67, 4.0
-        
+    landed_cost = vendor_cost * FREIGHT_BURDEN
+    pivot, floor, ceiling = get_tier_curve(tier, datetime.date.today().year)
     markup = floor + (ceiling - floor) / (1 + (landed_cost / pivot))
     sell_price = landed_cost * markup
     return sell_price, markup
 
+def price_parts_batch(vendor_costs, qtys=None, tier="Standard", year=None):
+    """
+    Vectorized calculate_part_price over a whole parts table or vendor price list.
+    Returns dict of NumPy arrays: 'sell' (rounded to cents, as quoted), 'markup',
+    'total' (sell * qty; qty defaults to 1). Non-positive costs price at 0.
+    """
+    cost = np.nan_to_num(np.asarray(vendor_costs, dtype=float))
+    qty = np.ones_like(cost) if qtys is None else np.nan_to_num(np.asarray(qtys, dtype=float))
+    pivot, floor, ceiling = get_tier_curve(tier, year or datetime.date.today().year)
+    landed = cost * FREIGHT_BURDEN
+    valid = cost > 0
+    markup = np.where(valid, floor + (ceiling - floor) / (1 + landed / pivot), 0.0)
+    sell = np.round(landed * markup, 2)
+    return {"sell": sell, "markup": markup, "total": sell * qty}
+
+# --- MINIMUM BILLING VALUE ---
+MBV_INTL_RATE = 160.00
+MBV_INTL_HOURS = 100.0
+MBV_DOMESTIC_HOURS = 50.0
+
+def mbv_target(region, rate_rt):
+    """Minimum labor value for a quote: 100 hrs @ $160 international, 50 hrs @ the RT rate domestic."""
+    if region == "INTERNATIONAL": return MBV_INTL_RATE * MBV_INTL_HOURS
+    return rate_rt * MBV_DOMESTIC_HOURS
+
+# --- T&C TEMPLATE CONTEXT ---
+# Placeholders available to Templates/*.md ({rate_rt:.2f}, {mbv_domestic:,.2f}, ...).
+TEMPLATE_FIELDS = ('rate_rt', 'rate_ot', 'rate_dt', 'rate_rt_night', 'mbv_domestic', 'mbv_intl',
+                   'rate_rt_intl', 'rate_ot_intl', 'rate_dt_intl', 'rate_nt_intl', 'payment_terms', 'validity')
+
+def build_template_context(rate_rt, rate_ot, rate_dt, payment_terms, validity):
+    """Live-rate values for the T&C template placeholders (keys = TEMPLATE_FIELDS)."""
+    return {
+        'rate_rt': rate_rt, 'rate_ot': rate_ot, 'rate_dt': rate_dt, 'rate_rt_night': rate_rt * 1.2,
+        # Minimum Billing Values
+        'mbv_domestic': mbv_target("DOMESTIC", rate_rt), 'mbv_intl': mbv_target("INTERNATIONAL", rate_rt),
+        # International equivalents (fixed intl RT; NT/OT/DT multipliers as domestic)
+        'rate_rt_intl': MBV_INTL_RATE, 'rate_ot_intl': MBV_INTL_RATE * 1.5, 'rate_dt_intl': MBV_INTL_RATE * 2.0, 'rate_nt_intl': MBV_INTL_RATE * 1.2,
+        'payment_terms': payment_terms, 'validity': validity,
+    }
+
 def haversine(lat1, lon1, lat2, lon2):
     R = 3958.8 
     dlat, dlon = math.radians(lat2 - lat1), math.radians(lon2 - lon1)
     a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2)**2
     return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
 
-def calculate_onsite_duration(start_date, work_days, sat, sun):
+# --- SCHEDULE ENGINE ---
+# Jobs are walked one Mon-Sun calendar week at a time. Runs of whole,
+# holiday-free weeks are skipped arithmetically, so cost grows with the
+# number of holiday weeks rather than job length, and there is no day cap.
+
+def _is_work_day(day, sat, sun, holidays):
+    wd = day.weekday()
+    if (wd == 5 and not sat) or (wd == 6 and not sun): return False
+    return day not in holidays
+
+def schedule_profile(start_date, work_days, sat, sun, holidays=None):
     """
-    Calculates calendar duration for N working days, skipping unauthorized weekends.
+    Lays N working days onto the calendar from start_date, skipping unauthorized
+    weekends and holidays. Returns (runs, calendar_days) where runs is a list of
+    (weekdays, saturdays, sundays, n_weeks): worked-day counts for one calendar
+    week, repeated n_weeks times, in job order.
     """
-    curr = start_date
-    worked = 0
-    calendar_days = 0
-    # Guardrail: Limit loop to avoid hangs
-    for _ in range(365):
-        if worked >= work_days: break
-        
-        is_work = True
-        if (curr.weekday() == 5 and not sat) or (curr.weekday() == 6 and not sun): 
-            is_work = False
-            
-        if is_work: worked += 1
-        calendar_days += 1
-        curr += datetime.timedelta(days=1)
-        
-    return calendar_days
-
-def simulate_schedule(start_date, work_days, hrs_day, sat, sun, rules, is_key_account):
-    curr = start_date
-    worked = 0
-    sub_days = 0
-    weekly_hours = 0.0
-    bucket = {"RT": 0.0, "OT": 0.0, "DT": 0.0}
-    cap = rules.get('cap_rt_weekly', 40)
-    
-    for _ in range(365):
-        if worked >= work_days: break
-        if not is_key_account and curr.weekday() == 0: weekly_hours = 0.0
-        is_work = True
-        if (curr.weekday() == 5 and not sat) or (curr.weekday() == 6 and not sun): is_work = False
-        sub_days += 1
-        
-        if is_work:
-            worked += 1
-            d_rt, d_ot, d_dt = 0.0, 0.0, 0.0
-            if curr.weekday() == 6: d_dt = hrs_day
-            elif curr.weekday() == 5: d_ot = hrs_day
-            else:
-                rt_pot = min(10, hrs_day)
-                ot_pot = max(0, hrs_day - 10)
-                if weekly_hours >= cap: d_ot += rt_pot + ot_pot
-                elif (weekly_hours + rt_pot) > cap:
-                    avail_rt = max(0, cap - weekly_hours)
-                    d_rt = avail_rt
-                    d_ot = ot_pot + (rt_pot - avail_rt)
-                    weekly_hours += avail_rt
-                else:
-                    d_rt = rt_pot; d_ot = ot_pot; weekly_hours += rt_pot
-            bucket["RT"] += d_rt; bucket["OT"] += d_ot; bucket["DT"] += d_dt
-        curr += datetime.timedelta(days=1)
-    return bucket, sub_days
+    remaining = math.ceil(work_days) if work_days > 0 else 0
+    hol = sorted(h for h in (holidays or ()) if h >= start_date); hol_set = set(hol)
+    per_week = 5 + bool(sat) + bool(sun)
+    runs = []; curr = start_date; calendar_days = 0; hi = 0
+    one_day = datetime.timedelta(days=1)
+    while remaining > 0:
+        while hi < len(hol) and hol[hi] < curr: hi += 1
+        if curr.weekday() == 0:
+            # Whole weeks before the next holiday; the last (possibly partial) week is walked below.
+            free = (hol[hi] - curr).days // 7 if hi < len(hol) else remaining
+            full = min(free, (remaining - 1) // per_week)
+            if full > 0:
+                runs.append((5, int(bool(sat)), int(bool(sun)), full))
+                calendar_days += 7 * full; remaining -= full * per_week
+                curr += datetime.timedelta(days=7 * full)
+                continue
+        wd = sa = su = 0
+        while True:
+            if _is_work_day(curr, sat, sun, hol_set):
+                remaining -= 1
+                if curr.weekday() == 5: sa += 1
+                elif curr.weekday() == 6: su += 1
+                else: wd += 1
+            calendar_days += 1; curr += one_day
+            if remaining == 0 or curr.weekday() == 0: break
+        runs.append((wd, sa, su, 1))
+    return runs, calendar_days
+
+def schedule_buckets(runs, hrs_day, cap, is_key_account):
+    """
+    RT/OT/DT hours for a schedule profile. Weekdays earn up to 10 RT hrs/day until
+    the RT cap is reached (weekly, or cumulative for Key Accounts); Saturday is OT
+    and Sunday is DT.
+    """
+    rt_pot = min(10, hrs_day); cap = max(0, cap)
+    n_wd = sum(w * n for w, _, _, n in runs)
+    n_sat = sum(s * n for _, s, _, n in runs); n_sun = sum(u * n for _, _, u, n in runs)
+    if is_key_account: rt = min(cap, n_wd * rt_pot)
+    else: rt = sum(min(cap, w * rt_pot) * n for w, _, _, n in runs)
+    return {"RT": float(rt), "OT": float(n_wd * hrs_day - rt + n_sat * hrs_day), "DT": float(n_sun * hrs_day)}
+
+def schedule_buckets_batch(profiles, hrs_day, cap, is_key_account):
+    """
+    schedule_buckets() for many schedule profiles (one per crew) in one NumPy pass.
+    hrs_day: one value per profile. Returns (RT, OT, DT) float arrays, one entry per profile.
+    """
+    n = len(profiles); hrs = np.asarray(hrs_day, dtype=float).reshape(n)
+    runs = np.array([run for runs_ in profiles for run in runs_], dtype=float).reshape(-1, 4)
+    owner = np.repeat(np.arange(n), [len(r) for r in profiles])
+    wd, sa, su, k = runs.T; rt_pot = np.minimum(10.0, hrs); cap = max(0, cap)
+    n_wd = np.bincount(owner, wd * k, minlength=n); n_sat = np.bincount(owner, sa * k, minlength=n); n_sun = np.bincount(owner, su * k, minlength=n)
+    if is_key_account: rt = np.minimum(cap, n_wd * rt_pot)
+    else: rt = np.bincount(owner, np.minimum(cap, wd * rt_pot[owner]) * k, minlength=n)
+    return rt, n_wd * hrs - rt + n_sat * hrs, n_sun * hrs
+
+def calculate_onsite_duration(start_date, work_days, sat, sun, holidays=None):
+    """
+    Calculates calendar duration for N working days, skipping unauthorized weekends and holidays.
+    """
+    return schedule_profile(start_date, work_days, sat, sun, holidays)[1]
+
+def simulate_schedule(start_date, work_days, hrs_day, sat, sun, rules, is_key_account, holidays=None):
+    runs, sub_days = schedule_profile(start_date, work_days, sat, sun, holidays)
+    return schedule_buckets(runs, hrs_day, rules.get('cap_rt_weekly', 40), is_key_account), sub_days
 
 def generate_audit_text(proj_data, lines, totals, rates, user_inputs, calc_log):
     timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -123,6 +199,8 @@ def generate_audit_text(proj_data, lines, totals, rates, user_inputs, calc_log):
         txt += f"Work Days:     {user_inputs.get('days')}\n"
         txt += f"Hours/Day:     {user_inputs.get('hrs')}\n"
         txt += f"Work Wknd:     Sat={user_inputs.get('sat')} | Sun={user_inputs.get('sun')}\n"
+        for p in user_inputs.get('phases') or []:
+            txt += f"+ Crew:        {p.get('name') or '-'}: {p.get('tfas')} TFAs x {p.get('days')} days x {p.get('hrs')} hrs (Sat={p.get('sat')}, Sun={p.get('sun')}) | Mob {p.get('mob_date') or 'N/A'} -> Return {p.get('return_date') or 'N/A'}\n"
         txt += f"Travel:        Flight=${user_inputs.get('flight_cost')} | Miles={user_inputs.get('miles')} | Hrs={user_inputs.get('t_hrs')}\n"
         txt += f"Subsistence:   Override={user_inputs.get('override_sub')} | Manual Days={user_inputs.get('man_sub_days')}\n"
     txt += f"Contingency:   {user_inputs.get('cont_pct') * 100}%\n"
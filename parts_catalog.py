@@ -0,0 +1,312 @@
+# src/parts_catalog.py
+# ======================================================
+# AFP ESTIMATOR - PARTS CATALOG MODULE
+# Version: v3.0
+# Updated: 2026-10-17
+# Description: Local SQLite catalog of vendor price lists (CSV / XLSX) for
+#              the Parts tab. Part numbers are an indexed NOCASE column, so
+#              prefix search is an index range scan; part number and
+#              description substrings go through an FTS5 trigram index
+#              (plain LIKE scan where SQLite lacks it). Price lists dropped
+#              in Shared_Data/Price_Lists are re-imported when they change;
+#              each file replaces its vendor's previous SKUs, and only new or
+#              re-described SKUs touch the text index. Nothing is
+#              loaded into memory per session: a search reads only the rows
+#              it returns.
+#
+# Usage:       python parts_catalog.py sync [DIR] [--db PATH]
+#              python parts_catalog.py import FILE [--vendor NAME] [--db PATH]
+#              python parts_catalog.py search TEXT [--limit N] [--db PATH]
+# ======================================================
+
+import os
+import time
+import sqlite3
+import argparse
+import datetime
+import threading
+
+import ingest
+
+DB_NAME = "parts_catalog.db"
+PRICE_LIST_DIR = "Price_Lists"
+SCHEMA_VERSION = 1
+LEAD_TIMES = ("Stock", "2-4 Weeks", "6-8 Weeks")     # Parts editor choices; vendor lead times are bucketed into these
+PRICE_LIST_TYPES = (".csv", ".xlsx")
+INSERT_BATCH = 5000
+
+# Price-list header aliases (lowercase) -> catalog column
+COLUMN_ALIASES = {
+    "part_no": ("part #", "part number", "part no", "part_no", "partnumber", "sku", "item", "item #", "item number", "catalog #", "mfr part #"),
+    "description": ("description", "desc", "item description", "product description", "name"),
+    "cost": ("cost", "unit cost", "net cost", "net price", "your price", "price", "unit price"),
+    "lead_time": ("lead time", "lead", "lead_time", "lead time (days)", "availability"),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS parts (
+    id          INTEGER PRIMARY KEY,
+    vendor      TEXT NOT NULL DEFAULT '' COLLATE NOCASE,
+    part_no     TEXT NOT NULL COLLATE NOCASE,
+    description TEXT NOT NULL DEFAULT '',
+    cost        REAL,
+    lead_time   TEXT NOT NULL DEFAULT '',
+    batch       INTEGER NOT NULL DEFAULT 0,     -- Import that last listed the SKU
+    UNIQUE (vendor, part_no)
+);
+CREATE INDEX IF NOT EXISTS ix_parts_part_no ON parts(part_no);
+CREATE TABLE IF NOT EXISTS sources (
+    path        TEXT PRIMARY KEY,
+    vendor      TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    mtime       REAL NOT NULL,
+    rows        INTEGER NOT NULL,
+    imported_at TEXT NOT NULL
+);
+"""
+
+# External-content trigram index over part number + description, kept in step by triggers
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS parts_fts USING fts5(part_no, description, content='parts', content_rowid='id', tokenize='trigram');
+CREATE TRIGGER IF NOT EXISTS parts_ai AFTER INSERT ON parts BEGIN
+    INSERT INTO parts_fts(rowid, part_no, description) VALUES (new.id, new.part_no, new.description);
+END;
+CREATE TRIGGER IF NOT EXISTS parts_ad AFTER DELETE ON parts BEGIN
+    INSERT INTO parts_fts(parts_fts, rowid, part_no, description) VALUES ('delete', old.id, old.part_no, old.description);
+END;
+CREATE TRIGGER IF NOT EXISTS parts_au AFTER UPDATE OF part_no, description ON parts
+WHEN old.part_no IS NOT new.part_no OR old.description IS NOT new.description BEGIN
+    INSERT INTO parts_fts(parts_fts, rowid, part_no, description) VALUES ('delete', old.id, old.part_no, old.description);
+    INSERT INTO parts_fts(rowid, part_no, description) VALUES (new.id, new.part_no, new.description);
+END;
+"""
+
+RESULT_COLUMNS = ("part_no", "description", "cost", "lead_time", "vendor")
+_PREFIX_END = "\U0010ffff"  # Sorts after any continuation of a prefix
+
+def _money(val):
+    """'$1,234.50' / 12 / '' -> float or None."""
+    if val is None: return None
+    try: return round(float(str(val).replace('$', '').replace(',', '').strip()), 4)
+    except ValueError: return None
+
+def lead_bucket(val):
+    """Vendor lead time ('In Stock', '10', '3 weeks', '45 days', '2-4 Weeks') -> one of LEAD_TIMES ('' if unknown)."""
+    text = str(val or "").strip().lower()
+    if not text: return ""
+    for choice in LEAD_TIMES:
+        if text == choice.lower(): return choice
+    if "stock" in text: return "Stock"
+    digits = "".join(c if c.isdigit() else " " for c in text).split()
+    if not digits: return ""
+    n = max(int(d) for d in digits)
+    days = n * 7 if "week" in text or "wk" in text else n   # Bare numbers are days
+    return "Stock" if days <= 2 else "2-4 Weeks" if days <= 28 else "6-8 Weeks"
+
+def read_price_list(path):
+    """(part_no, description, cost, lead_time) tuples from a vendor CSV / XLSX; rows without a part number are skipped."""
+    wanted = {a for aliases in COLUMN_ALIASES.values() for a in aliases}
+    pick = None
+    for row in ingest.iter_rows(path, columns=wanted):
+        if pick is None:   # First row: resolve each column to the first alias the file has
+            pick = {col: next((a for a in aliases if a in row), None) for col, aliases in COLUMN_ALIASES.items()}
+            if pick["part_no"] is None: raise ValueError(f"{os.path.basename(path)}: no part number column (expected one of {', '.join(COLUMN_ALIASES['part_no'])})")
+        part_no = str(row.get(pick["part_no"]) or "").strip()
+        if not part_no: continue
+        yield (part_no, str(row.get(pick["description"]) or "").strip() if pick["description"] else "",
+               _money(row.get(pick["cost"])) if pick["cost"] else None, lead_bucket(row.get(pick["lead_time"])) if pick["lead_time"] else "")
+
+def vendor_name(path):
+    """Default vendor for a price list: its file name without the extension."""
+    return os.path.splitext(os.path.basename(path))[0]
+
+class PartsCatalog:
+    """
+    catalog = PartsCatalog(path)
+    catalog.import_file(path, vendor=None) -> rows     (replaces that vendor's SKUs)
+    catalog.import_rows(vendor, rows) -> rows          (same, from (part_no, description, cost, lead_time) tuples)
+    catalog.sync(folder) -> [(file, rows)]             (re-imports changed price lists, drops removed ones)
+    catalog.search("valve 2in", limit=50) -> [{'part_no', 'description', 'cost', 'lead_time', 'vendor'}]
+    catalog.count() / catalog.vendors()
+    """
+
+    def __init__(self, path, timeout=30.0):
+        self.path = path; self.timeout = timeout
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            conn.executescript(f"BEGIN IMMEDIATE;{_SCHEMA}PRAGMA user_version = {SCHEMA_VERSION};COMMIT;")
+            try: conn.executescript(f"BEGIN IMMEDIATE;{_FTS_SCHEMA}INSERT INTO parts_fts(parts_fts) VALUES ('rebuild');COMMIT;")
+            except sqlite3.OperationalError:   # No FTS5 / trigram tokenizer in this SQLite: substring search scans
+                if conn.in_transaction: conn.execute("ROLLBACK")
+        self.has_fts = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'parts_fts'").fetchone() is not None
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL"); conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _write(self, fn):
+        """Runs fn(conn) in one write transaction (concurrent writers wait on the busy timeout)."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try: out = fn(conn)
+        except BaseException:
+            conn.execute("ROLLBACK"); raise
+        conn.execute("COMMIT")
+        return out
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None: conn.close(); self._local.conn = None
+
+    # --- WRITE ---
+    @staticmethod
+    def _load(conn, vendor, rows):
+        """
+        Makes rows (part_no, description, cost, lead_time) vendor's SKU list: upserts
+        them (last duplicate part number wins), then drops the vendor's SKUs the
+        list no longer has. Returns rows read.
+        """
+        batch_id = conn.execute("SELECT COALESCE(MAX(batch), 0) + 1 FROM parts").fetchone()[0]
+        sql = ("INSERT INTO parts (vendor, part_no, description, cost, lead_time, batch) VALUES (?, ?, ?, ?, ?, ?) "
+               "ON CONFLICT (vendor, part_no) DO UPDATE SET description = excluded.description, cost = excluded.cost, lead_time = excluded.lead_time, batch = excluded.batch")
+        n = 0; chunk = []
+        for r in rows:
+            chunk.append((vendor, *r, batch_id))
+            if len(chunk) >= INSERT_BATCH: conn.executemany(sql, chunk); n += len(chunk); chunk = []
+        if chunk: conn.executemany(sql, chunk); n += len(chunk)
+        conn.execute("DELETE FROM parts WHERE vendor = ? AND batch != ?", (vendor, batch_id))
+        return n
+
+    def import_rows(self, vendor, rows, path=None):
+        """
+        Makes rows (part_no, description, cost, lead_time) vendor's SKU list in one
+        transaction. path: the price list they were read from (recorded for sync()).
+        """
+        st_ = os.stat(path) if path else None
+        def tx(conn):
+            n = self._load(conn, vendor, rows)
+            if path: conn.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?, ?)", (os.path.abspath(path), vendor, st_.st_size, st_.st_mtime, n, datetime.datetime.now().isoformat(timespec="seconds")))
+            return n
+        return self._write(tx)
+
+    def import_file(self, path, vendor=None):
+        """Loads a vendor price list (vendor defaults to the file name), replacing that vendor's previous SKUs."""
+        vendor = vendor or vendor_name(path)
+        return self.import_rows(vendor, read_price_list(path), path)
+
+    def sync(self, folder, on_error=None):
+        """
+        Imports new / changed price lists in folder and drops vendors whose file is gone.
+        Files that would share a vendor (acme.csv + acme.xlsx) are skipped after the
+        first and reported to on_error. Returns [(file name, rows)].
+        """
+        if not os.path.isdir(folder): return []
+        conn = self._conn(); folder = os.path.abspath(folder)
+        known = {r['path']: r for r in conn.execute("SELECT * FROM sources")}
+        files = {os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith(PRICE_LIST_TYPES) and not f.startswith(("~$", "."))}
+        first = {}; skipped = []
+        for path in sorted(files):
+            other = first.setdefault(vendor_name(path).lower(), path)
+            if other != path: skipped.append((path, other))
+        files -= {path for path, _ in skipped}
+        for path, other in skipped:
+            if on_error: on_error(path, ValueError(f"same vendor as {os.path.basename(other)}; rename one of the files"))
+        done = []; dropped = set()
+        for path, old in known.items():
+            if os.path.dirname(path) == folder and path not in files:
+                self._write(lambda c: (c.execute("DELETE FROM sources WHERE path = ?", (path,)),     # Vendor still listed by another file keeps its SKUs
+                                       c.execute("DELETE FROM parts WHERE vendor = ? AND NOT EXISTS (SELECT 1 FROM sources WHERE vendor = ? COLLATE NOCASE)", (old['vendor'], old['vendor']))))
+                done.append((os.path.basename(path), 0)); dropped.add(old['vendor'].lower())
+        for path in sorted(files):
+            st_ = os.stat(path); old = known.get(path)
+            if old is not None and old['size'] == st_.st_size and old['mtime'] == st_.st_mtime and old['vendor'].lower() not in dropped: continue
+            try: done.append((os.path.basename(path), self.import_file(path)))
+            except Exception as e:
+                if on_error: on_error(path, e)
+        return done
+
+    # --- READ ---
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM parts").fetchone()[0]
+
+    def vendors(self):
+        """[(vendor, SKUs)]"""
+        return [tuple(r) for r in self._conn().execute("SELECT vendor, COUNT(*) FROM parts GROUP BY vendor ORDER BY vendor")]
+
+    def search(self, text, limit=50, vendor=None):
+        """
+        Part-number prefix matches first (in part-number order), then SKUs whose
+        part number or description contains every word of text. With the trigram
+        index, words under 3 characters only narrow a search: a query of short
+        words alone is a prefix search (a substring scan would read every row).
+        """
+        text = (text or "").strip()
+        if not text or limit <= 0: return []
+        conn = self._conn(); cols = ", ".join(f"p.{c}" for c in RESULT_COLUMNS)
+        v_sql, v_arg = (" AND p.vendor = ?", [vendor]) if vendor else ("", [])
+        out = [dict(r) for r in conn.execute(f"SELECT {cols} FROM parts p WHERE p.part_no >= ? AND p.part_no < ?{v_sql} ORDER BY p.part_no LIMIT ?",
+                                             [text, text + _PREFIX_END, *v_arg, limit])]
+        if len(out) >= limit: return out
+        words = text.split(); long_ = [w for w in words if len(w) >= 3]
+        if self.has_fts and not long_: return out
+        seen = {(r['vendor'], r['part_no'].lower()) for r in out}
+        like = lambda w: "%" + w.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        scan = [w for w in words if not (self.has_fts and len(w) >= 3)]       # Words the trigram index cannot answer
+        where = " AND ".join(["(p.part_no LIKE ? ESCAPE '\\' OR p.description LIKE ? ESCAPE '\\')"] * len(scan)) or "1"
+        args = [a for w in scan for a in (like(w), like(w))]
+        if self.has_fts:
+            match = " AND ".join('"' + w.replace('"', '""') + '"' for w in long_)
+            sql = f"SELECT {cols} FROM parts_fts f JOIN parts p ON p.id = f.rowid WHERE parts_fts MATCH ? AND {where}{v_sql} LIMIT ?"
+            rows = conn.execute(sql, [match, *args, *v_arg, limit + len(out)])      # Room for rows the prefix query already returned
+        else: rows = conn.execute(f"SELECT {cols} FROM parts p WHERE {where}{v_sql} LIMIT ?", [*args, *v_arg, limit + len(out)])
+        for r in rows:
+            if (r['vendor'], r['part_no'].lower()) in seen: continue
+            out.append(dict(r))
+            if len(out) >= limit: break
+        return out
+
+def editor_row(sku, qty=1):
+    """Catalog hit -> Parts editor row (the parts_list layout)."""
+    return {"Part #": sku['part_no'], "Description": sku['description'], "Qty": qty, "Cost": sku['cost'] if sku['cost'] is not None else 0.0,
+            "Lead Time": sku['lead_time'] or LEAD_TIMES[1]}
+
+def default_path(source_dirs=None):
+    """parts_catalog.db in the first Shared_Data folder (AFP_PARTS_DB overrides)."""
+    if os.environ.get("AFP_PARTS_DB"): return os.environ["AFP_PARTS_DB"]
+    dirs = source_dirs or ingest.default_source_dirs() or ["Shared_Data"]
+    return os.path.join(dirs[0], DB_NAME)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Parts catalog (SQLite) tools.")
+    ap.add_argument("--db", help="Database file (default: Shared_Data/parts_catalog.db)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p_sync = sub.add_parser("sync", help="Import new / changed price lists from a folder (default: Shared_Data/Price_Lists)")
+    p_sync.add_argument("folder", nargs="?")
+    p_imp = sub.add_parser("import", help="Import one price list (replaces that vendor's SKUs)")
+    p_imp.add_argument("file"); p_imp.add_argument("--vendor")
+    p_find = sub.add_parser("search", help="Search by part-number prefix or part number / description words")
+    p_find.add_argument("text"); p_find.add_argument("--limit", type=int, default=25)
+    args = ap.parse_args()
+
+    catalog = PartsCatalog(args.db or default_path())
+    t0 = time.perf_counter()
+    if args.cmd == "sync":
+        folder = args.folder or os.path.join((ingest.default_source_dirs() or ["Shared_Data"])[0], PRICE_LIST_DIR)
+        for name, n in catalog.sync(folder, lambda path, e: print(f"  skip {os.path.basename(path)}: {e}")): print(f"  {name}: {n:,} SKUs")
+        print(f"{catalog.count():,} SKUs from {len(catalog.vendors())} vendor(s) -> {catalog.path} ({time.perf_counter() - t0:.1f}s)")
+    elif args.cmd == "import":
+        n = catalog.import_file(args.file, args.vendor)
+        print(f"Imported {n:,} SKUs -> {catalog.path} ({time.perf_counter() - t0:.1f}s)")
+    else:
+        rows = catalog.search(args.text, args.limit)
+        print(f"{len(rows)} match(es) in {(time.perf_counter() - t0) * 1e3:.1f} ms")
+        for r in rows:
+            cost = f"${r['cost']:>10,.2f}" if r['cost'] is not None else " " * 11
+            print(f"  {r['part_no'][:24]:<24} {r['description'][:44]:<44} {cost}  {r['lead_time']:<10} {r['vendor']}")
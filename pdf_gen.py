@@ -6,18 +6,75 @@
 # Description: Generates PDF quotes. 
 #              v2.9.5 adds Markdown Table support, Emoji sanitization, 
 #              and "Rate Schedule" page breaks.
+#              Assets are resolved/parsed once per process; QuoteRenderer
+#              renders many quotes back to back (python pdf_gen.py [N]
+#              prints pages/sec for the reference quote).
 # ======================================================
 
 from fpdf import FPDF
 import datetime
+import time
 import os
+import hashlib
+import threading
+from collections import OrderedDict
 from data import DATA_DIR 
+import telemetry
+
+# --- RESOURCE CACHE (process-wide) ---
+# Asset paths are resolved once and each image file is parsed once. fpdf
+# stamps per-document fields onto its image records ('i', 'n') and drops the
+# pixel data after writing, so every document gets its own shallow copy.
+# Core font metrics already live in fpdf's module-level table.
+LOGO_CANDIDATES = ("afp_logo.jpg", os.path.join(DATA_DIR, "afp_logo.jpg"))
+ISO_CANDIDATES = ("iso_logo.jpg", os.path.join(DATA_DIR, "iso_logo.jpg"), os.path.join(DATA_DIR, "iso_logo.png"))
+_ASSET_PATHS = {}
+_IMAGE_INFO = {}
+
+def asset_path(candidates):
+    """First existing path among candidates (or None); cached for the life of the process."""
+    if candidates not in _ASSET_PATHS:
+        _ASSET_PATHS[candidates] = next((p for p in candidates if os.path.exists(p)), None)
+    return _ASSET_PATHS[candidates]
+
+def clear_resource_cache():
+    """Forget resolved paths and parsed images (e.g. after replacing a logo file)."""
+    _ASSET_PATHS.clear(); _IMAGE_INFO.clear()
+
+class _OutputBuffer:
+    """
+    Stand-in for FPDF.buffer while a document is written. fpdf 1.7.2 grows the
+    buffer with 'str +=', which re-copies the embedded logos on every line
+    written after them; this collects chunks and joins once in _enddoc.
+    """
+    def __init__(self):
+        self.chunks = []; self.size = 0
+    def __iadd__(self, s):
+        self.chunks.append(s); self.size += len(s); return self
+    def __len__(self):
+        return self.size
+    def __str__(self):
+        return "".join(self.chunks)
 
 class PDF(FPDF):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buffer = _OutputBuffer()
+
+    def _enddoc(self):
+        super()._enddoc()
+        self.buffer = str(self.buffer)
+
+    def image(self, name, *args, **kwargs):
+        if name not in self.images and name in _IMAGE_INFO:
+            self.images[name] = dict(_IMAGE_INFO[name], i=len(self.images) + 1)
+        first_use = name not in self.images
+        super().image(name, *args, **kwargs)
+        if first_use: _IMAGE_INFO[name] = dict(self.images[name])
+
     def header(self):
-        logo = "afp_logo.jpg"
-        if not os.path.exists(logo): logo = os.path.join(DATA_DIR, "afp_logo.jpg")
-        if os.path.exists(logo): self.image(logo, 10, 8, 30)
+        logo = asset_path(LOGO_CANDIDATES)
+        if logo: self.image(logo, 10, 8, 30)
         
         self.set_y(10); self.set_font('Arial', 'B', 14); self.set_text_color(192, 0, 0)
         self.cell(0, 5, 'AFP CORP dba Associated Fire Protection', 0, 1, 'R')
@@ -28,11 +85,8 @@ class PDF(FPDF):
 
     def footer(self):
         self.set_y(-35)
-        iso_path = "iso_logo.jpg"
-        if not os.path.exists(iso_path): iso_path = os.path.join(DATA_DIR, "iso_logo.jpg")
-        if not os.path.exists(iso_path): iso_path = os.path.join(DATA_DIR, "iso_logo.png")
-        
-        if os.path.exists(iso_path): self.image(iso_path, 170, self.get_y(), 26)
+        iso_path = asset_path(ISO_CANDIDATES)
+        if iso_path: self.image(iso_path, 170, self.get_y(), 26)
         
         self.set_font('Arial', 'I', 7); self.set_text_color(100, 100, 100)
         self.multi_cell(140, 3, "AFP Confidentiality: This quote is privileged information intended for the addressee only.")
@@ -85,125 +139,135 @@ class PDF(FPDF):
 
     def write_markdown(self, text):
         """
-        Enhanced Markdown Parser.
+        Enhanced Markdown renderer.
         Supports: Tables, H1-H3, Blockquotes, Lists, Bold, Italics.
-        Includes Emoji Sanitization.
+        The text is compiled once into layout operations (compile_markdown)
+        and replayed here, so repeated T&C blocks are not re-parsed.
         """
         if not text: return
+        for name, args in compile_markdown(text): getattr(self, name)(*args)
+
+# --- MARKDOWN COMPILER ---
+# Markdown -> tuple of (PDF method, args) operations. Parsing does not depend
+# on the page state (wrapping and page breaks happen at replay), so the
+# compiled form of a T&C block can be shared by every quote that uses it.
+MD_CACHE_SIZE = 64
+_MD_CACHE = OrderedDict()
+_MD_LOCK = threading.Lock()
+
+@telemetry.timed("pdf.compile_markdown", cached=True)
+def compile_markdown(text):
+    """Compiled operations for a markdown block; LRU-cached by content hash."""
+    key = hashlib.sha1(text.encode('utf-8', 'surrogatepass')).hexdigest()
+    with _MD_LOCK:
+        ops = _MD_CACHE.get(key)
+        if ops is not None: _MD_CACHE.move_to_end(key); return ops
+    telemetry.miss("pdf.compile_markdown")
+    ops = tuple(_compile_markdown(text))
+    with _MD_LOCK:
+        _MD_CACHE[key] = ops
+        while len(_MD_CACHE) > MD_CACHE_SIZE: _MD_CACHE.popitem(last=False)
+    return ops
+
+def _compile_markdown(text):
+    # --- SANITIZE ---
+    # Strip unsupported characters (Emojis) to prevent crashes
+    text = text.encode('latin-1', 'ignore').decode('latin-1')
+    
+    ops = [('set_font', ('Arial', '', 9)), ('set_text_color', (0, 0, 0))]
+    table_buffer = []
+    
+    for line in text.split('\n'):
+        raw = line.strip()
         
-        # --- SANITIZE ---
-        # Strip unsupported characters (Emojis) to prevent crashes
-        text = text.encode('latin-1', 'ignore').decode('latin-1')
-        
-        lines = text.split('\n')
-        table_buffer = []
+        # --- TABLE DETECTION ---
+        if raw.startswith('|'):
+            table_buffer.append(raw)
+            continue
         
-        self.set_font('Arial', '', 9)
-        self.set_text_color(0, 0, 0)
+        # If buffer has content, render table now
+        if table_buffer:
+            ops += _compile_table(table_buffer)
+            table_buffer = []
         
-        for line in lines:
-            raw = line.strip()
+        # --- HEADERS ---
+        if raw.startswith('# '):
+            ops += [('set_font', ('Arial', 'B', 12)), ('cell', (0, 6, raw[2:], 0, 1)), ('set_font', ('Arial', '', 9))]
+        elif raw.startswith('## '):
+            ops += [('set_font', ('Arial', 'B', 10)), ('cell', (0, 5, raw[3:], 0, 1)), ('set_font', ('Arial', '', 9))]
+        elif raw.startswith('### '):
+            ops += [('set_font', ('Arial', 'BI', 9)), ('cell', (0, 5, raw[4:], 0, 1)), ('set_font', ('Arial', '', 9))]
             
-            # --- TABLE DETECTION ---
-            if raw.startswith('|'):
-                table_buffer.append(raw)
-                continue
+        # --- BLOCKQUOTES ---
+        elif raw.startswith('> '):
+            ops += [('set_x', (15,)), ('set_text_color', (80, 80, 80)), ('set_font', ('Arial', 'I', 9)),
+                    ('multi_cell', (0, 5, raw[2:])), ('set_font', ('Arial', '', 9)), ('set_text_color', (0, 0, 0))]
             
-            # If buffer has content, render table now
-            if table_buffer:
-                self._render_markdown_table(table_buffer)
-                table_buffer = []
+        # --- LISTS ---
+        elif raw.startswith('- ') or raw.startswith('* '):
+            ops += [('set_x', (15,)), ('cell', (5, 5, chr(149), 0, 0))] + _compile_inline(raw[2:]) + [('ln', ())]
+        elif len(raw) > 2 and raw[0].isdigit() and raw[1] == '.':
+            dot = raw.find('.')
+            ops += [('set_x', (15,)), ('cell', (8, 5, raw[:dot+1], 0, 0))] + _compile_inline(raw[dot+1:].strip()) + [('ln', ())]
             
-            # --- HEADERS ---
-            if raw.startswith('# '):
-                self.set_font('Arial', 'B', 12)
-                self.cell(0, 6, raw[2:], 0, 1)
-                self.set_font('Arial', '', 9)
-            elif raw.startswith('## '):
-                self.set_font('Arial', 'B', 10)
-                self.cell(0, 5, raw[3:], 0, 1)
-                self.set_font('Arial', '', 9)
-            elif raw.startswith('### '):
-                self.set_font('Arial', 'BI', 9)
-                self.cell(0, 5, raw[4:], 0, 1)
-                self.set_font('Arial', '', 9)
-                
-            # --- BLOCKQUOTES ---
-            elif raw.startswith('> '):
-                self.set_x(15); self.set_text_color(80, 80, 80); self.set_font('Arial', 'I', 9)
-                self.multi_cell(0, 5, raw[2:])
-                self.set_font('Arial', '', 9); self.set_text_color(0, 0, 0)
-                
-            # --- LISTS ---
-            elif raw.startswith('- ') or raw.startswith('* '):
-                self.set_x(15); self.cell(5, 5, chr(149), 0, 0)
-                self._parse_inline(raw[2:]); self.ln()
-            elif len(raw) > 2 and raw[0].isdigit() and raw[1] == '.':
-                self.set_x(15); dot = raw.find('.'); self.cell(8, 5, raw[:dot+1], 0, 0)
-                self._parse_inline(raw[dot+1:].strip()); self.ln()
+        # --- TEXT ---
+        elif raw:
+            ops += [('set_x', (10,))] + _compile_inline(raw) + [('ln', ())]
                 
-            # --- TEXT ---
-            else:
-                if raw: 
-                    self.set_x(10); self._parse_inline(raw); self.ln()
-                    
-        # Flush remaining table
-        if table_buffer: self._render_markdown_table(table_buffer)
+    # Flush remaining table
+    if table_buffer: ops += _compile_table(table_buffer)
+    return ops
 
-    def _render_markdown_table(self, lines):
-        if not lines: return
+def _compile_table(lines):
+    # 1. Parse Header
+    header = [h.strip() for h in lines[0].split('|') if h.strip()]
+    
+    # 2. Determine Widths (Heuristic for 3-col rate tables)
+    # Default Layout: [Description, Rate, Notes] -> [50, 40, 100]
+    widths = [50, 40, 100]
+    if len(header) != 3:
+        # Fallback: Equal width
+        w = 190 / max(1, len(header))
+        widths = [w] * len(header)
         
-        # 1. Parse Header
-        header = [h.strip() for h in lines[0].split('|') if h.strip()]
+    # 3. Skip Separator Row (lines like |---|)
+    start_row = 1
+    if len(lines) > 1 and '---' in lines[1]:
+        start_row = 2
         
-        # 2. Determine Widths (Heuristic for 3-col rate tables)
-        # Default Layout: [Description, Rate, Notes] -> [50, 40, 100]
-        widths = [50, 40, 100]
-        if len(header) != 3:
-            # Fallback: Equal width
-            w = 190 / max(1, len(header))
-            widths = [w] * len(header)
-            
-        # 3. Skip Separator Row (lines like |---|)
-        start_row = 1
-        if len(lines) > 1 and '---' in lines[1]:
-            start_row = 2
-            
-        # 4. Render Header
-        self.set_font('Arial', 'B', 9); self.set_fill_color(240, 240, 240)
-        for i, h in enumerate(header):
-            if i < len(widths): self.cell(widths[i], 6, h, 1, 0, 'L', 1)
-        self.ln()
+    # 4. Render Header
+    ops = [('set_font', ('Arial', 'B', 9)), ('set_fill_color', (240, 240, 240))]
+    for i, h in enumerate(header):
+        if i < len(widths): ops.append(('cell', (widths[i], 6, h, 1, 0, 'L', 1)))
+    ops += [('ln', ()), ('set_font', ('Arial', '', 9))]
+    
+    # 5. Render Rows
+    for row_raw in lines[start_row:]:
+        # Split and clean bold markers from data (PDF looks cleaner without ** chars)
+        cols = [c.strip().replace('**', '') for c in row_raw.split('|') if c.strip()]
         
-        # 5. Render Rows
-        self.set_font('Arial', '', 9)
-        for i in range(start_row, len(lines)):
-            row_raw = lines[i]
-            # Split and clean bold markers from data (PDF looks cleaner without ** chars)
-            cols = [c.strip().replace('**', '') for c in row_raw.split('|') if c.strip()]
-            
-            # Pad or truncate columns to match header
-            if len(cols) < len(widths): cols += [''] * (len(widths) - len(cols))
-            if len(cols) > len(widths): cols = cols[:len(widths)]
-            
-            self.add_dynamic_row(cols, widths, ['L']*len(widths))
+        # Pad or truncate columns to match header
+        if len(cols) < len(widths): cols += [''] * (len(widths) - len(cols))
+        if len(cols) > len(widths): cols = cols[:len(widths)]
         
-        self.ln(2)
+        ops.append(('add_dynamic_row', (cols, widths, ['L']*len(widths))))
+    
+    ops.append(('ln', (2,)))
+    return ops
 
-    def _parse_inline(self, text):
-        parts_bold = text.split('**')
-        for i, part in enumerate(parts_bold):
-            is_bold = (i % 2 == 1)
-            parts_italic = part.split('*')
-            for j, subpart in enumerate(parts_italic):
-                is_italic = (j % 2 == 1)
-                style = ''
-                if is_bold: style += 'B'
-                if is_italic: style += 'I'
-                self.set_font('Arial', style, 9)
-                self.write(5, subpart)
+def _compile_inline(text):
+    ops = []
+    for i, part in enumerate(text.split('**')):
+        is_bold = (i % 2 == 1)
+        for j, subpart in enumerate(part.split('*')):
+            is_italic = (j % 2 == 1)
+            style = ''
+            if is_bold: style += 'B'
+            if is_italic: style += 'I'
+            ops += [('set_font', ('Arial', style, 9)), ('write', (5, subpart))]
+    return ops
 
-def generate_pdf(proj_data, svc_lines, part_lines, client_data, totals, is_parts_only, rates=None, exp_markup=None):
+def build_pdf(proj_data, svc_lines, part_lines, client_data, totals, is_parts_only, rates=None, exp_markup=None):
     pdf = PDF(); pdf.set_auto_page_break(auto=True, margin=15); pdf.add_page()
     
     # Metadata
@@ -306,4 +370,51 @@ def generate_pdf(proj_data, svc_lines, part_lines, client_data, totals, is_parts
     if not is_parts_only: std_terms += "\n- Travel Billed at Straight Time."
     pdf.write_markdown(std_terms)
     
-    return pdf.output(dest='S').encode('latin-1')
\ No newline at end of file
+    return pdf
+
+@telemetry.timed("pdf.generate_pdf")
+def generate_pdf(proj_data, svc_lines, part_lines, client_data, totals, is_parts_only, rates=None, exp_markup=None):
+    return build_pdf(proj_data, svc_lines, part_lines, client_data, totals, is_parts_only, rates, exp_markup).output(dest='S').encode('latin-1')
+
+class QuoteRenderer:
+    """
+    Renders quotes back to back on the shared resource cache and keeps
+    throughput counters (bulk export, re-quote runs, benchmarks).
+        r = QuoteRenderer(); pdf_bytes = r.render(proj_data, svc_lines, ...)
+    """
+
+    def __init__(self):
+        self.documents = 0; self.pages = 0; self.seconds = 0.0
+
+    def render(self, *args, **kwargs):
+        """Same arguments as generate_pdf(); returns the PDF bytes."""
+        t0 = time.perf_counter()
+        pdf = build_pdf(*args, **kwargs)
+        out = pdf.output(dest='S').encode('latin-1')
+        self.seconds += time.perf_counter() - t0; self.documents += 1; self.pages += pdf.page
+        return out
+
+    @property
+    def pages_per_sec(self):
+        return self.pages / self.seconds if self.seconds else 0.0
+
+def reference_quote():
+    """Fixed 8-page quote (10-day job, 3 TFAs, 24 parts, markdown SOW + rate table) used for throughput figures."""
+    from quote_engine import QuoteInputs, QuoteEngine
+    d = datetime.date(2026, 3, 2)
+    q = QuoteInputs(proj_name="Reference", site="Plant 4", mob_date=d, start_date=d + datetime.timedelta(days=1), return_date=d + datetime.timedelta(days=12),
+                    flight_cost=600, t_hrs=6, tfas=3, days=10,
+                    sow="# Scope\n- **Inspect** all risers\n- Test *alarms*\n1. Step one\n> note\n" * 3,
+                    assume="| Item | Rate | Notes |\n|---|---|---|\n| Labor | $140 | weekday |\n| OT | $210 | nights and weekends |\n" * 4,
+                    parts_list=[{"Part #": f"P{i}", "Description": "Sprinkler head pendent 155F", "Qty": 4, "Cost": 12.5 * i, "Lead Time": "2 wks"} for i in range(1, 25)])
+    r = QuoteEngine().compute(q)
+    client = {"Company": "ACME", "Street": "1 Main St", "City": "Omaha", "State": "NE", "Zip": "68127"}
+    return (r.proj_data, r.svc_lines, r.part_lines, client, r.totals, False, r.rates, q.exp_markup)
+
+if __name__ == "__main__":
+    import sys
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    args = reference_quote(); r = QuoteRenderer()
+    r.render(*args); r = QuoteRenderer()  # Warm the resource cache, then measure
+    for _ in range(n): r.render(*args)
+    print(f"{r.documents} quotes, {r.pages} pages in {r.seconds:.2f}s -> {r.pages_per_sec:.0f} pages/sec")
@@ -0,0 +1,51 @@
+# src/pdf_jobs.py
+# ======================================================
+# AFP ESTIMATOR - BACKGROUND PDF MODULE
+# Version: v3.0
+# Updated: 2026-10-17
+# Description: Renders quote PDFs on a small shared thread pool, off the
+#              Calculate path. Jobs are memoized by a hash of everything the
+#              PDF is drawn from (plus today's date, which is printed on it),
+#              so asking again for the same quote returns the finished or
+#              in-flight render. pdf_gen (and fpdf) load on the first job.
+# ======================================================
+
+import json
+import hashlib
+import datetime
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+PDF_WORKERS = 2
+JOB_CACHE_SIZE = 32         # Finished/in-flight renders kept (all sessions)
+
+_pool = None
+_jobs = OrderedDict()       # key -> Future
+_lock = threading.Lock()
+
+def pdf_key(*args):
+    """Stable hash of generate_pdf() arguments."""
+    blob = json.dumps([datetime.date.today().isoformat(), *args], sort_keys=True, default=str)
+    return hashlib.sha1(blob.encode('utf-8', 'surrogatepass')).hexdigest()
+
+def _render(args):
+    import pdf_gen
+    return pdf_gen.generate_pdf(*args)
+
+def submit(*args):
+    """(key, Future of PDF bytes) for generate_pdf(*args); reuses a cached job unless it failed."""
+    global _pool
+    key = pdf_key(*args)
+    with _lock:
+        fut = _jobs.get(key)
+        if fut is not None and not (fut.done() and fut.exception() is not None):
+            _jobs.move_to_end(key); return key, fut
+        if _pool is None: _pool = ThreadPoolExecutor(max_workers=PDF_WORKERS, thread_name_prefix="pdf")
+        fut = _jobs[key] = _pool.submit(_render, args)
+        while len(_jobs) > JOB_CACHE_SIZE: _jobs.popitem(last=False)
+    return key, fut
+
+def job(key):
+    """The Future for key, or None if it was never submitted (or has been evicted)."""
+    with _lock: return _jobs.get(key)
@@ -0,0 +1,378 @@
+# src/quote_engine.py
+# ======================================================
+# AFP ESTIMATOR - QUOTE ENGINE MODULE
+# Version: v3.0
+# Updated: 2026-10-17
+# Description: Headless quote computation extracted from the "Calculate
+#              Quote" handler. Takes a typed QuoteInputs record (the saved
+#              JSON fields plus rates) and returns line items, totals and
+#              the calc log. Does NOT import Streamlit, so it can be used
+#              from batch jobs, scripts and services. Quotes may add crews
+#              (phases) with their own size, hours, weekends and trip dates.
+#              Each crew's calendar is laid out by logic.schedule_profile
+#              (a short week-run loop per crew); the RT/OT/DT buckets of all
+#              crews are then computed in one batched NumPy pass, and the
+#              per-crew quantities (crew table) are built once per schedule
+#              and roll up into the same line items and MBV.
+# ======================================================
+
+import math
+import datetime
+from dataclasses import dataclass, field, fields, asdict
+
+import numpy as np
+
+import logic
+import telemetry
+
+@dataclass
+class QuoteInputs:
+    """Everything a quote depends on. Field names match the saved *_DATA.json keys / session state."""
+    # Project
+    proj_name: str = "New Project"
+    status: str = "Draft"
+    is_parts_only: bool = False
+    region: str = "DOMESTIC"
+    site: str = ""
+    client: dict = field(default_factory=dict)
+    zip_code: str = ""
+    country: str = ""
+    city: str = ""
+    # Travel
+    mode: str = "FLY"
+    flight_cost: float = 0.0
+    miles: float = 0.0
+    t_hrs: float = 0.0
+    man_labor: float = 2.0
+    # Schedule
+    tfas: int = 1
+    days: int = 5
+    hrs: float = 10
+    sat: bool = False
+    sun: bool = False
+    mob_date: datetime.date = None
+    start_date: datetime.date = None
+    return_date: datetime.date = None
+    override_sub: bool = False
+    man_sub_days: int = 0
+    phases: list = field(default_factory=list)   # Additional crews: dicts with PHASE_FIELDS keys
+    # Commercial
+    cont_pct: float = 5.0          # Percent (5.0 = 5%)
+    misc_exp: float = 0.0
+    payment_terms: int = 30
+    validity: int = 30
+    disable_mbv: bool = False
+    sow: str = ""
+    assume: str = ""
+    # Rates & Pricing
+    rate_rt: float = 140.0
+    rate_ot: float = 210.0
+    rate_dt: float = 280.0
+    rate_tr: float = 140.0
+    rt_cap: float = 40
+    exp_markup_pct: float = 15.0
+    loc_rates: dict = field(default_factory=lambda: {'lodging': 150.0, 'mie': 64.0})
+    tier: str = "Standard"
+    is_key_account: bool = False
+    parts_list: list = field(default_factory=list)
+
+    DATE_FIELDS = ('mob_date', 'start_date', 'return_date')
+    PHASE_FIELDS = ('name', 'tfas', 'days', 'hrs', 'sat', 'sun') + DATE_FIELDS
+
+    @classmethod
+    def from_dict(cls, d):
+        """Builds inputs from a saved JSON dict; unknown keys are ignored, missing ones take defaults."""
+        known = {f.name for f in fields(cls)}
+        kw = {k: v for k, v in d.items() if k in known}
+        for k in cls.DATE_FIELDS:
+            if isinstance(kw.get(k), str):
+                try: kw[k] = datetime.datetime.strptime(kw[k], "%Y-%m-%d").date()
+                except ValueError: kw[k] = None
+        return cls(**kw)
+
+    def to_dict(self):
+        """JSON-ready dict (dates as YYYY-MM-DD, NaN part cells as None)."""
+        d = asdict(self)
+        for k in self.DATE_FIELDS: d[k] = str(d[k]) if d[k] else None
+        d['parts_list'] = [{k: (None if isinstance(v, float) and math.isnan(v) else v) for k, v in p.items()} for p in self.parts_list]
+        d['phases'] = [{k: (_iso(v) if k in self.DATE_FIELDS else None if isinstance(v, float) and math.isnan(v) else v) for k, v in p.items()} for p in self.phases]
+        return d
+
+    @property
+    def exp_markup(self):
+        return (self.exp_markup_pct / 100.0) + 1.0
+
+    @property
+    def is_commuter(self):
+        return not self.is_parts_only and 0 < self.miles < 50
+
+    @property
+    def trip_days(self):
+        if not self.mob_date or not self.return_date: return 0
+        return (self.return_date - self.mob_date).days + 1
+
+    @property
+    def onsite_start(self):
+        """start_date; without one, the day after mobilization (or today) - the app's default."""
+        if self.start_date: return self.start_date
+        return (self.mob_date or datetime.date.today()) + datetime.timedelta(days=1 if self.mob_date else 0)
+
+    @property
+    def crews(self):
+        """
+        The main crew (the top-level schedule fields) followed by each phase with TFAs
+        and work days, as dicts with PHASE_FIELDS keys. Phase dates are parsed; a missing
+        start is the day after mobilization (or the quote's start), a missing mobilization
+        the day before the start. A missing return is left None (start + schedule length).
+        Blank rows are ignored; phases without whole positive TFAs and positive work days,
+        or with out-of-order dates, are left out (see phase_issues).
+        """
+        return self._phase_crews[0]
+
+    @property
+    def phase_issues(self):
+        """Why each left-out (non-blank) phase is not priced (TFAs / work days, start before mobilization, return before start)."""
+        return self._phase_crews[1]
+
+    @property
+    def _phase_crews(self):
+        out = [{'name': "Main Crew", 'tfas': self.tfas, 'days': self.days, 'hrs': self.hrs, 'sat': self.sat, 'sun': self.sun,
+                'mob_date': self.mob_date, 'start_date': self.onsite_start, 'return_date': self.return_date}]
+        issues = []
+        for i, p in enumerate(self.phases):
+            if all(_blank(v) for v in p.values()): continue    # Empty editor row
+            name = str(p.get('name') or '').strip() or f"Phase {i + 2}"
+            tfas, days = _num(p.get('tfas')), _num(p.get('days'))
+            if tfas <= 0 or not tfas.is_integer(): issues.append(f"{name}: TFAs must be a whole number of 1 or more (got {'none' if _blank(p.get('tfas')) else _qty(tfas)})"); continue
+            if days <= 0: issues.append(f"{name}: work days must be 1 or more (got {'none' if _blank(p.get('days')) else _qty(days)})"); continue
+            tfas = int(tfas)
+            mob, start, ret = (_date(p.get(k)) for k in self.DATE_FIELDS)
+            start = start or (mob + datetime.timedelta(days=1) if mob else self.onsite_start)
+            mob = mob or (start - datetime.timedelta(days=1) if start else None)
+            if start and mob and start < mob: issues.append(f"{name}: onsite start {start} is before mobilization {mob}"); continue
+            if ret and start and ret < start: issues.append(f"{name}: return {ret} is before onsite start {start}"); continue
+            out.append({'name': name, 'tfas': tfas, 'days': _qty(days), 'hrs': _qty(_num(p.get('hrs'))) or self.hrs,
+                        'sat': _flag(p.get('sat')), 'sun': _flag(p.get('sun')),
+                        'mob_date': mob, 'start_date': start, 'return_date': ret})
+        return out, issues
+
+@dataclass
+class QuoteResult:
+    svc_lines: list
+    part_lines: list
+    totals: dict
+    calc_log: list
+    rates: dict
+    proj_data: dict
+    labor: dict = field(default_factory=dict)
+
+    @property
+    def all_lines(self):
+        return self.svc_lines + [{'Description': p['Desc'], 'Qty': p['Qty'], 'Rate': p['Rate'], 'Total': p['Total']} for p in self.part_lines]
+
+    @telemetry.timed("quote.audit_text")
+    def audit_text(self, inputs):
+        return logic.generate_audit_text(self.proj_data, self.all_lines, self.totals, self.rates, inputs.to_dict(), self.calc_log)
+
+    def category_totals(self):
+        """{category: total} over LINE_CATEGORIES, zero-filled so quotes can be diffed column by column."""
+        out = dict.fromkeys(LINE_CATEGORIES, 0.0)
+        for line in self.svc_lines: out[line_category(line['Description'])] += line['Total']
+        out['Parts'] += sum(p['Total'] for p in self.part_lines)
+        return out
+
+    def summary(self):
+        """Compact result block stored in the saved JSON so archives carry the quoted figures."""
+        return {"totals": dict(self.totals), "categories": self.category_totals()}
+
+# Saved fields a quote is priced from; files saved before v3.0 hold the schedule and travel inputs only
+PRICING_FIELDS = ('region', 'loc_rates', 'rate_rt', 'rate_ot', 'rate_dt', 'rate_tr', 'rt_cap', 'exp_markup_pct', 'tier', 'parts_list')
+PARTS_PRICING_FIELDS = ('tier', 'parts_list')
+
+def missing_pricing_fields(saved):
+    """PRICING_FIELDS a saved JSON dict lacks (parts-only quotes need the tier and parts only); [] when it can be re-priced."""
+    need = PARTS_PRICING_FIELDS if saved.get('is_parts_only') else PRICING_FIELDS
+    return [k for k in need if k not in saved]
+
+# Service line descriptions -> reporting category (first matching prefix wins).
+LINE_CATEGORIES = {
+    "Travel Labor": "TFA Labor - Travel",
+    "Onsite Labor": "Labor - Onsite",
+    "MBV": "Minimum Billing",
+    "Airfare": "Airfare",
+    "Mileage": "Mileage",
+    "Misc": "Misc Expenses",
+    "Lodging": "Lodging",
+    "Subsistence": "Subsistence",
+    "Contingency": "Contingency",
+    "Parts": None,
+}
+
+def line_category(description):
+    for cat, prefix in LINE_CATEGORIES.items():
+        if prefix and description.startswith(prefix): return cat
+    return "Misc"
+
+def crew_arrays(sched):
+    """QuoteEngine.schedule()'s crew table as float NumPy arrays."""
+    return {k: np.asarray(v, dtype=float) for k, v in sched['table'].items()}
+
+def _num(val):
+    try:
+        f = float(val)
+        return 0.0 if math.isnan(f) else f
+    except (TypeError, ValueError): return 0.0
+
+def _date(val):
+    """date / datetime / Timestamp / 'YYYY-MM-DD' -> date; blanks (None, NaN, NaT, '') -> None."""
+    if val is None or val != val or val == "": return None
+    if isinstance(val, datetime.datetime) or hasattr(val, 'to_pydatetime'): return val.date()
+    if isinstance(val, datetime.date): return val
+    try: return datetime.datetime.strptime(str(val)[:10], "%Y-%m-%d").date()
+    except ValueError: return None
+
+def _iso(val):
+    d = _date(val)
+    return d.isoformat() if d else None
+
+def _blank(val):
+    """Empty data-editor cell: None, NaN / NaT, blank text or an unticked box."""
+    return val is None or val != val or (isinstance(val, str) and not val.strip()) or (isinstance(val, (bool, np.bool_)) and not val)
+
+def _flag(val):
+    return bool(val) and val == val     # NaN (blank editor cell) is False
+
+def _qty(val):
+    """Summed line quantity as a plain number (int when whole, like the per-crew inputs)."""
+    val = float(val)
+    return int(val) if val.is_integer() else val
+
+class QuoteEngine:
+    """
+    Pure quote math. One engine can price any number of quotes:
+        result = QuoteEngine(holidays).compute(QuoteInputs(...))
+    """
+
+    def __init__(self, holidays=None):
+        self.holidays = holidays or frozenset()
+
+    def compute(self, q):
+        svc_lines = []; part_lines = []; calc_log = []; rates_snap = {}; labor_bk = {}
+        exp_markup = q.exp_markup
+
+        if not q.is_parts_only:
+            rates_snap = {'rt': q.rate_rt, 'ot': q.rate_ot, 'dt': q.rate_dt, 'tr': q.rate_tr, 'cap': q.rt_cap}
+            with telemetry.span("engine.schedule"): sched = self.schedule(q)
+            labor_bk = {k: sched[k][0] for k in ("RT", "OT", "DT")}
+            with telemetry.span("engine.labor"): self._labor_lines(q, rates_snap, sched, svc_lines, calc_log)
+            with telemetry.span("engine.mbv"): self._mbv(q, rates_snap, svc_lines, calc_log)
+            with telemetry.span("engine.expenses"): self._expense_lines(q, exp_markup, sched, svc_lines, calc_log)
+
+        with telemetry.span("engine.parts"): self._part_lines(q, part_lines, calc_log)
+
+        svc_total = sum([x['Total'] for x in svc_lines]); parts_total = sum([x['Total'] for x in part_lines])
+        cont_pct = q.cont_pct / 100.0 if not q.is_parts_only else 0.0
+        if not q.is_parts_only and cont_pct > 0:
+            c_cost = logic.smart_round((svc_total + parts_total) * cont_pct)
+            svc_lines.append({"Description": "Contingency", "Qty": 1, "Rate": c_cost, "Total": c_cost})
+            calc_log.append(f"Contingency: {cont_pct*100}% of (${svc_total} + ${parts_total}) = ${c_cost}"); svc_total += c_cost
+
+        totals = {"Service": svc_total, "Parts": parts_total, "Grand": svc_total + parts_total}
+        proj_data = {
+            "Project": q.proj_name, "Site": q.site, "Region": q.region,
+            "Start": q.mob_date.strftime("%Y-%m-%d") if q.mob_date else "N/A",
+            "Return": q.return_date.strftime("%Y-%m-%d") if q.return_date else "N/A",
+            "SOW": q.sow, "Assumptions": q.assume, "ManualClient": q.client.get('Company', ''),
+        }
+        return QuoteResult(svc_lines, part_lines, totals, calc_log, rates_snap, proj_data, labor_bk)
+
+    def schedule(self, q):
+        """
+        RT/OT/DT hours per tech and calendar days for every crew (q.crews), from one
+        batched bucket pass, plus the crew table: {'crews', 'RT', 'OT', 'DT', 'cal_days',
+        'table'} (lists, one entry per crew; crew_arrays(sched) reads the table as arrays)
+        and 'issues' (q.phase_issues).
+        """
+        crews, issues = q._phase_crews
+        profiles = [logic.schedule_profile(c['start_date'], c['days'], c['sat'], c['sun'], self.holidays) for c in crews]
+        rt, ot, dt = logic.schedule_buckets_batch([p[0] for p in profiles], [c['hrs'] for c in crews], q.rt_cap, q.is_key_account)
+        sched = {"crews": crews, "RT": rt.tolist(), "OT": ot.tolist(), "DT": dt.tolist(), "cal_days": [p[1] for p in profiles], "issues": issues}
+        sched['table'] = self._crew_table(q, sched)
+        return sched
+
+    def _crew_table(self, q, sched):
+        """
+        Per-crew quantities (lists, one entry per crew): tfas, travel (billable hrs per
+        tech, both legs), rt / ot / dt (onsite hrs per tech), rooms and sub_days
+        (subsistence days: the main crew's trip or manual override, each phase's own trip).
+        """
+        crews = sched['crews']
+        t_bill_leg = q.man_labor / 2.0 if q.is_commuter else logic.calculate_travel_billable(q.t_hrs)
+        sub_days = [q.man_sub_days if q.override_sub else q.trip_days]
+        for c, cal in zip(crews[1:], sched['cal_days'][1:]):
+            ret = c['return_date'] or c['start_date'] + datetime.timedelta(days=cal)
+            sub_days.append((ret - c['mob_date']).days + 1)
+        tfas = [float(c['tfas']) for c in crews]
+        return {"tfas": tfas, "travel": [t_bill_leg * 2.0] * len(crews), "rt": sched['RT'], "ot": sched['OT'], "dt": sched['DT'],
+                "rooms": [float(math.ceil(t / 2)) for t in tfas], "sub_days": [float(d) for d in sub_days]}
+
+    def _labor_lines(self, q, rates_snap, sched, svc_lines, calc_log):
+        crews = sched['crews']; tab = crew_arrays(sched); tfas = _qty(tab['tfas'].sum())
+        for issue in sched['issues']: calc_log.append(f"Phase Not Priced: {issue}")
+        if len(crews) == 1: calc_log.append(f"Schedule Logic: {q.days} Work Days, {q.hrs} Hrs/Day (Sat={q.sat}, Sun={q.sun}) -> RT:{sched['RT'][0]}, OT:{sched['OT'][0]}, DT:{sched['DT'][0]}")
+        else:
+            for i, c in enumerate(crews):
+                calc_log.append(f"Schedule Logic [{c['name']}]: {c['tfas']} TFAs, {c['days']} Work Days, {c['hrs']} Hrs/Day (Sat={c['sat']}, Sun={c['sun']}) -> RT:{sched['RT'][i]}, OT:{sched['OT'][i]}, DT:{sched['DT'][i]}")
+        if q.is_commuter: t_bill_leg = q.man_labor / 2.0; calc_log.append(f"Travel (Commuter): Manual Override {q.man_labor} hours total.")
+        else: t_bill_leg = logic.calculate_travel_billable(q.t_hrs); calc_log.append(f"Travel (Standard): {q.t_hrs} hrs one-way -> {t_bill_leg} hrs billable per leg (Min 8, Round up 2).")
+        t_bill_total = t_bill_leg * 2.0
+
+        # Tech-hours per bucket over all crews; one crew gives the single-crew arithmetic exactly (hrs * tfas)
+        hours = {k: float((tab[k] * tab['tfas']).sum()) for k in ('rt', 'ot', 'dt')}
+        per = lambda k: f"{tfas} TFAs * {sched[k.upper()][0]} hrs" if len(crews) == 1 else f"{hours[k]} tech-hrs ({len(crews)} crews)"
+        l_tr_tot = t_bill_total * tfas * rates_snap['tr']; svc_lines.append({"Description": "TFA Labor - Travel", "Qty": t_bill_total * tfas, "Rate": rates_snap['tr'], "Total": l_tr_tot}); calc_log.append(f"Labor Travel: {tfas} TFAs * {t_bill_total} hrs * ${rates_snap['tr']} = ${l_tr_tot}")
+        if hours['rt']: l_rt_tot = hours['rt']*rates_snap['rt']; svc_lines.append({"Description": "Labor - Onsite (RT)", "Qty": hours['rt'], "Rate": rates_snap['rt'], "Total": l_rt_tot}); calc_log.append(f"Labor RT: {per('rt')} * ${rates_snap['rt']} = ${l_rt_tot}")
+        if hours['ot']: l_ot_tot = hours['ot']*rates_snap['ot']; svc_lines.append({"Description": "Labor - Onsite (OT)", "Qty": hours['ot'], "Rate": rates_snap['ot'], "Total": l_ot_tot}); calc_log.append(f"Labor OT: {per('ot')} * ${rates_snap['ot']} = ${l_ot_tot}")
+        if hours['dt']: l_dt_tot = hours['dt']*rates_snap['dt']; svc_lines.append({"Description": "Labor - Onsite (DT)", "Qty": hours['dt'], "Rate": rates_snap['dt'], "Total": l_dt_tot})
+
+    def _mbv(self, q, rates_snap, svc_lines, calc_log):
+        """Minimum Billing Value guardrail: tops labor (travel + onsite) up to the regional target."""
+        if q.disable_mbv: calc_log.append("MBV Guardrail: Disabled by user."); return
+        mbv_target = logic.mbv_target(q.region, rates_snap['rt'])
+        current_labor_value = sum(line['Total'] for line in svc_lines if "Labor" in line['Description'])
+        if current_labor_value < mbv_target:
+            shortfall = mbv_target - current_labor_value
+            svc_lines.append({"Description": f"Minimum Billing Adjustment (Target ${mbv_target:,.2f})", "Qty": 1, "Rate": shortfall, "Total": shortfall})
+            calc_log.append(f"MBV Guardrail: Labor ${current_labor_value:,.2f} < Target ${mbv_target:,.2f}. Added Adjustment: ${shortfall:,.2f}")
+        else:
+            calc_log.append(f"MBV Guardrail: Labor ${current_labor_value:,.2f} meets Target ${mbv_target:,.2f}. No adjustment.")
+
+    def _expense_lines(self, q, exp_markup, sched, svc_lines, calc_log):
+        """Airfare per tech, mileage per crew trip, misc once, lodging / subsistence per crew trip (rolled up)."""
+        crews = sched['crews']; tab = crew_arrays(sched); n = len(crews)
+        tfas = _qty(tab['tfas'].sum()); is_commuter = q.is_commuter
+        if q.flight_cost: f_rate = logic.smart_round(q.flight_cost * exp_markup); f_tot = f_rate * tfas; svc_lines.append({"Description": "Airfare", "Qty": tfas, "Rate": f_rate, "Total": f_tot}); calc_log.append(f"Airfare: {tfas} Tix * ${f_rate} (Cost ${q.flight_cost} + {int((exp_markup-1)*100)}%) = ${f_tot}")
+        if (q.mode == "DRIVE" or q.mode == "FLY then DRIVE") and q.miles > 0: m_tot = logic.smart_round(q.miles * 1.10) * n; svc_lines.append({"Description": "Mileage / Rental Fuel", "Qty": q.miles * n, "Rate": 1.10, "Total": m_tot})
+        if q.misc_exp: m_rate = logic.smart_round(q.misc_exp * exp_markup); svc_lines.append({"Description": "Misc Expenses (Car Rental, Visa, Transport)", "Qty": 1, "Rate": m_rate, "Total": m_rate}); calc_log.append(f"Misc Exp: ${q.misc_exp} + Markup = ${m_rate}")
+
+        final_days = q.man_sub_days if q.override_sub else q.trip_days   # Main crew
+        rooms = _qty(tab['rooms'].sum()); l_qty = _qty((tab['sub_days'] * tab['rooms']).sum()); mie_qty = _qty((tab['sub_days'] * tab['tfas']).sum())
+        lodg_rate = 0.0 if is_commuter else logic.smart_round(q.loc_rates['lodging']*1.2*exp_markup)
+        mie_rate = logic.smart_round(q.loc_rates['mie']*(0.5 if is_commuter else 1.0)*exp_markup)
+        trips = ", ".join(f"{c['name']} {_qty(d)}d x {_qty(r)} rm / {c['tfas']} tech" for c, d, r in zip(crews, tab['sub_days'], tab['rooms']))
+
+        if lodg_rate > 0:
+            l_tot = lodg_rate * l_qty; svc_lines.append({"Description": f"Lodging ({rooms} Room{'s' if rooms > 1 else ''})", "Qty": l_qty, "Rate": lodg_rate, "Total": l_tot})
+            calc_log.append(f"Lodging: {final_days} nights * {rooms} rooms * ${lodg_rate} = ${l_tot}" if n == 1 else f"Lodging: {l_qty} room-nights ({trips}) * ${lodg_rate} = ${l_tot}")
+        mie_tot = mie_rate * mie_qty; svc_lines.append({"Description": f"Subsistence ({tfas} Tech{'s' if tfas > 1 else ''})", "Qty": mie_qty, "Rate": mie_rate, "Total": mie_tot})
+        calc_log.append(f"Subsistence: {final_days} days * {tfas} techs * ${mie_rate} = ${mie_tot}" if n == 1 else f"Subsistence: {mie_qty} tech-days ({trips}) * ${mie_rate} = ${mie_tot}")
+
+    def _part_lines(self, q, part_lines, calc_log):
+        if not q.parts_list: return
+        qtys = [_num(p.get('Qty')) for p in q.parts_list]; costs = [_num(p.get('Cost')) for p in q.parts_list]
+        priced = logic.price_parts_batch(costs, qtys, q.tier)
+        for i, p in enumerate(q.parts_list):
+            if qtys[i] <= 0: continue
+            sell = float(priced['sell'][i])
+            part_lines.append({"Line": f"Line {i+1:02d}", "Part": p.get('Part #'), "Desc": p.get('Description'), "Qty": qtys[i], "Rate": sell, "Total": float(priced['total'][i]), "Lead": p.get('Lead Time')})
+            calc_log.append(f"Part: {p.get('Part #')} Cost ${costs[i]} -> Sell ${sell} (Markup {priced['markup'][i]:.2f}x)")
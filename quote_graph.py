@@ -0,0 +1,171 @@
+# src/quote_graph.py
+# ======================================================
+# AFP ESTIMATOR - INCREMENTAL QUOTE MODULE
+# Version: v3.0
+# Updated: 2026-10-17
+# Description: The quote as a dependency graph of memoized nodes
+#              (schedule -> labor -> MBV -> contingency -> totals, part row
+#              -> parts subtotal, ...). Each node records which QuoteInputs
+#              fields it read; the next compute() re-runs only nodes that
+#              read a changed field or are fed by a node whose value
+#              changed, and part rows are repriced only when the row itself
+#              changed. The pricing year is a graph input like the fields. Nodes call the QuoteEngine stages, so results match
+#              QuoteEngine.compute() exactly.
+#
+# Usage:       graph = QuoteGraph(holidays); result = graph.compute(inputs)
+#              graph.recomputed  -> nodes re-run by the last compute()
+# ======================================================
+
+import pickle
+import datetime
+from dataclasses import fields
+
+import logic
+import telemetry
+from quote_engine import QuoteEngine, QuoteResult, _num
+
+_MISSING = object()
+_SCALARS = frozenset((str, int, float, bool, type(None), datetime.date))
+
+def _fingerprint(val):
+    """Comparable snapshot of an input value: scalars as-is, containers as pickled bytes (where, unlike ==, NaN matches NaN)."""
+    return val if type(val) in _SCALARS else pickle.dumps(val, 5)
+
+def _same_row(old, new):
+    return old == new or pickle.dumps(old, 5) == pickle.dumps(new, 5)   # Second test: rows with blank (NaN) cells
+
+def _graph_inputs():
+    """Inputs that are not QuoteInputs fields but change results; tracked like fields."""
+    return {"pricing_year": datetime.date.today().year}
+
+class _Reads:
+    """QuoteInputs view (plus the graph inputs) that records which fields a node reads (properties are evaluated through the view)."""
+    __slots__ = ("_q", "_seen", "_extra")
+
+    def __init__(self, q, seen, extra):
+        self._q = q; self._seen = seen; self._extra = extra
+
+    def __getattr__(self, name):
+        if name in self._extra: self._seen.add(name); return self._extra[name]
+        attr = getattr(type(self._q), name, None)
+        if isinstance(attr, property): return attr.fget(self)
+        self._seen.add(name)
+        return getattr(self._q, name)
+
+# --- NODES (each: fn(graph, inputs, *dependency values) -> value) ---
+
+def _rates(g, q):
+    if q.is_parts_only: return {}
+    return {'rt': q.rate_rt, 'ot': q.rate_ot, 'dt': q.rate_dt, 'tr': q.rate_tr, 'cap': q.rt_cap}
+
+def _schedule(g, q):
+    """Every crew's buckets, calendar days and crew table (QuoteEngine.schedule; buckets in one batched pass)."""
+    if q.is_parts_only: return {}
+    return g.engine.schedule(q)
+
+def _labor(g, q, rates, schedule):
+    lines, log = [], []
+    if not q.is_parts_only: g.engine._labor_lines(q, rates, schedule, lines, log)
+    return lines, log
+
+def _mbv(g, q, rates, labor):
+    lines, log = list(labor[0]), []
+    if not q.is_parts_only: g.engine._mbv(q, rates, lines, log)
+    return lines[len(labor[0]):], log
+
+def _expenses(g, q, schedule):
+    lines, log = [], []
+    if not q.is_parts_only: g.engine._expense_lines(q, q.exp_markup, schedule, lines, log)
+    return lines, log
+
+def _parts(g, q):
+    """Part lines; only rows that differ from the same row of the previous compute (or a tier/year change) are repriced."""
+    rows = q.parts_list; ctx = (q.tier, q.pricing_year)
+    prev = g._part_rows if g._part_ctx == ctx else []
+    slots = [prev[i] if i < len(prev) and _same_row(prev[i][0], p) else None for i, p in enumerate(rows)]
+    todo = [i for i, s in enumerate(slots) if s is None]
+    if todo:
+        qtys = [_num(rows[i].get('Qty')) for i in todo]; costs = [_num(rows[i].get('Cost')) for i in todo]
+        priced = logic.price_parts_batch(costs, qtys, ctx[0], year=ctx[1])
+        for j, i in enumerate(todo):
+            p = rows[i]; sell = float(priced['sell'][j])
+            line = {"Line": f"Line {i+1:02d}", "Part": p.get('Part #'), "Desc": p.get('Description'), "Qty": qtys[j], "Rate": sell, "Total": float(priced['total'][j]), "Lead": p.get('Lead Time')}
+            slots[i] = (dict(p), line if qtys[j] > 0 else None, f"Part: {p.get('Part #')} Cost ${costs[j]} -> Sell ${sell} (Markup {priced['markup'][j]:.2f}x)")
+        g.recomputed.extend(f"part:{i + 1}" for i in todo)
+    g._part_rows = slots; g._part_ctx = ctx         # Row copies: callers may edit their rows in place
+    return [s[1] for s in slots if s[1] is not None], [s[2] for s in slots if s[1] is not None]
+
+def _contingency(g, q, labor, mbv, expenses, parts):
+    """(lines, log, totals): contingency on service + parts, and the quote totals."""
+    svc_total = sum([x['Total'] for x in labor[0] + mbv[0] + expenses[0]]); parts_total = sum([x['Total'] for x in parts[0]])
+    lines, log = [], []
+    cont_pct = q.cont_pct / 100.0 if not q.is_parts_only else 0.0
+    if not q.is_parts_only and cont_pct > 0:
+        c_cost = logic.smart_round((svc_total + parts_total) * cont_pct)
+        lines.append({"Description": "Contingency", "Qty": 1, "Rate": c_cost, "Total": c_cost})
+        log.append(f"Contingency: {cont_pct*100}% of (${svc_total} + ${parts_total}) = ${c_cost}"); svc_total += c_cost
+    return lines, log, {"Service": svc_total, "Parts": parts_total, "Grand": svc_total + parts_total}
+
+def _proj_data(g, q):
+    return {
+        "Project": q.proj_name, "Site": q.site, "Region": q.region,
+        "Start": q.mob_date.strftime("%Y-%m-%d") if q.mob_date else "N/A",
+        "Return": q.return_date.strftime("%Y-%m-%d") if q.return_date else "N/A",
+        "SOW": q.sow, "Assumptions": q.assume, "ManualClient": q.client.get('Company', ''),
+    }
+
+# Node name -> (upstream nodes, fn); listed in dependency order
+NODES = {
+    "rates": ((), _rates),
+    "schedule": ((), _schedule),
+    "labor": (("rates", "schedule"), _labor),
+    "mbv": (("rates", "labor"), _mbv),
+    "expenses": (("schedule",), _expenses),
+    "parts": ((), _parts),
+    "contingency": (("labor", "mbv", "expenses", "parts"), _contingency),
+    "proj_data": ((), _proj_data),
+}
+
+class QuoteGraph:
+    """
+    Memoized quote computation for one evolving quote (e.g. one app session):
+        graph = QuoteGraph(holidays)
+        result = graph.compute(inputs)     # everything, the first time
+        result = graph.compute(edited)     # only what the edit reaches
+        graph.recomputed                   # ['parts', 'part:3', 'contingency']
+    Line dicts are shared between successive results: treat them as read-only.
+    """
+
+    def __init__(self, holidays=None):
+        self.engine = QuoteEngine(holidays); self.holidays = self.engine.holidays
+        self.reset()
+
+    def reset(self):
+        """Forgets every memoized node (the next compute() runs the whole graph)."""
+        self._values = {}; self._reads = {}; self._fields = {}; self._part_rows = []; self._part_ctx = None; self.recomputed = []
+
+    def compute(self, q):
+        """QuoteResult for inputs q, re-running only the nodes the changes since the last call reach."""
+        extra = _graph_inputs()
+        now = {f.name: _fingerprint(getattr(q, f.name)) for f in fields(q)}; now.update(extra)
+        changed = {k for k, v in now.items() if self._fields.get(k, _MISSING) != v}
+        self.recomputed = []; dirty = set()
+        try:
+            for name, (deps, fn) in NODES.items():
+                if name in self._values and not (self._reads[name] & changed) and dirty.isdisjoint(deps): continue
+                seen = set()
+                with telemetry.span(f"graph.{name}"): value = fn(self, _Reads(q, seen, extra), *(self._values[d] for d in deps))
+                self.recomputed.append(name)
+                if self._values.get(name, _MISSING) != value: dirty.add(name)   # Unchanged output stops propagation
+                self._values[name] = value; self._reads[name] = seen
+        except BaseException:
+            self.reset(); raise       # A half-updated graph would be stale for the next call
+        self._fields = now
+        return self.result()
+
+    def result(self):
+        """QuoteResult assembled from the memoized nodes (fresh lists; line dicts shared)."""
+        v = self._values; labor, mbv, exp, parts, cont = v['labor'], v['mbv'], v['expenses'], v['parts'], v['contingency']
+        return QuoteResult(labor[0] + mbv[0] + exp[0] + cont[0], list(parts[0]), dict(cont[2]),
+                           labor[1] + mbv[1] + exp[1] + parts[1] + cont[1], dict(v['rates']), dict(v['proj_data']),
+                           {k: v['schedule'][k][0] for k in ("RT", "OT", "DT")} if v['schedule'] else {})
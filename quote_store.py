@@ -0,0 +1,271 @@
+# src/quote_store.py
+# ======================================================
+# AFP ESTIMATOR - QUOTE REPOSITORY MODULE
+# Version: v3.0
+# Updated: 2026-10-17
+# Description: Embedded SQLite store for saved quotes. Each quote keeps its
+#              full input snapshot (the *_DATA.json dict), computed totals
+#              and line items; status, client, site, region and dates are
+#              indexed columns, and project / client / site text is searched
+#              through an FTS5 trigram index (plain LIKE scan where SQLite
+#              lacks it, or for 1-2 character text), so listing / searching
+#              stays a single indexed query with tens of thousands of
+#              quotes. The database
+#              runs in WAL mode with one connection per thread; writes take
+#              an immediate lock, so concurrent Streamlit sessions saving at
+#              once queue instead of failing.
+#
+# Usage:       python quote_store.py import QUOTE_DIR [--recursive] [--db PATH]
+#              python quote_store.py list [--status Submitted] [--client TEXT] [--db PATH]
+# ======================================================
+
+import os
+import json
+import sqlite3
+import argparse
+import datetime
+import threading
+
+import ingest
+from quote_engine import QuoteInputs, QuoteEngine, line_category, missing_pricing_fields
+
+DB_NAME = "quotes.db"
+SCHEMA_VERSION = 2          # 2: quotes_fts
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS quotes (
+    id            INTEGER PRIMARY KEY,
+    proj_name     TEXT NOT NULL DEFAULT '',
+    status        TEXT NOT NULL DEFAULT 'Draft',
+    company       TEXT NOT NULL DEFAULT '' COLLATE NOCASE,
+    site          TEXT NOT NULL DEFAULT '' COLLATE NOCASE,
+    region        TEXT NOT NULL DEFAULT '',
+    quote_type    TEXT NOT NULL DEFAULT 'Service',
+    mob_date      TEXT,
+    return_date   TEXT,
+    service_total REAL NOT NULL DEFAULT 0,
+    parts_total   REAL NOT NULL DEFAULT 0,
+    grand_total   REAL NOT NULL DEFAULT 0,
+    data_version  TEXT NOT NULL DEFAULT '',
+    created_at    TEXT NOT NULL,
+    updated_at    TEXT NOT NULL,
+    inputs        TEXT NOT NULL,
+    result        TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS ix_quotes_updated ON quotes(updated_at, id);
+CREATE INDEX IF NOT EXISTS ix_quotes_status  ON quotes(status, updated_at);
+CREATE INDEX IF NOT EXISTS ix_quotes_company ON quotes(company, updated_at);
+CREATE INDEX IF NOT EXISTS ix_quotes_site    ON quotes(company, site);
+CREATE INDEX IF NOT EXISTS ix_quotes_region  ON quotes(region, updated_at);
+CREATE INDEX IF NOT EXISTS ix_quotes_mob     ON quotes(mob_date);
+CREATE TABLE IF NOT EXISTS quote_lines (
+    quote_id    INTEGER NOT NULL REFERENCES quotes(id) ON DELETE CASCADE,
+    seq         INTEGER NOT NULL,
+    kind        TEXT NOT NULL,          -- 'service' | 'part'
+    category    TEXT NOT NULL,
+    part_no     TEXT,
+    description TEXT NOT NULL DEFAULT '',
+    qty         REAL,
+    rate        REAL,
+    total       REAL,
+    PRIMARY KEY (quote_id, seq)
+) WITHOUT ROWID;
+"""
+
+# External-content trigram index over the searchable text columns, kept in step by triggers
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS quotes_fts USING fts5(proj_name, company, site, content='quotes', content_rowid='id', tokenize='trigram');
+CREATE TRIGGER IF NOT EXISTS quotes_ai AFTER INSERT ON quotes BEGIN
+    INSERT INTO quotes_fts(rowid, proj_name, company, site) VALUES (new.id, new.proj_name, new.company, new.site);
+END;
+CREATE TRIGGER IF NOT EXISTS quotes_ad AFTER DELETE ON quotes BEGIN
+    INSERT INTO quotes_fts(quotes_fts, rowid, proj_name, company, site) VALUES ('delete', old.id, old.proj_name, old.company, old.site);
+END;
+CREATE TRIGGER IF NOT EXISTS quotes_au AFTER UPDATE OF proj_name, company, site ON quotes
+WHEN old.proj_name IS NOT new.proj_name OR old.company IS NOT new.company OR old.site IS NOT new.site BEGIN
+    INSERT INTO quotes_fts(quotes_fts, rowid, proj_name, company, site) VALUES ('delete', old.id, old.proj_name, old.company, old.site);
+    INSERT INTO quotes_fts(rowid, proj_name, company, site) VALUES (new.id, new.proj_name, new.company, new.site);
+END;
+"""
+
+LIST_COLUMNS = ("id", "proj_name", "status", "company", "site", "region", "quote_type", "mob_date", "return_date", "grand_total", "updated_at")
+
+def _now():
+    return datetime.datetime.now().isoformat(timespec="seconds")
+
+def _iso(val):
+    if isinstance(val, (datetime.date, datetime.datetime)): return val.isoformat()[:10]
+    return str(val)[:10] if val else None
+
+def _num(val):
+    try: return float(val)
+    except (TypeError, ValueError): return None
+
+class QuoteStore:
+    """
+    store = QuoteStore(path)
+    store.save(inputs, result, quote_id=None) -> id      (update when quote_id exists, else insert)
+    store.search(status=[...], company="X", text="...", limit=25, offset=0) -> [row dicts]
+    store.count(...same filters) / store.get(id) -> saved JSON dict / store.lines(id) / store.delete(id)
+    """
+
+    def __init__(self, path, timeout=15.0):
+        self.path = path; self.timeout = timeout
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            conn.executescript(f"BEGIN IMMEDIATE;{_SCHEMA}PRAGMA user_version = {SCHEMA_VERSION};COMMIT;")
+            try: conn.executescript(f"BEGIN IMMEDIATE;{_FTS_SCHEMA}INSERT INTO quotes_fts(quotes_fts) VALUES ('rebuild');COMMIT;")
+            except sqlite3.OperationalError:   # No FTS5 / trigram tokenizer in this SQLite: text search scans
+                if conn.in_transaction: conn.execute("ROLLBACK")
+        self.has_fts = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'quotes_fts'").fetchone() is not None
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; write transactions are opened explicitly (BEGIN IMMEDIATE).
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL"); conn.execute("PRAGMA synchronous=NORMAL"); conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _write(self, fn):
+        """Runs fn(conn) in one write transaction; the immediate lock makes concurrent writers wait (busy timeout)."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try: out = fn(conn)
+        except BaseException:
+            conn.execute("ROLLBACK"); raise
+        conn.execute("COMMIT")
+        return out
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None: conn.close(); self._local.conn = None
+
+    # --- WRITE ---
+    def save(self, inputs, result, quote_id=None, data_version=""):
+        """Stores QuoteInputs + QuoteResult. Updates quote_id in place when it exists; returns the quote id."""
+        saved = inputs.to_dict(); client = inputs.client or {}
+        row = {"proj_name": inputs.proj_name or "", "status": inputs.status or "Draft", "company": client.get('Company', '') or "",
+               "site": inputs.site or client.get('Site', '') or "", "region": inputs.region or "",
+               "quote_type": "Parts Only" if inputs.is_parts_only else "Service", "mob_date": _iso(inputs.mob_date), "return_date": _iso(inputs.return_date),
+               "service_total": result.totals['Service'], "parts_total": result.totals['Parts'], "grand_total": result.totals['Grand'],
+               "data_version": data_version or "", "updated_at": _now(),
+               "inputs": json.dumps(saved, default=str), "result": json.dumps(result.summary(), default=str)}
+        lines = [("service", line_category(l['Description']), None, l['Description'], _num(l['Qty']), _num(l['Rate']), _num(l['Total'])) for l in result.svc_lines]
+        lines += [("part", "Parts", p.get('Part'), p.get('Desc') or "", _num(p['Qty']), _num(p['Rate']), _num(p['Total'])) for p in result.part_lines]
+
+        def tx(conn):
+            qid = quote_id
+            if qid is not None and conn.execute("SELECT 1 FROM quotes WHERE id = ?", (qid,)).fetchone():
+                conn.execute(f"UPDATE quotes SET {', '.join(f'{k} = :{k}' for k in row)} WHERE id = :id", {**row, "id": qid})
+                conn.execute("DELETE FROM quote_lines WHERE quote_id = ?", (qid,))
+            else:
+                cols = list(row) + ["created_at"]
+                qid = conn.execute(f"INSERT INTO quotes ({', '.join(cols)}) VALUES ({', '.join(':' + c for c in cols)})", {**row, "created_at": row['updated_at']}).lastrowid
+            conn.executemany("INSERT INTO quote_lines VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [(qid, i, *l) for i, l in enumerate(lines)])
+            return qid
+        return self._write(tx)
+
+    def set_status(self, quote_id, status):
+        def tx(conn):
+            conn.execute("UPDATE quotes SET status = ?, updated_at = ? WHERE id = ?", (status, _now(), quote_id))
+            saved = conn.execute("SELECT inputs FROM quotes WHERE id = ?", (quote_id,)).fetchone()
+            if saved:
+                d = json.loads(saved[0]); d['status'] = status
+                conn.execute("UPDATE quotes SET inputs = ? WHERE id = ?", (json.dumps(d, default=str), quote_id))
+        self._write(tx)
+
+    def delete(self, quote_id):
+        self._write(lambda conn: conn.execute("DELETE FROM quotes WHERE id = ?", (quote_id,)))
+
+    # --- READ ---
+    def _where(self, text=None, status=None, company=None, site=None, region=None, date_from=None, date_to=None):
+        clauses, args = [], []
+        if status:
+            status = [status] if isinstance(status, str) else list(status)
+            clauses.append(f"status IN ({', '.join('?' * len(status))})"); args += status
+        if company: clauses.append("company = ?"); args.append(company)          # NOCASE column -> index lookup
+        if site: clauses.append("site = ?"); args.append(site)
+        if region: clauses.append("region = ?"); args.append(region)
+        if date_from: clauses.append("mob_date >= ?"); args.append(_iso(date_from))
+        if date_to: clauses.append("mob_date <= ?"); args.append(_iso(date_to))
+        if text and self.has_fts and len(text) >= 3:   # Trigram phrase = case-insensitive substring of any column
+            clauses.append("id IN (SELECT rowid FROM quotes_fts WHERE quotes_fts MATCH ?)"); args.append('"' + text.replace('"', '""') + '"')
+        elif text:
+            like = "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            clauses.append("(proj_name LIKE ? ESCAPE '\\' OR company LIKE ? ESCAPE '\\' OR site LIKE ? ESCAPE '\\')"); args += [like] * 3
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", args
+
+    def search(self, limit=25, offset=0, **filters):
+        """Newest first. Filters: text (substring of project/client/site), status (str or list), company, site, region, date_from, date_to (mob date)."""
+        where, args = self._where(**filters)
+        sql = f"SELECT {', '.join(LIST_COLUMNS)} FROM quotes{where} ORDER BY updated_at DESC, id DESC LIMIT ? OFFSET ?"
+        return [dict(r) for r in self._conn().execute(sql, args + [int(limit), int(offset)])]
+
+    def count(self, **filters):
+        where, args = self._where(**filters)
+        return self._conn().execute(f"SELECT COUNT(*) FROM quotes{where}", args).fetchone()[0]
+
+    def get(self, quote_id):
+        """The stored *_DATA.json dict (inputs + 'result'), or None."""
+        r = self._conn().execute("SELECT inputs, result FROM quotes WHERE id = ?", (quote_id,)).fetchone()
+        if r is None: return None
+        return {**json.loads(r['inputs']), "result": json.loads(r['result'])}
+
+    def lines(self, quote_id):
+        return [dict(r) for r in self._conn().execute("SELECT kind, category, part_no, description, qty, rate, total FROM quote_lines WHERE quote_id = ? ORDER BY seq", (quote_id,))]
+
+    def companies(self):
+        return [r[0] for r in self._conn().execute("SELECT DISTINCT company FROM quotes WHERE company != '' ORDER BY company")]
+
+    # --- IMPORT ---
+    def import_files(self, paths, engine=None, on_error=None):
+        """
+        Loads saved *_DATA.json files (priced with their own stored rates). Files saved
+        without those rates / parts are skipped (on_error). Returns the number imported.
+        """
+        engine = engine or QuoteEngine(); n = 0
+        for path in paths:
+            try:
+                with open(path, "r", encoding="utf-8") as f: saved = json.load(f)
+                missing = missing_pricing_fields(saved)
+                if missing: raise ValueError(f"not re-priceable: saved without {', '.join(missing)}")
+                q = QuoteInputs.from_dict(saved)
+                self.save(q, engine.compute(q)); n += 1
+            except Exception as e:
+                if on_error: on_error(path, e)
+        return n
+
+def default_path(source_dirs=None):
+    """quotes.db in the first Shared_Data folder (AFP_QUOTE_DB overrides)."""
+    if os.environ.get("AFP_QUOTE_DB"): return os.environ["AFP_QUOTE_DB"]
+    dirs = source_dirs or ingest.default_source_dirs() or ["Shared_Data"]
+    return os.path.join(dirs[0], DB_NAME)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Quote repository (SQLite) tools.")
+    ap.add_argument("--db", help="Database file (default: Shared_Data/quotes.db)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p_imp = sub.add_parser("import", help="Import saved *_DATA.json files")
+    p_imp.add_argument("quote_dir"); p_imp.add_argument("--recursive", action="store_true")
+    p_ls = sub.add_parser("list", help="List stored quotes, newest first")
+    p_ls.add_argument("--status", action="append"); p_ls.add_argument("--client"); p_ls.add_argument("--text")
+    p_ls.add_argument("--limit", type=int, default=50)
+    args = ap.parse_args()
+
+    store = QuoteStore(args.db or default_path())
+    if args.cmd == "import":
+        from requote import iter_quote_files
+        hol = ingest.find_source(ingest.default_source_dirs(), ["holidays.csv"])
+        n = store.import_files(iter_quote_files(args.quote_dir, recursive=args.recursive), QuoteEngine(ingest.load_holidays(hol) if hol else None),
+                               lambda path, e: print(f"  skip {os.path.basename(path)}: {e}"))
+        print(f"Imported {n} quote(s) -> {store.path}")
+    else:
+        rows = store.search(limit=args.limit, status=args.status, company=args.client, text=args.text)
+        print(f"{store.count(status=args.status, company=args.client, text=args.text)} quote(s)")
+        for r in rows:
+            print(f"  #{r['id']:<6} {r['updated_at']}  {r['status']:<18} {r['company'][:28]:<28} {r['proj_name'][:30]:<30} ${r['grand_total']:>12,.2f}")
@@ -0,0 +1,271 @@
+# src/rate_index.py
+# ======================================================
+# AFP ESTIMATOR - RATE INDEX MODULE
+# Version: v3.0
+# Updated: 2026-10-17
+# Description: Per diem lookup structures over the compiled snapshot
+#              (see ingest.py). The GSA ZIP table is a dense, memory-mapped
+#              array keyed by 5-digit ZIP so lookups are O(1) and never touch
+#              pandas. The State Dept rows are held as a country search trie
+#              plus per-location season tables. RateCalendar turns the
+#              seasonal GSA master rates and State Dept seasons into dense
+#              daily rates with prefix sums, so the lodging / M&IE total of
+#              any date range is two array lookups.
+# ======================================================
+
+import bisect
+import datetime
+import numpy as np
+
+ZIP_SLOTS = 100000
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+# One record per possible ZIP (00000-99999). Lodging is stored in calendar
+# order (index 0 = January) regardless of the fiscal-year column order.
+ZIP_DTYPE = np.dtype([
+    ('valid', 'u1'),
+    ('dest_id', '<u2'),
+    ('lodging', '<u2', (12,)),
+    ('mie', '<u2'),
+    ('name_off', '<u4'),
+    ('name_len', '<u2'),
+])
+
+def normalize_zip(zip_code):
+    """Returns the integer slot for a ZIP ('68127', '68127-1234', 68127.0) or None."""
+    z = str(zip_code).strip().split('-')[0]
+    if z.endswith('.0'): z = z[:-2]
+    if not z.isdigit() or len(z) > 5: return None
+    return int(z)
+
+class ZipIndex:
+    """Read-only view over a compiled ZIP index. Safe to share across sessions."""
+
+    def __init__(self, table, names):
+        self.table = table
+        self.names = names
+
+    @classmethod
+    def from_table(cls, cols):
+        """Wraps the 'gsa_zip' snapshot table (see ingest.compile_gsa_zip)."""
+        return cls(cols['records'], bytes(cols['names']))
+
+    def lookup(self, zip_code, month):
+        """Returns {'lodging', 'mie', 'city'} for a ZIP and calendar month (1-12), or None."""
+        slot = normalize_zip(zip_code)
+        if slot is None: return None
+        rec = self.table[slot]
+        if not rec['valid']: return None
+        off, ln = int(rec['name_off']), int(rec['name_len'])
+        return {"lodging": float(rec['lodging'][month - 1]), "mie": float(rec['mie']), "city": self.names[off:off + ln].decode('utf-8')}
+
+    def destination(self, zip_code):
+        """GSA destination ID for a ZIP (master rate file 'ID'; 0 = standard CONUS rate), or None."""
+        slot = normalize_zip(zip_code)
+        if slot is None or not self.table['valid'][slot]: return None
+        return int(self.table['dest_id'][slot])
+
+# --- INTERNATIONAL (DEPT OF STATE) ---
+
+def _season_day(text):
+    """'15-Dec' -> day of year in a leap reference year (so 29-Feb is addressable)."""
+    d = datetime.datetime.strptime(f"{text.strip()}-2000", "%d-%b-%Y")
+    return d.timetuple().tm_yday
+
+def _intl_rec(row, key):
+    lodging = float(row.get('Lodging') or 0)
+    if lodging == 0: lodging = 150.0
+    return {"lodging": lodging, "mie": float(row.get('Meals & Incidentals') or 0), "city": key[1], "country": key[0]}
+
+# --- DAILY RATE CALENDAR ---
+
+CALENDAR_YEARS = 4          # Dense span: Jan 1 last year .. Dec 31 two years ahead; other dates are summed day by day
+_LEAP_MONTH_START = np.cumsum([0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30])  # Day-of-year offsets in a leap year
+
+def _ref_doy(d):
+    """Day of year in the leap reference year (1..366), so 29-Feb is addressable and seasons repeat every year."""
+    return int(_LEAP_MONTH_START[d.month - 1]) + d.day
+
+def _gsa_season_day(text):
+    """'October 1' -> reference day of year."""
+    return datetime.datetime.strptime(f"{text.strip()} 2000", "%B %d %Y").timetuple().tm_yday
+
+def _fill_gaps(table):
+    """Days no season covers (e.g. 29-Feb after a 'February 28' season end) take the previous day's rate, wrapping the year."""
+    missing = np.flatnonzero(table[1:] < 0) + 1
+    if len(missing) == 366: table[1:] = 0; return table
+    for _ in range(2):
+        for d in missing:
+            if table[d] < 0: table[d] = table[d - 1 if d > 1 else 366]
+    return table
+
+class RateCalendar:
+    """
+    Daily lodging / M&IE per key (GSA destination ID, or State Dept (country,
+    location)) with prefix sums over a dense span of days:
+        totals(key, start, end)   -> (lodging sum, M&IE sum, days), inclusive, O(1)
+        average(key, start, end)  -> {'lodging', 'mie', 'seasonal'} per-day average
+        totals_batch(keys, starts, ends) -> arrays, for thousands of ranges at once
+    """
+
+    def __init__(self, keys, lodging_doy, mie_doy, first_day=None, years=CALENDAR_YEARS):
+        # lodging_doy / mie_doy: (len(keys), 367) rates by reference day of year (column 0 unused)
+        self.keys = {k: i for i, k in enumerate(keys)}
+        self.lodging_doy = np.asarray(lodging_doy, dtype=np.int32); self.mie_doy = np.asarray(mie_doy, dtype=np.int32)
+        self.first_day = first_day or datetime.date(datetime.date.today().year - 1, 1, 1)
+        self.n_days = (datetime.date(self.first_day.year + years, self.first_day.month, self.first_day.day) - self.first_day).days
+        dates = np.datetime64(self.first_day, 'D') + np.arange(self.n_days)
+        months = dates.astype('datetime64[M]'); dom = (dates - months).astype(int) + 1
+        doy = _LEAP_MONTH_START[months.astype(int) % 12] + dom
+        self.cum_lodging = np.zeros((len(keys), self.n_days + 1), dtype=np.int32); self.cum_mie = np.zeros_like(self.cum_lodging)   # Sums of < $10k/day rates fit int32
+        np.cumsum(self.lodging_doy[:, doy], axis=1, out=self.cum_lodging[:, 1:]); np.cumsum(self.mie_doy[:, doy], axis=1, out=self.cum_mie[:, 1:])
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    @property
+    def nbytes(self):
+        return self.cum_lodging.nbytes + self.cum_mie.nbytes + self.lodging_doy.nbytes + self.mie_doy.nbytes
+
+    def day_rate(self, key, day):
+        """(lodging, M&IE) for one night/day, or None for an unknown key."""
+        i = self.keys.get(key)
+        if i is None: return None
+        d = _ref_doy(day)
+        return int(self.lodging_doy[i, d]), int(self.mie_doy[i, d])
+
+    def totals(self, key, start, end):
+        """(lodging sum, M&IE sum, days) over start..end inclusive, or None (unknown key / end before start)."""
+        i = self.keys.get(key)
+        if i is None or end < start: return None
+        a = (start - self.first_day).days; b = (end - self.first_day).days + 1
+        if a >= 0 and b <= self.n_days:
+            return int(self.cum_lodging[i, b] - self.cum_lodging[i, a]), int(self.cum_mie[i, b] - self.cum_mie[i, a]), b - a
+        lodging = mie = 0; d = start    # Outside the dense span: same rates, summed per day
+        while d <= end:
+            r = _ref_doy(d); lodging += int(self.lodging_doy[i, r]); mie += int(self.mie_doy[i, r]); d += datetime.timedelta(days=1)
+        return lodging, mie, (end - start).days + 1
+
+    def average(self, key, start, end):
+        """{'lodging', 'mie', 'seasonal'}: per-day averages over start..end (seasonal = the rate changes within the range)."""
+        t = self.totals(key, start, end)
+        if t is None: return None
+        lodging, mie, days = t; first = self.day_rate(key, start)
+        return {"lodging": round(lodging / days, 2), "mie": round(mie / days, 2), "seasonal": lodging != first[0] * days or mie != first[1] * days}
+
+    def totals_batch(self, keys, starts, ends):
+        """(lodging, mie, days) int arrays for many ranges; unknown keys or empty ranges give -1 days and zero sums."""
+        rows = np.array([self.keys.get(k, -1) for k in keys], dtype=np.int64)
+        base = np.datetime64(self.first_day, 'D')
+        a = (np.asarray(starts, dtype='datetime64[D]') - base).astype(np.int64); b = (np.asarray(ends, dtype='datetime64[D]') - base).astype(np.int64) + 1
+        ok = (rows >= 0) & (b > a); inside = ok & (a >= 0) & (b <= self.n_days)
+        lodging = np.zeros(len(rows), dtype=np.int64); mie = np.zeros_like(lodging); days = np.where(ok, b - a, -1)
+        r, aa, bb = rows[inside], a[inside], b[inside]
+        lodging[inside] = self.cum_lodging[r, bb] - self.cum_lodging[r, aa]; mie[inside] = self.cum_mie[r, bb] - self.cum_mie[r, aa]
+        for j in np.flatnonzero(ok & ~inside):
+            s = self.first_day + datetime.timedelta(days=int(a[j])); e = self.first_day + datetime.timedelta(days=int(b[j]) - 1)
+            lodging[j], mie[j], _ = self.totals(keys[j], s, e)
+        return lodging, mie, days
+
+    @classmethod
+    def from_gsa_master(cls, cols, **kw):
+        """GSA destinations from the 'gsa_master' snapshot table: season rows per ID, blank seasons = all year."""
+        tables = {}
+        for dest, begin, end, lodging, mie in zip(cols['id'].tolist(), cols['season_begin'].tolist(), cols['season_end'].tolist(), cols['lodging'].tolist(), cols['mie'].tolist()):
+            t = tables.setdefault(dest, np.full((2, 367), -1, dtype=np.int32))
+            try: b, e = _gsa_season_day(begin), _gsa_season_day(end)
+            except ValueError: b, e = 1, 366
+            spans = [(b, e)] if b <= e else [(b, 366), (1, e)]   # Wraps the year end
+            for lo, hi in spans: t[0, lo:hi + 1] = lodging; t[1, lo:hi + 1] = mie
+        keys = list(tables)
+        return cls(keys, [_fill_gaps(tables[k][0]) for k in keys], [_fill_gaps(tables[k][1]) for k in keys], **kw)
+
+    @classmethod
+    def from_intl(cls, intl, **kw):
+        """State Dept locations from an IntlIndex, with the same season / fallback rules as IntlIndex.rate()."""
+        keys = list(intl.seasons); lodging = np.zeros((len(keys), 367), dtype=np.int32); mie = np.zeros_like(lodging)
+        for i, key in enumerate(keys):
+            starts, ends, recs, fallback = intl.seasons[key]
+            lodging[i, :] = round(fallback['lodging']); mie[i, :] = round(fallback['mie'])
+            for j, (lo, hi, rec) in enumerate(zip(starts, ends, recs)):
+                hi = min(hi, starts[j + 1] - 1) if j + 1 < len(starts) else hi   # bisect picks the last season starting on/before a day
+                lodging[i, lo:hi + 1] = round(rec['lodging']); mie[i, lo:hi + 1] = round(rec['mie'])
+        return cls(keys, lodging, mie, **kw)
+
+class _TrieNode:
+    __slots__ = ('children', 'ids')
+    def __init__(self):
+        self.children = {}; self.ids = []
+
+class IntlIndex:
+    """
+    In-memory State Dept per diem index.
+    - Country search: a trie over every suffix of each lower-cased country
+      name, so walking the query gives the same matches as a case-insensitive
+      'contains' in O(len(query)).
+    - Rates: per (country, location) table of non-wrapping season intervals
+      (day-of-year), searched with bisect for a travel date.
+    """
+
+    def __init__(self, rows):
+        self.countries = []          # display names, file order
+        self.locations = {}          # country -> [location, ...] in file order
+        self.seasons = {}            # (country, location) -> (starts, ends, recs)
+        self.root = _TrieNode()
+        raw = {}
+        for row in rows:
+            country = (row.get('Country') or '').strip(); loc = (row.get('Location') or '').strip()
+            if not country: continue
+            if country not in self.locations: self.countries.append(country); self.locations[country] = []
+            if loc not in self.locations[country]: self.locations[country].append(loc)
+            raw.setdefault((country, loc), []).append(row)
+
+        for key, recs in raw.items():
+            spans = []
+            for row in recs:
+                rec = _intl_rec(row, key)
+                try: start, end = _season_day(row['Season Start Date']), _season_day(row['Season End Date'])
+                except (KeyError, ValueError): start, end = 1, 366
+                if start <= end: spans.append((start, end, rec))
+                else: spans += [(start, 366, rec), (1, end, rec)]  # Wraps the year end (e.g. 15-Dec to 15-Apr)
+            spans.sort(key=lambda x: x[0])
+            # The first file row is kept as the answer for dates no season covers (legacy behaviour).
+            self.seasons[key] = ([x[0] for x in spans], [x[1] for x in spans], [x[2] for x in spans], _intl_rec(recs[0], key))
+
+        for cid, country in enumerate(self.countries):
+            name = country.lower()
+            for i in range(len(name)):
+                node = self.root
+                for ch in name[i:]:
+                    node = node.children.setdefault(ch, _TrieNode())
+                    if not node.ids or node.ids[-1] != cid: node.ids.append(cid)
+
+    @classmethod
+    def from_table(cls, cols):
+        """Builds the index from the 'state_dept' snapshot table (see ingest.compile_state_dept)."""
+        keys = [('Country', 'country'), ('Location', 'location'), ('Season Start Date', 'season_start'), ('Season End Date', 'season_end'), ('Lodging', 'lodging'), ('Meals & Incidentals', 'mie')]
+        arrays = [(k, cols[c].tolist()) for k, c in keys]
+        return cls({k: v[i] for k, v in arrays} for i in range(len(cols['country'])))
+
+    def options(self, country_search):
+        """[{'Country', 'Location'}, ...] for every country containing the search text."""
+        node = self.root
+        for ch in str(country_search).lower():
+            node = node.children.get(ch)
+            if node is None: return []
+        node_ids = range(len(self.countries)) if node is self.root else node.ids
+        return [{'Country': self.countries[cid], 'Location': loc} for cid in node_ids for loc in self.locations[self.countries[cid]]]
+
+    def rate(self, country, city, travel_date=None):
+        """Season-correct {'lodging', 'mie', 'city', 'country'} for a travel date (default today)."""
+        entry = self.seasons.get((country, city))
+        if entry is None: return None
+        starts, ends, recs, fallback = entry
+        d = travel_date or datetime.date.today()
+        doy = datetime.date(2000, d.month, d.day).timetuple().tm_yday
+        i = bisect.bisect_right(starts, doy) - 1
+        if i >= 0 and doy <= ends[i]: return dict(recs[i])
+        return dict(fallback)
@@ -0,0 +1,183 @@
+# src/requote.py
+# ======================================================
+# AFP ESTIMATOR - BATCH RE-QUOTE MODULE
+# Version: v3.0
+# Updated: 2026-10-17
+# Description: Re-prices an archive of saved quotes (*_DATA.json) against
+#              the current rate tables. Files are streamed through a process
+#              pool; each worker maps the compiled snapshot (ingest.py) and
+#              builds its rate indexes once, then reuses one QuoteEngine for
+#              every quote it receives. Writes a summary CSV of old vs new
+#              totals with per-category deltas, plus optional PDFs and
+#              audit records. Does NOT need Streamlit (except for --pdf-dir).
+#
+# Usage:       python requote.py QUOTE_DIR [--out requote_summary.csv]
+#                  [--workers N] [--recursive] [--keep-rates]
+#                  [--pdf-dir DIR] [--audit-dir DIR]
+# ======================================================
+
+import os
+import sys
+import csv
+import json
+import fnmatch
+import argparse
+import datetime
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait, as_completed
+
+import ingest
+import rate_index
+from quote_engine import QuoteInputs, QuoteEngine, LINE_CATEGORIES, missing_pricing_fields
+
+SUMMARY_COLUMNS = ["file", "project", "status", "region", "rate_source", "old_lodging", "new_lodging", "old_mie", "new_mie",
+                   "old_total", "new_total", "delta"] + [f"delta_{c.lower().replace(' ', '_')}" for c in LINE_CATEGORIES] + ["error"]
+
+_W = {}  # Per-worker state, filled once by _init_worker
+
+def _init_worker(index_dir, source_dirs, opts):
+    snap = ingest.Snapshot(index_dir, ingest.read_manifest(index_dir))
+    _W['zip'] = rate_index.ZipIndex.from_table(snap.table("gsa_zip")) if snap.has("gsa_zip") else None
+    _W['intl'] = rate_index.IntlIndex.from_table(snap.table("state_dept")) if snap.has("state_dept") else None
+    _W['gsa_cal'] = rate_index.RateCalendar.from_gsa_master(snap.table("gsa_master")) if snap.has("gsa_master") else None
+    _W['intl_cal'] = rate_index.RateCalendar.from_intl(_W['intl']) if _W['intl'] is not None else None
+    hol = ingest.find_source(source_dirs, ["holidays.csv"])
+    _W['engine'] = QuoteEngine(ingest.load_holidays(hol) if hol else None)
+    _W['opts'] = opts
+
+def current_rates(q):
+    """
+    (source, {'lodging', 'mie', ...}) from today's tables for the quote's site, or (None, None).
+    Quotes with a trip window (mobilization..return) get the average daily rate over it, like the app.
+    """
+    when = q.start_date or q.mob_date or datetime.date.today()
+    def trip_average(res, calendar, key):
+        trip = q.mob_date and q.return_date and q.return_date > q.mob_date
+        avg = calendar.average(key, q.mob_date, q.return_date) if res and calendar is not None and trip else None
+        if avg: res.update(avg)
+        return res
+    if q.region == "DOMESTIC":
+        if _W['zip'] is None or not q.zip_code: return None, None
+        res = trip_average(_W['zip'].lookup(q.zip_code, when.month), _W['gsa_cal'], _W['zip'].destination(q.zip_code))
+        return ("GSA", res) if res else (None, None)
+    intl = _W['intl']
+    if intl is None or not q.city: return None, None
+    country = q.loc_rates.get('country')
+    if not country:  # Older saves only hold the country search text; resolve it the way the app's city picker does
+        country = next((o['Country'] for o in intl.options(q.country) if o['Location'] == q.city), None) if q.country else None
+    res = trip_average(intl.rate(country, q.city, when), _W['intl_cal'], (country, q.city)) if country else None
+    return ("State", res) if res else (None, None)
+
+def _requote(path):
+    """
+    Re-prices one saved quote. Returns a summary row; failures, and files saved without
+    the rates and parts they were priced from, are reported in the 'error' column.
+    """
+    row = dict.fromkeys(SUMMARY_COLUMNS, ""); row['file'] = os.path.basename(path)
+    try:
+        with open(path, "r", encoding="utf-8") as f: saved = json.load(f)
+        old_q = QuoteInputs.from_dict(saved)
+        row.update(project=old_q.proj_name, status=old_q.status, region=old_q.region)
+        missing = missing_pricing_fields(saved)
+        if missing:   # Defaults would stand in for the quoted rates: no honest old (or new) total
+            row['region'] = saved.get('region', ""); row['error'] = f"Not re-priceable: saved without {', '.join(missing)}"
+            return row
+        engine, opts = _W['engine'], _W['opts']
+
+        quoted = saved.get('result')
+        if not quoted:  # Saved before results were embedded: re-run with the rates stored in the file
+            quoted = engine.compute(old_q).summary()
+
+        new_q = QuoteInputs.from_dict(saved); source = "saved"
+        if not opts['keep_rates'] and not new_q.is_parts_only:
+            src, res = current_rates(new_q)
+            if res: source = src; new_q.loc_rates = res
+        new = engine.compute(new_q)
+
+        old_cats = quoted.get('categories', {}); new_cats = new.category_totals()
+        row.update(rate_source=source, old_lodging=old_q.loc_rates.get('lodging'), new_lodging=new_q.loc_rates.get('lodging'),
+                   old_mie=old_q.loc_rates.get('mie'), new_mie=new_q.loc_rates.get('mie'),
+                   old_total=round(quoted['totals']['Grand'], 2), new_total=round(new.totals['Grand'], 2))
+        row['delta'] = round(row['new_total'] - row['old_total'], 2)
+        for c in LINE_CATEGORIES: row[f"delta_{c.lower().replace(' ', '_')}"] = round(new_cats.get(c, 0.0) - old_cats.get(c, 0.0), 2)
+
+        stem = os.path.splitext(row['file'])[0]
+        if stem.endswith("_DATA"): stem = stem[:-5]
+        if opts['audit_dir']:
+            with open(os.path.join(opts['audit_dir'], f"{stem}_RECORD.txt"), "w", encoding="utf-8") as f: f.write(new.audit_text(new_q))
+        if opts['pdf_dir']:
+            import pdf_gen  # Imported on demand: pulls in fpdf and the Streamlit data module
+            svc = not new_q.is_parts_only
+            pdf_bytes = pdf_gen.generate_pdf(new.proj_data, new.svc_lines, new.part_lines, new_q.client, new.totals, new_q.is_parts_only,
+                                             new.rates if svc else None, new_q.exp_markup if svc else None)
+            with open(os.path.join(opts['pdf_dir'], f"{stem}.pdf"), "wb") as f: f.write(pdf_bytes)
+    except Exception as e:
+        row['error'] = f"{type(e).__name__}: {e}"
+    return row
+
+def iter_quote_files(folder, pattern="*_DATA.json", recursive=False):
+    """Yields matching paths lazily so very large archives are never listed in full."""
+    if recursive:
+        for root, _, files in os.walk(folder):
+            for name in sorted(files):
+                if fnmatch.fnmatch(name, pattern): yield os.path.join(root, name)
+        return
+    with os.scandir(folder) as it:
+        for entry in it:
+            if entry.is_file() and fnmatch.fnmatch(entry.name, pattern): yield entry.path
+
+def run(paths, index_dir, source_dirs, opts, workers=None):
+    """
+    Re-prices every path and yields summary rows in completion order.
+    At most workers * 4 quotes are in flight, so memory stays flat however
+    many files the archive holds. workers=1 runs in-process (no pool).
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        _init_worker(index_dir, source_dirs, opts)
+        for p in paths: yield _requote(p)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(index_dir, source_dirs, opts)) as pool:
+        yield from bounded_map(pool, _requote, paths, workers * 4)
+
+def bounded_map(pool, fn, items, window):
+    """Like pool.map, but unordered and with at most `window` tasks submitted at once."""
+    pending = set()
+    for item in items:
+        pending.add(pool.submit(fn, item))
+        if len(pending) >= window:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done: yield fut.result()
+    for fut in as_completed(pending): yield fut.result()
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Re-price saved quote JSON files against the current rate tables.")
+    ap.add_argument("quote_dir", help="Folder of saved quotes")
+    ap.add_argument("--pattern", default="*_DATA.json", help="File name pattern (default: *_DATA.json)")
+    ap.add_argument("--recursive", action="store_true", help="Include sub-folders")
+    ap.add_argument("--out", help="Summary CSV (default: <quote_dir>/requote_summary.csv)")
+    ap.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    ap.add_argument("--keep-rates", action="store_true", help="Keep the saved lodging/M&IE rates (re-run the math only)")
+    ap.add_argument("--pdf-dir", help="Also write a re-priced PDF per quote here")
+    ap.add_argument("--audit-dir", help="Also write a re-priced audit record per quote here")
+    ap.add_argument("--data-dir", action="append", help="Source folder (repeatable). Defaults to the Shared_Data folders next to this script.")
+    args = ap.parse_args()
+
+    source_dirs = args.data_dir or ingest.default_source_dirs()
+    index_dir = os.path.join(source_dirs[0], ingest.SNAPSHOT_DIR_NAME)
+    ingest.refresh(source_dirs, index_dir)  # Compile once here so workers only map the arrays
+    for d in (args.pdf_dir, args.audit_dir):
+        if d: os.makedirs(d, exist_ok=True)
+    opts = {'keep_rates': args.keep_rates, 'pdf_dir': args.pdf_dir, 'audit_dir': args.audit_dir}
+    out_path = args.out or os.path.join(args.quote_dir, "requote_summary.csv")
+
+    n = errors = 0; old_sum = new_sum = 0.0
+    with open(out_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_COLUMNS); writer.writeheader()
+        files = iter_quote_files(args.quote_dir, args.pattern, args.recursive)
+        for row in run(files, index_dir, source_dirs, opts, args.workers):
+            writer.writerow(row); n += 1
+            if row['error']: errors += 1
+            else: old_sum += row['old_total']; new_sum += row['new_total']
+            if n % 100 == 0: print(f"  {n} quotes...", file=sys.stderr)
+    print(f"Re-quoted {n} files ({errors} errors): ${old_sum:,.2f} -> ${new_sum:,.2f} (delta ${new_sum - old_sum:,.2f})")
+    print(f"Summary -> {out_path}")
@@ -0,0 +1,173 @@
+# src/result_cache.py
+# ======================================================
+# AFP ESTIMATOR - RESULT CACHE MODULE
+# Version: v3.0
+# Updated: 2026-10-17
+# Description: Content-addressed cache of finished quotes (totals, lines,
+#              audit text, saved JSON and PDF bytes). The key is a hash of
+#              the canonical input record plus everything else the output
+#              is drawn from: the rate-source versions for the quote's
+#              region, the holiday calendar and today's date (printed on
+#              the audit and PDF). A rate-file update changes the key, so
+#              stale entries are never returned; they age out. Entries live
+#              in a size-bounded in-memory LRU and, optionally, a disk
+#              folder shared by every session and worker process.
+#
+# Usage:       python result_cache.py [DIR] [--clear]   -> entries / size
+# ======================================================
+
+import os
+import sys
+import json
+import time
+import hashlib
+import datetime
+import threading
+from collections import OrderedDict
+
+RESULTS_DIR_NAME = "_results"
+CACHE_SCHEMA = 1            # Bump when the cached record layout or the quote math changes
+MEMORY_BYTES = 64 << 20
+DISK_BYTES = 512 << 20
+DISK_PRUNE_EVERY = 50       # Disk puts between size checks
+
+def quote_key(inputs, rate_version="", holidays=(), day=None):
+    """
+    sha256 over the canonical inputs (QuoteInputs.to_dict(), keys sorted),
+    the rate-data version, the holiday calendar and the day.
+    """
+    blob = json.dumps({"schema": CACHE_SCHEMA, "inputs": inputs, "rates": rate_version, "holidays": sorted(str(d) for d in holidays),
+                       "day": str(day or datetime.date.today())}, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode("utf-8", "surrogatepass")).hexdigest()
+
+def _size(entry):
+    return len(entry.get("audit", "")) + len(entry.get("json", "")) + len(entry.get("pdf") or b"") + 1024
+
+class ResultCache:
+    """
+    get(key) -> entry dict or None     put(key, entry)     attach_pdf(key, pdf_bytes)
+    entry: {'totals', 'lines', 'audit', 'json', 'pdf' (bytes or None)} plus any other JSON-able fields.
+    """
+
+    def __init__(self, disk_dir=None, memory_bytes=MEMORY_BYTES, disk_bytes=DISK_BYTES):
+        self.disk_dir = disk_dir; self.memory_bytes = memory_bytes; self.disk_bytes = disk_bytes
+        self._mem = OrderedDict(); self._used = 0; self._puts = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0}
+        if disk_dir:
+            try: os.makedirs(disk_dir, exist_ok=True)
+            except OSError: self.disk_dir = None
+
+    # --- memory tier ---
+
+    def _remember(self, key, entry):
+        with self._lock:
+            old = self._mem.pop(key, None)
+            if old is not None: self._used -= _size(old)
+            self._mem[key] = entry; self._used += _size(entry)
+            while self._used > self.memory_bytes and len(self._mem) > 1:
+                _, ev = self._mem.popitem(last=False); self._used -= _size(ev)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None:
+                self._mem.move_to_end(key); self.stats["hits"] += 1
+                return entry
+        entry = self._disk_get(key)
+        with self._lock: self.stats["disk_hits" if entry is not None else "misses"] += 1
+        if entry is not None: self._remember(key, entry)
+        return entry
+
+    def put(self, key, entry):
+        self._remember(key, entry); self._disk_put(key, entry)
+
+    def attach_pdf(self, key, pdf_bytes):
+        """Adds the rendered PDF to an existing entry (no-op if it was evicted)."""
+        with self._lock: entry = self._mem.get(key)
+        if entry is None: entry = self._disk_get(key)
+        if entry is None or entry.get("pdf") == pdf_bytes: return
+        self.put(key, dict(entry, pdf=pdf_bytes))
+
+    def __len__(self):
+        return len(self._mem)
+
+    @property
+    def used_bytes(self):
+        """Approximate size of the in-memory tier."""
+        return self._used
+
+    # --- disk tier (one '<key>.json' + optional '<key>.pdf'; written atomically, newest mtime = most recently used) ---
+
+    def _paths(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json"), os.path.join(self.disk_dir, f"{key}.pdf")
+
+    def _disk_get(self, key):
+        if not self.disk_dir: return None
+        jpath, ppath = self._paths(key)
+        try:
+            with open(jpath, "r", encoding="utf-8") as f: entry = json.load(f)
+            entry["pdf"] = None
+            if os.path.exists(ppath):
+                with open(ppath, "rb") as f: entry["pdf"] = f.read()
+            now = time.time(); os.utime(jpath, (now, now))
+            return entry
+        except (OSError, ValueError): return None
+
+    def _disk_put(self, key, entry):
+        if not self.disk_dir: return
+        jpath, ppath = self._paths(key); tmp = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            if entry.get("pdf"):
+                with open(ppath + tmp, "wb") as f: f.write(entry["pdf"])
+                os.replace(ppath + tmp, ppath)
+            with open(jpath + tmp, "w", encoding="utf-8") as f: json.dump({k: v for k, v in entry.items() if k != "pdf"}, f, default=str)
+            os.replace(jpath + tmp, jpath)   # Written last: readers never see a record without its PDF
+        except OSError: return
+        self._puts += 1
+        if self._puts % DISK_PRUNE_EVERY == 0: self.prune()
+
+    def disk_usage(self):
+        """(entries, bytes) in the disk folder."""
+        if not self.disk_dir or not os.path.isdir(self.disk_dir): return 0, 0
+        files = [e for e in os.scandir(self.disk_dir) if e.is_file()]
+        return sum(e.name.endswith(".json") for e in files), sum(e.stat().st_size for e in files)
+
+    def prune(self):
+        """Drops least recently used disk entries until the folder fits disk_bytes. Returns entries removed."""
+        if not self.disk_dir: return 0
+        groups = {}
+        for e in os.scandir(self.disk_dir):
+            if not e.is_file(): continue
+            key, _, ext = e.name.partition(".")
+            st_ = e.stat(); g = groups.setdefault(key, [0.0, 0, []])
+            g[1] += st_.st_size; g[2].append(e.path)
+            if ext == "json": g[0] = st_.st_mtime
+        total = sum(g[1] for g in groups.values()); removed = 0
+        for key, (mtime, size, paths) in sorted(groups.items(), key=lambda kv: kv[1][0]):
+            if total <= self.disk_bytes: break
+            for p in paths:
+                try: os.remove(p)
+                except OSError: pass
+            total -= size; removed += 1
+        return removed
+
+    def clear(self):
+        with self._lock: self._mem.clear(); self._used = 0
+        if self.disk_dir and os.path.isdir(self.disk_dir):
+            for e in os.scandir(self.disk_dir):
+                try: os.remove(e.path)
+                except OSError: pass
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if args: folder = args[0]
+    else:
+        import ingest
+        dirs = ingest.default_source_dirs()
+        if not dirs: sys.exit("No Shared_Data folder found; pass the cache folder")
+        folder = os.path.join(dirs[0], RESULTS_DIR_NAME)
+    cache = ResultCache(folder)
+    if "--clear" in sys.argv: cache.clear()
+    n, size = cache.disk_usage()
+    print(f"{folder}: {n} cached quotes, {size / 1e6:.2f} MB")
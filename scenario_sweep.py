@@ -0,0 +1,153 @@
+# src/scenario_sweep.py
+# ======================================================
+# AFP ESTIMATOR - SCENARIO SWEEP MODULE
+# Version: v3.0
+# Updated: 2026-10-17
+# Description: What-if sweep over crew size, hours/day, work days and
+#              weekend authorisation. Every configuration is priced in one
+#              batched NumPy pass using the same rules as QuoteEngine
+#              (schedule buckets, travel, MBV, lodging rooms, subsistence,
+#              contingency) and returned ranked by total. Additional crews
+#              (QuoteInputs.phases) are held fixed and added to every
+#              configuration of the main crew. With a daily
+#              rate calendar, lodging / M&IE follow each configuration's own
+#              trip dates (seasonal rates), read from prefix sums in one pass.
+# ======================================================
+
+import numpy as np
+
+import logic
+from quote_engine import QuoteEngine, crew_arrays, _num
+
+WEEKEND_OPTIONS = {"Mon-Fri": (False, False), "Mon-Sat": (True, False), "Mon-Fri + Sun": (False, True), "7 Days": (True, True)}
+
+def _smart_round(x):
+    return np.ceil(x / 10.0) * 10.0
+
+class _Calendar:
+    """
+    Worked-day layout of the first max_days working days from start_date for
+    one (sat, sun) setting, as prefix arrays indexed by N = number of work
+    days (0..max_days). Mirrors logic.schedule_profile / schedule_buckets.
+    """
+
+    def __init__(self, start_date, max_days, sat, sun, holidays):
+        start_wd = start_date.weekday(); hol = sorted(h for h in holidays if h >= start_date)
+        span = max_days * 7 // 5 + 7 + len(hol)
+        while True:
+            offs = np.arange(span); dow = (start_wd + offs) % 7
+            works = (dow < 5) | ((dow == 5) & bool(sat)) | ((dow == 6) & bool(sun))
+            if hol:
+                h_off = np.array([(h - start_date).days for h in hol]); h_off = h_off[h_off < span]
+                works[h_off] = False
+            worked = np.flatnonzero(works)
+            if len(worked) >= max_days: break
+            span *= 2
+        worked = worked[:max_days]; dow = (start_wd + worked) % 7
+        is_wd = dow < 5
+        z = np.zeros(1)
+        self.cal_days = np.concatenate([z, worked + 1.0])
+        self.n_wd = np.concatenate([z, np.cumsum(is_wd)]); self.n_sat = np.concatenate([z, np.cumsum(dow == 5)]); self.n_sun = np.concatenate([z, np.cumsum(dow == 6)])
+
+        # Mon-Sun weeks: weekday count per completed week as a running histogram (w = 0..5),
+        # plus the weekday count of the (partial) week holding the N-th work day.
+        week = (start_wd + worked) // 7
+        n_weeks = int(week[-1]) + 1 if max_days else 0
+        per_week = np.bincount(week, weights=is_wd, minlength=n_weeks).astype(int)
+        onehot = np.zeros((n_weeks + 1, 6)); onehot[np.arange(1, n_weeks + 1), per_week] = 1
+        self.hist = np.cumsum(onehot, axis=0)                       # hist[k] = weeks 0..k-1
+        self.week_of = np.concatenate([[0], week])
+        first = np.searchsorted(week, np.arange(n_weeks))           # first work day of each week
+        start_wd_count = self.n_wd[first] if n_weeks else np.zeros(0)
+        self.partial = np.concatenate([z, self.n_wd[1:] - start_wd_count[week]])
+
+    def buckets(self, days, hrs, cap, is_key_account):
+        """RT/OT/DT hours per tech for arrays of work days and hours/day."""
+        rt_pot = np.minimum(10.0, hrs); cap = max(0.0, cap)
+        n_wd = self.n_wd[days]
+        if is_key_account: rt = np.minimum(cap, n_wd * rt_pot)
+        else:
+            w_rt = np.minimum(cap, np.arange(6)[None, :] * rt_pot[:, None])
+            rt = (self.hist[self.week_of[days]] * w_rt).sum(axis=1) + np.where(days > 0, np.minimum(cap, self.partial[days] * rt_pot), 0.0)
+        ot = n_wd * hrs - rt + self.n_sat[days] * hrs
+        dt = self.n_sun[days] * hrs
+        return rt, ot, dt
+
+def sweep(q, tfas_range, hrs_options, days_range, weekend_options=None, effort_hours=None, holidays=None, limit=None, trip_rates=None):
+    """
+    Prices every (tfas, hrs/day, work days, weekend) combination for quote inputs q.
+    effort_hours: onsite tech-hours the job needs (default q.tfas * q.days * q.hrs);
+                  combinations with tfas * hrs * days below it are dropped.
+    trip_rates:   (rate_index.RateCalendar, key): lodging / M&IE are averaged over each
+                  combination's trip (mobilization + trip days) instead of q.loc_rates.
+    Returns a dict of equal-length NumPy arrays sorted by total (then calendar days).
+    """
+    holidays = holidays or frozenset()
+    weekend_options = weekend_options or list(WEEKEND_OPTIONS)
+    if effort_hours is None: effort_hours = q.tfas * q.days * q.hrs
+    start = q.onsite_start
+    lead = (start - q.mob_date).days if q.mob_date else 0
+
+    t, h, d, w = np.meshgrid(np.asarray(list(tfas_range), dtype=float), np.asarray(list(hrs_options), dtype=float),
+                             np.asarray(list(days_range), dtype=int), np.arange(len(weekend_options)), indexing='ij')
+    t, h, d, w = t.ravel(), h.ravel(), d.ravel(), w.ravel()
+    keep = (t > 0) & (h > 0) & (d > 0) & (t * h * d >= effort_hours)
+    t, h, d, w = t[keep], h[keep], d[keep], w[keep]
+
+    rt = np.zeros(len(t)); ot = np.zeros(len(t)); dt = np.zeros(len(t)); cal = np.zeros(len(t))
+    max_days = int(d.max()) if len(d) else 0
+    for i, name in enumerate(weekend_options):
+        m = w == i
+        if not m.any(): continue
+        sat, sun = WEEKEND_OPTIONS[name]
+        c = _Calendar(start, max_days, sat, sun, holidays)
+        rt[m], ot[m], dt[m] = c.buckets(d[m], h[m], q.rt_cap, q.is_key_account)
+        cal[m] = c.cal_days[d[m]]
+
+    # Additional crews: fixed tech-hours / tickets / trips / room-nights / tech-days added to every configuration
+    x = {"tfas": 0.0, "rt": 0.0, "ot": 0.0, "dt": 0.0, "room_nights": 0.0, "tech_days": 0.0}; n_crews = 1
+    if len(q.phases):
+        tab = crew_arrays(QuoteEngine(holidays).schedule(q)); n_crews = len(tab['tfas'])
+        if n_crews > 1:
+            tf = tab['tfas'][1:]
+            x = {"tfas": tf.sum(), "rt": (tab['rt'][1:] * tf).sum(), "ot": (tab['ot'][1:] * tf).sum(), "dt": (tab['dt'][1:] * tf).sum(),
+                 "room_nights": (tab['sub_days'][1:] * tab['rooms'][1:]).sum(), "tech_days": (tab['sub_days'][1:] * tf).sum()}
+
+    # Same line order and arithmetic as QuoteEngine.compute (sums are sequential, like sum()).
+    exp_markup = q.exp_markup; is_commuter = q.is_commuter
+    t_bill_total = (q.man_labor / 2.0 if is_commuter else logic.calculate_travel_billable(q.t_hrs)) * 2.0
+    l_tr = t_bill_total * (t + x['tfas']) * q.rate_tr
+    l_rt = (rt * t + x['rt']) * q.rate_rt; l_ot = (ot * t + x['ot']) * q.rate_ot; l_dt = (dt * t + x['dt']) * q.rate_dt
+    labor = l_tr + l_rt + l_ot + l_dt
+    mbv = np.zeros(len(t)) if q.disable_mbv else np.maximum(0.0, logic.mbv_target(q.region, q.rate_rt) - labor)
+
+    airfare = logic.smart_round(q.flight_cost * exp_markup) * (t + x['tfas']) if q.flight_cost else np.zeros(len(t))
+    mileage = logic.smart_round(q.miles * 1.10) * n_crews if (q.mode == "DRIVE" or q.mode == "FLY then DRIVE") and q.miles > 0 else 0.0
+    misc = logic.smart_round(q.misc_exp * exp_markup) if q.misc_exp else 0.0
+    final_days = np.full(len(t), float(q.man_sub_days)) if q.override_sub else lead + cal + 1.0
+    rooms = np.ceil(t / 2)
+    if trip_rates and not q.override_sub and len(t):
+        calendar, key = trip_rates; mob = np.datetime64(q.mob_date or start, 'D')
+        l_sum, m_sum, n = calendar.totals_batch([key] * len(t), np.full(len(t), mob), mob + final_days.astype(int) - 1)
+        avg_l = np.where(n > 0, np.round(l_sum / np.maximum(n, 1), 2), q.loc_rates['lodging']); avg_m = np.where(n > 0, np.round(m_sum / np.maximum(n, 1), 2), q.loc_rates['mie'])
+        lodg_rate = 0.0 if is_commuter else _smart_round(avg_l * 1.2 * exp_markup)
+        mie_rate = _smart_round(avg_m * (0.5 if is_commuter else 1.0) * exp_markup)
+    else:
+        lodg_rate = 0.0 if is_commuter else logic.smart_round(q.loc_rates['lodging'] * 1.2 * exp_markup)
+        mie_rate = logic.smart_round(q.loc_rates['mie'] * (0.5 if is_commuter else 1.0) * exp_markup)
+    lodging = lodg_rate * (final_days * rooms + x['room_nights']); subsistence = mie_rate * (final_days * t + x['tech_days'])
+
+    svc = l_tr + l_rt + l_ot + l_dt + mbv + airfare + mileage + misc + lodging + subsistence
+    qtys = [_num(p.get('Qty')) for p in q.parts_list]        # Parts: priced as QuoteEngine._part_lines (rows with qty > 0)
+    priced = logic.price_parts_batch([_num(p.get('Cost')) for p in q.parts_list], qtys, q.tier)
+    parts = sum(float(tot) for tot, n in zip(priced['total'], qtys) if n > 0)
+    cont_pct = q.cont_pct / 100.0
+    cont = _smart_round((svc + parts) * cont_pct) if cont_pct > 0 else np.zeros(len(t))
+    total = svc + cont + parts
+
+    order = np.lexsort((cal, total))
+    if limit: order = order[:limit]
+    out = {"tfas": t, "hrs": h, "days": d, "weekend": np.asarray(weekend_options, dtype=object)[w] if len(w) else np.array([], dtype=object),
+           "calendar_days": cal, "trip_days": final_days, "rt": rt, "ot": ot, "dt": dt, "labor": labor, "mbv": mbv,
+           "lodging": lodging, "subsistence": subsistence, "contingency": cont, "total": total}
+    return {k: v[order] for k, v in out.items()}
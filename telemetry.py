@@ -0,0 +1,174 @@
+# src/telemetry.py
+# ======================================================
+# AFP ESTIMATOR - TELEMETRY MODULE
+# Version: v3.0
+# Updated: 2026-10-17
+# Description: Lightweight spans and timers for the quote pipeline and the
+#              data loaders. A trace (one app rerun, one CLI job) collects
+#              wall time per stage, call counts and cache hit/miss counts,
+#              and is appended as one JSON line to a local log. Recording is
+#              per thread and only while a trace is open, so with
+#              diagnostics off every span is a single attribute check.
+#
+# Usage:       AFP_TELEMETRY=1 streamlit run app.py   (or the sidebar toggle)
+#              python telemetry.py [logs/telemetry.jsonl]   -> per-stage summary
+# ======================================================
+
+import os
+import sys
+import json
+import time
+import datetime
+import functools
+import threading
+
+ENABLED = os.environ.get("AFP_TELEMETRY", "").lower() in ("1", "true", "yes", "on")
+LOG_PATH = os.environ.get("AFP_TELEMETRY_LOG") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "telemetry.jsonl")
+MAX_SPANS = 2000            # Per trace; per-name stats keep counting past this
+
+class _Local(threading.local):
+    trace = None            # Class default: a missing-attribute lookup would cost an exception per span
+
+_local = _Local()
+_write_lock = threading.Lock()
+_cached = set()             # Names registered with timed(cached=True)
+
+class Trace:
+    """Spans and per-name stats of one traced run."""
+
+    def __init__(self, name):
+        self.name = name; self.t0 = time.perf_counter(); self.depth = 0
+        self.spans = []          # (name, depth, start_ms, ms)
+        self.stats = {}          # name -> [calls, seconds, misses]
+
+    def add(self, name, start, seconds, depth):
+        s = self.stats.get(name)
+        if s is None: self.stats[name] = [1, seconds, 0]
+        else: s[0] += 1; s[1] += seconds
+        if len(self.spans) < MAX_SPANS: self.spans.append((name, depth, (start - self.t0) * 1e3, seconds * 1e3))
+
+    def miss(self, name):
+        s = self.stats.get(name)
+        if s is None: self.stats[name] = [0, 0.0, 1]
+        else: s[2] += 1
+
+    def record(self, **meta):
+        stats = {}
+        for name, (calls, secs, misses) in sorted(self.stats.items(), key=lambda kv: -kv[1][1]):
+            row = {"calls": calls, "ms": round(secs * 1e3, 3)}
+            if name in _cached: row.update(hits=max(0, calls - misses), misses=misses)
+            stats[name] = row
+        return {"ts": datetime.datetime.now().isoformat(timespec="milliseconds"), "trace": self.name,
+                "ms": round((time.perf_counter() - self.t0) * 1e3, 3), **meta,
+                "stages": [{"name": n, "depth": d, "start_ms": round(s, 3), "ms": round(ms, 3)} for n, d, s, ms in self.spans],
+                "stats": stats}
+
+class _Span:
+    __slots__ = ("trace", "name", "t0")
+
+    def __init__(self, trace, name):
+        self.trace = trace; self.name = name
+
+    def __enter__(self):
+        self.trace.depth += 1; self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        t = self.trace; t.depth -= 1
+        t.add(self.name, self.t0, time.perf_counter() - self.t0, t.depth)
+        return False
+
+class _NoSpan:
+    __slots__ = ()
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+_NO_SPAN = _NoSpan()
+
+def current():
+    return _local.trace
+
+def span(name):
+    """with telemetry.span("stage"): ...  -- timed when a trace is open in this thread, else a no-op."""
+    t = _local.trace
+    return _NO_SPAN if t is None else _Span(t, name)
+
+def timed(name=None, cached=False):
+    """
+    Decorator form of span(). cached=True marks a cache getter: every call
+    counts as a hit unless the cached body reports miss(name).
+    """
+    def deco(fn):
+        label = name or f"{fn.__module__}.{fn.__qualname__}"
+        if cached: _cached.add(label)
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            t = _local.trace
+            if t is None: return fn(*args, **kwargs)
+            with _Span(t, label): return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+def miss(name):
+    """Reports a cache miss for `name` (call from inside the cached function body)."""
+    t = _local.trace
+    if t is not None: t.miss(name)
+
+def begin(name, enabled=None):
+    """Opens a trace for this thread (replacing any unfinished one). Returns it, or None when disabled."""
+    _local.trace = Trace(name) if (ENABLED if enabled is None else enabled) else None
+    return _local.trace
+
+def finish(log_path=None, **meta):
+    """Closes this thread's trace and appends its record to the log. Returns the record (None if no trace)."""
+    t = _local.trace
+    if t is None: return None
+    _local.trace = None
+    rec = t.record(**meta)
+    path = log_path or LOG_PATH
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        line = json.dumps(rec, default=str) + "\n"
+        with _write_lock, open(path, "a", encoding="utf-8") as f: f.write(line)
+    except OSError as e: rec["log_error"] = str(e)
+    return rec
+
+class trace:
+    """with telemetry.trace("requote", enabled=True): ...  -- begin()/finish() as a context manager."""
+
+    def __init__(self, name, enabled=None, log_path=None, **meta):
+        self.name = name; self.enabled = enabled; self.log_path = log_path; self.meta = meta; self.record = None
+
+    def __enter__(self):
+        begin(self.name, self.enabled)
+        return self
+
+    def __exit__(self, *exc):
+        self.record = finish(self.log_path, **self.meta)
+        return False
+
+def summarize(path):
+    """Aggregates a telemetry log: {name: {'calls', 'traces', 'mean_ms', 'p95_ms', 'hits', 'misses'}} over per-trace totals."""
+    per = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try: rec = json.loads(line)
+            except ValueError: continue
+            for name, s in rec.get("stats", {}).items():
+                p = per.setdefault(name, {"calls": 0, "ms": [], "hits": 0, "misses": 0})
+                p["calls"] += s.get("calls", 0); p["ms"].append(s.get("ms", 0.0))
+                p["hits"] += s.get("hits", 0); p["misses"] += s.get("misses", 0)
+    out = {}
+    for name, p in per.items():
+        ms = sorted(p["ms"])
+        out[name] = {"calls": p["calls"], "traces": len(ms), "mean_ms": sum(ms) / len(ms), "p95_ms": ms[min(len(ms) - 1, int(0.95 * len(ms)))],
+                     "hits": p["hits"], "misses": p["misses"]}
+    return dict(sorted(out.items(), key=lambda kv: -kv[1]["mean_ms"] * kv[1]["traces"]))
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else LOG_PATH
+    if not os.path.exists(path): sys.exit(f"No telemetry log at {path}")
+    print(f"{'stage':<36} {'traces':>7} {'calls':>8} {'mean ms':>10} {'p95 ms':>10} {'hit/miss':>12}")
+    for name, s in summarize(path).items():
+        hm = f"{s['hits']}/{s['misses']}" if s['hits'] or s['misses'] else ""
+        print(f"{name:<36} {s['traces']:>7} {s['calls']:>8} {s['mean_ms']:>10.3f} {s['p95_ms']:>10.3f} {hm:>12}")
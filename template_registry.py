@@ -0,0 +1,108 @@
+# src/template_registry.py
+# ======================================================
+# AFP ESTIMATOR - TEMPLATE REGISTRY MODULE
+# Version: v3.0
+# Updated: 2026-10-17
+# Description: Loads the Terms & Conditions templates (Templates/*.md) once
+#              and re-reads a file only when its mtime/size changes. Each
+#              template's {placeholders} are parsed at load time, so unknown
+#              keys are reported before "Apply", and filling a template is a
+#              join over pre-split literal/field parts.
+# ======================================================
+
+import os
+import time
+import string
+import threading
+
+_FMT = string.Formatter()
+
+class Template:
+    """
+    One parsed template.
+    fields:  placeholder names used by the text
+    missing: fields not in the registry's known context keys
+    error:   read/parse error text ('' when the template is usable)
+    """
+
+    def __init__(self, name, text, known_fields=None, error=""):
+        self.name = name; self.text = text; self.error = error
+        self.parts = []; self.fields = set(); self.simple = True
+        if not error:
+            try: self.parts = list(_FMT.parse(text))
+            except ValueError as e: self.error = f"Invalid template syntax: {e}"
+        for _, field, spec, _ in self.parts:
+            if field is None: continue
+            self.fields.add(field)
+            # Positional, attribute/index and nested-spec fields take the str.format path.
+            if not field.isidentifier() or (spec and '{' in spec): self.simple = False
+        self.missing = sorted(self.fields - set(known_fields)) if known_fields is not None else []
+
+    def fill(self, ctx):
+        """Substitutes ctx into the template. Raises KeyError for a missing placeholder, like str.format."""
+        if self.error: raise ValueError(self.error)
+        if not self.simple: return self.text.format(**ctx)
+        out = []
+        for literal, field, spec, conv in self.parts:
+            out.append(literal)
+            if field is None: continue
+            val = ctx[field]
+            if conv: val = _FMT.convert_field(val, conv)
+            out.append(format(val, spec))
+        return "".join(out)
+
+class TemplateRegistry:
+    """
+    Shared, self-refreshing view of a template folder.
+        reg = TemplateRegistry(path, known_fields); reg.refresh(); reg.get("Terms_Service_Master").fill(ctx)
+    refresh() re-lists the folder at most once per check_interval seconds and
+    re-reads only files whose (mtime, size) changed.
+    """
+
+    def __init__(self, template_dir, known_fields=None, check_interval=2.0):
+        self.template_dir = template_dir
+        self.known_fields = set(known_fields) if known_fields is not None else None
+        self.check_interval = check_interval
+        self.error = ""
+        self._entries = {}       # name -> ((mtime, size), Template)
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._checked < self.check_interval: return self
+        with self._lock:
+            self._checked = now
+            try: listing = [e for e in os.scandir(self.template_dir) if e.is_file() and e.name.endswith(".md")]
+            except OSError:
+                self.error = "Templates folder missing in Shared_Data"; self._entries = {}; return self
+            self.error = ""
+            entries = {}
+            for entry in listing:
+                name = os.path.splitext(entry.name)[0]
+                st = entry.stat(); stamp = (st.st_mtime_ns, st.st_size)
+                old = self._entries.get(name)
+                if old and old[0] == stamp: entries[name] = old; continue
+                try:
+                    with open(entry.path, "r", encoding="utf-8") as f: tmpl = Template(name, f.read(), self.known_fields)
+                except Exception as e: tmpl = Template(name, "", self.known_fields, error=str(e))
+                entries[name] = (stamp, tmpl)
+            self._entries = entries
+        return self
+
+    def names(self):
+        return sorted(self._entries)
+
+    def get(self, name):
+        entry = self._entries.get(name)
+        return entry[1] if entry else None
+
+    def as_dict(self):
+        """{name: text} in the shape of the former data.get_term_templates()."""
+        if self.error: return {"Error": self.error}
+        out = {}
+        for name in self.names():
+            tmpl = self.get(name)
+            if tmpl.error: out[f"Error loading {name}"] = tmpl.error
+            else: out[name] = tmpl.text
+        return out